@@ -0,0 +1,165 @@
+"""Compare two runs of model_benchmark.py stored in a benchmark history, and report the performance regressions.
+
+The history is created by running model_benchmark.py with --history_dir. The configurations (model, datatype, device,
+threads, batch size and input size) that are present in both runs are compared with a statistical test on their
+individual measurements. The differences between the environments of the runs are also reported, since they are often
+the cause of a change of performance.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import argparse
+from pathlib import Path
+import sys
+
+from loguru import logger
+import pandas as pd
+
+from ptlflow.utils.benchmark_history import (
+    BenchmarkHistory,
+    compare_runs,
+    diff_environments,
+)
+
+
+def _init_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--history_dir",
+        type=str,
+        required=True,
+        help="Path to the benchmark history created by model_benchmark.py --history_dir.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default="-2",
+        help="Id of the reference run, or its index in the history (e.g., -2 for the second newest run).",
+    )
+    parser.add_argument(
+        "--candidate",
+        type=str,
+        default="-1",
+        help="Id of the run to be checked, or its index in the history (e.g., -1 for the newest run).",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.01,
+        help="Significance level of the test used to compare the times.",
+    )
+    parser.add_argument(
+        "--min_change",
+        type=float,
+        default=0.05,
+        help="Minimum relative change of the median (e.g., 0.05 = 5%%) to flag a regression or an improvement.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=str(Path("outputs/benchmark")),
+        help="Path to the directory where the comparison table will be saved.",
+    )
+    parser.add_argument(
+        "--list_runs",
+        action="store_true",
+        help="If set, only print the runs stored in the history.",
+    )
+    parser.add_argument(
+        "--fail_on_regression",
+        action="store_true",
+        help="If set, the script exits with code 1 when a regression is found. Useful for continuous integration.",
+    )
+    return parser
+
+
+def compare(args: argparse.Namespace) -> pd.DataFrame:
+    """Compare the two runs selected in args.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments to control the comparison.
+
+    Returns
+    -------
+    pd.DataFrame
+        The comparison table. See ptlflow.utils.benchmark_history.compare_runs().
+    """
+    history = BenchmarkHistory(args.history_dir)
+    baseline_id = history.resolve_run_id(args.baseline)
+    candidate_id = history.resolve_run_id(args.candidate)
+    baseline = history.load_run(baseline_id)
+    candidate = history.load_run(candidate_id)
+    logger.info(
+        "Comparing the run {} against the baseline {}", candidate_id, baseline_id
+    )
+
+    env_diffs = diff_environments(baseline["environment"], candidate["environment"])
+    for k, (base_value, cand_value) in env_diffs.items():
+        logger.warning(
+            "The environment changed: {}: {} -> {}", k, base_value, cand_value
+        )
+
+    comparison_df = compare_runs(
+        baseline, candidate, alpha=args.alpha, min_change=args.min_change
+    )
+    if len(comparison_df) == 0:
+        logger.warning("The runs do not have any configuration in common.")
+        return comparison_df
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    comparison_df.to_csv(
+        output_dir / f"benchmark_comparison-{baseline_id}-{candidate_id}.csv",
+        index=False,
+    )
+
+    print(comparison_df.round(4).to_markdown(index=False))
+    for _, row in comparison_df[comparison_df["Status"] == "regression"].iterrows():
+        logger.warning(
+            "Regression: {} {} {}x{} ({}, {} threads, batch {}): {} {:.4f} -> {:.4f} ({:+.1f}%)",
+            row["Model"],
+            row["Datatype"],
+            row["InputH"],
+            row["InputW"],
+            row["Device"],
+            row["Threads"],
+            row["BatchSize"],
+            row["Metric"],
+            row["Baseline"],
+            row["Candidate"],
+            row["Change(%)"],
+        )
+    return comparison_df
+
+
+if __name__ == "__main__":
+    parser = _init_parser()
+    args = parser.parse_args()
+    if args.list_runs:
+        print(BenchmarkHistory(args.history_dir).get_runs_table().to_markdown())
+        sys.exit(0)
+
+    comparison_df = compare(args)
+    print(f"Results saved to {str(args.output_dir)}.")
+    if (
+        args.fail_on_regression
+        and len(comparison_df) > 0
+        and (comparison_df["Status"] == "regression").any()
+    ):
+        sys.exit(1)
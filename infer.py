@@ -24,9 +24,12 @@ including: individual images, a folder of images, a video, or a webcam stream.
 # =============================================================================
 
 
-import sys
+import os
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+import queue
+import sys
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import cv2 as cv
 from jsonargparse import ArgumentParser, Namespace
@@ -37,11 +40,18 @@ from tqdm import tqdm
 
 import ptlflow
 from ptlflow.models.base_model.base_model import BaseModel
+from ptlflow.utils.compile_utils import compile_model
 from ptlflow.utils.flow_utils import flow_to_rgb, flow_write, flow_read
 from ptlflow.utils.io_adapter import IOAdapter
 from ptlflow.utils.lightning.ptlflow_cli import PTLFlowCLI
+from ptlflow.utils.precision import enable_autocast
 from ptlflow.utils.registry import RegisteredModel
-from ptlflow.utils.utils import tensor_dict_to_numpy
+from ptlflow.utils.resolution_scaling import (
+    get_benchmark_datatype,
+    get_max_forward_pixels,
+    get_scale_factor,
+)
+from ptlflow.utils.utils import images_to_float, tensor_dict_to_numpy
 
 
 def _init_parser() -> ArgumentParser:
@@ -86,8 +96,11 @@ def _init_parser() -> ArgumentParser:
         "--flow_format",
         type=str,
         default="flo",
-        choices=["flo", "png"],
-        help="The format to use when saving the estimated optical flow.",
+        choices=["flo", "png", "flc"],
+        help=(
+            "The format to use when saving the estimated optical flow. flc is a compressed float16 container, see "
+            "ptlflow.utils.flow_container."
+        ),
     )
     parser.add_argument(
         "--show",
@@ -115,6 +128,32 @@ def _init_parser() -> ArgumentParser:
         default=None,
         help=("Multiply the input image by this scale factor before forwarding."),
     )
+    parser.add_argument(
+        "--max_forward_pixels",
+        type=int,
+        default=None,
+        help=(
+            "If height * width * batch size of the input is larger than this value, then the images are downscaled "
+            "before the forward, keeping their aspect ratio, and the outputs are upscaled to the original resolution. "
+            "Ignored if --scale_factor or --input_size are set."
+        ),
+    )
+    parser.add_argument(
+        "--scaling_fits_path",
+        type=str,
+        default=None,
+        help=(
+            "Path to the resolution scaling fits created by model_benchmark.py --sweep_resolutions. If set together "
+            "with --memory_budget, --max_forward_pixels is chosen automatically as the largest input that is predicted "
+            "to fit into the budget. See ptlflow.utils.resolution_scaling."
+        ),
+    )
+    parser.add_argument(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="Memory budget in GB, used with --scaling_fits_path.",
+    )
     parser.add_argument(
         "--max_show_side",
         type=int,
@@ -127,6 +166,57 @@ def _init_parser() -> ArgumentParser:
     parser.add_argument(
         "--fp16", action="store_true", help="If set, use half floating point precision."
     )
+    parser.add_argument(
+        "--autocast",
+        type=str,
+        default=None,
+        choices=("fp16", "bf16"),
+        help=(
+            "If set, run the model with torch.autocast in this precision (bf16 also works on CPU). Unlike --fp16, the "
+            "weights are kept in fp32 and the model's fp32_submodules always run in fp32."
+        ),
+    )
+    parser.add_argument(
+        "--fuse",
+        action="store_true",
+        help=(
+            "If set, BatchNorm layers are folded into the convolutions and other layers that are only needed for "
+            "training are removed before running the model. See ptlflow.utils.fusion."
+        ),
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help=(
+            "If set, the model's compile_submodules are compiled with torch.compile. The first forward with each new input "
+            "size is slow, so it is recommended to combine this with --model.bucket_multiple or --model.bucket_sizes."
+        ),
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=4,
+        help=(
+            "Number of frames that are read and decoded in a background thread while the model processes the current "
+            "pair. If 0, the frames are read in the main thread."
+        ),
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help=(
+            "Number of consecutive frame pairs that are forwarded together in one batch. Larger values may be faster "
+            "for small models. Ignored for webcam inputs and for models that use warm start, since each pair needs "
+            "the predictions of the previous one."
+        ),
+    )
+    parser.add_argument(
+        "--compile_cache_dir",
+        type=str,
+        default=None,
+        help="Directory where the compiled artifacts are cached across runs. See ptlflow.utils.compile_utils.",
+    )
     return parser
 
 
@@ -148,8 +238,13 @@ def infer(args: Namespace, model: BaseModel) -> None:
     model.eval()
     if torch.cuda.is_available():
         model = model.cuda()
-        if args.fp16:
-            model = model.half()
+    if args.fuse:
+        model.fuse_for_inference()
+    if torch.cuda.is_available() and args.fp16:
+        model = model.half()
+    model = enable_autocast(model, args.autocast)
+    if args.compile:
+        compile_model(model, cache_dir=args.compile_cache_dir)
 
     cap, img_paths, num_imgs, prev_img = init_input(args.input_path)
     flow_gt = None
@@ -157,13 +252,26 @@ def infer(args: Namespace, model: BaseModel) -> None:
         assert num_imgs == 2
         flow_gt = flow_read(args.gt_path)
 
-    if args.scale_factor is not None:
+    batch_size = _get_batch_size(args, model)
+    scale_factor = args.scale_factor
+    if scale_factor is None and min(args.input_size) <= 0:
+        scale_factor = get_scale_factor(
+            _get_max_forward_pixels(args), prev_img.shape[:2], batch_size
+        )
+        if scale_factor is not None:
+            logger.info(
+                "The input is downscaled by {:.3f} to fit into --max_forward_pixels.",
+                scale_factor,
+            )
+
+    if scale_factor is not None:
         io_adapter = IOAdapter(
             output_stride=model.output_stride,
             input_size=prev_img.shape[:2],
-            target_scale_factor=args.scale_factor,
+            target_scale_factor=scale_factor,
             cuda=torch.cuda.is_available(),
             fp16=args.fp16,
+            uint8_images=True,
         )
     else:
         io_adapter = IOAdapter(
@@ -172,11 +280,49 @@ def infer(args: Namespace, model: BaseModel) -> None:
             target_size=args.input_size,
             cuda=torch.cuda.is_available(),
             fp16=args.fp16,
+            uint8_images=True,
         )
 
+    show_size = None
+    if args.show and min(args.input_size) > 0:
+        show_size = tuple(args.input_size[::-1])
+        prev_show_img = cv.resize(prev_img, show_size)
+    else:
+        prev_show_img = prev_img
+
+    frames = FrameReader(cap, img_paths, num_imgs, args.prefetch, show_size)
+    try:
+        _infer_frames(
+            args,
+            model,
+            io_adapter,
+            frames,
+            prev_img,
+            prev_show_img,
+            flow_gt,
+            batch_size,
+        )
+    finally:
+        frames.close()
+
+
+def _infer_frames(
+    args: Namespace,
+    model: BaseModel,
+    io_adapter: IOAdapter,
+    frames: "FrameReader",
+    prev_img: np.ndarray,
+    prev_show_img: np.ndarray,
+    flow_gt: Optional[np.ndarray],
+    batch_size: int = 1,
+) -> None:
+    # Each pair is (first image, second image, first image to show, second image to show, dir name, image name)
+    pairs = []
+    prev_preds = None
     prev_dir_name = None
-    for i in tqdm(range(1, num_imgs)):
-        img, img_dir_name, img_name, is_img_valid = _read_image(cap, img_paths, i)
+    for img, img_dir_name, img_name, is_img_valid, show_img in tqdm(
+        frames, total=len(frames)
+    ):
         if prev_dir_name is None:
             prev_dir_name = img_dir_name
 
@@ -184,51 +330,276 @@ def infer(args: Namespace, model: BaseModel) -> None:
             break
 
         if img_dir_name == prev_dir_name:
-            inputs = io_adapter.prepare_inputs([prev_img, img])
-            preds = model(inputs)
+            pairs.append(
+                (prev_img, img, prev_show_img, show_img, img_dir_name, img_name)
+            )
+        else:
+            # A new sequence starts, so the previous predictions cannot be used for warm start anymore
+            prev_preds = None
 
-            preds["images"] = inputs["images"]
-            preds = io_adapter.unscale(preds)
-            preds_npy = tensor_dict_to_numpy(preds)
+        if len(pairs) == batch_size:
+            stop, prev_preds = _infer_pairs(
+                args, model, io_adapter, pairs, flow_gt, prev_preds
+            )
+            pairs = []
+            if stop:
+                return
 
-            if flow_gt is not None:
-                flow_pred = preds_npy["flows"]
-                valid = ~np.isnan(flow_gt[..., 0])
+        prev_dir_name = img_dir_name
+        prev_img = img
+        prev_show_img = show_img
 
-                sq_dist = np.power(flow_pred - flow_gt, 2).sum(2)
-                epe = np.sqrt(sq_dist[valid])
+    if len(pairs) > 0:
+        _infer_pairs(args, model, io_adapter, pairs, flow_gt, prev_preds)
 
-                gt_sq_dist = np.power(flow_gt, 2).sum(2)
-                gt_dist_valid = np.sqrt(gt_sq_dist[valid])
-                flall = (epe > 3) & (epe > 0.05 * gt_dist_valid)
-                print(
-                    f"EPE: {epe.mean():.03f}, Fl-All: {100*flall.mean():.03f}",
-                )
 
-            preds_npy["flows_viz"] = flow_to_rgb(preds_npy["flows"])[:, :, ::-1]
-            if preds_npy.get("flows_b") is not None:
-                preds_npy["flows_b_viz"] = flow_to_rgb(preds_npy["flows_b"])[:, :, ::-1]
-            if args.write_outputs:
-                write_outputs(
-                    preds_npy,
-                    args.output_path,
-                    img_name,
-                    args.flow_format,
-                    img_dir_name,
-                )
-            if args.show:
-                img1 = prev_img
-                img2 = img
-                if min(args.input_size) > 0:
-                    img1 = cv.resize(prev_img, args.input_size[::-1])
-                    img2 = cv.resize(img, args.input_size[::-1])
-                key = show_outputs(
-                    img1, img2, preds_npy, args.auto_forward, args.max_show_side
-                )
-                if key == 27:
-                    break
-        prev_dir_name = img_dir_name
-        prev_img = img
+def _infer_pairs(
+    args: Namespace,
+    model: BaseModel,
+    io_adapter: IOAdapter,
+    pairs: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, str, str]],
+    flow_gt: Optional[np.ndarray],
+    prev_preds: Optional[Dict[str, torch.Tensor]],
+) -> Tuple[bool, Optional[Dict[str, torch.Tensor]]]:
+    """Forward all the pairs in a single batch, then write and show the outputs of each pair.
+
+    Returns
+    -------
+    Tuple[bool, Optional[Dict[str, torch.Tensor]]]
+        Whether the user asked to stop, and the predictions to be used for the warm start of the next batch.
+    """
+    batch_inputs = [io_adapter.prepare_inputs([p[0], p[1]]) for p in pairs]
+    inputs = {"images": torch.cat([inp["images"] for inp in batch_inputs], 0)}
+    if prev_preds is not None:
+        inputs["prev_preds"] = prev_preds
+    preds = model(inputs)
+
+    next_prev_preds = None
+    if model.warm_start:
+        next_prev_preds = {
+            k: v.detach() for k, v in preds.items() if isinstance(v, torch.Tensor)
+        }
+
+    for b, (
+        prev_img,
+        img,
+        prev_show_img,
+        show_img,
+        img_dir_name,
+        img_name,
+    ) in enumerate(pairs):
+        pair_preds = {
+            k: v[b : b + 1]
+            for k, v in preds.items()
+            if isinstance(v, torch.Tensor) and v.shape[0] == len(pairs)
+        }
+        pair_preds["images"] = images_to_float(inputs["images"][b : b + 1])
+        pair_preds = io_adapter.unscale(pair_preds)
+        preds_npy = tensor_dict_to_numpy(pair_preds)
+
+        if flow_gt is not None:
+            flow_pred = preds_npy["flows"]
+            valid = ~np.isnan(flow_gt[..., 0])
+
+            sq_dist = np.power(flow_pred - flow_gt, 2).sum(2)
+            epe = np.sqrt(sq_dist[valid])
+
+            gt_sq_dist = np.power(flow_gt, 2).sum(2)
+            gt_dist_valid = np.sqrt(gt_sq_dist[valid])
+            flall = (epe > 3) & (epe > 0.05 * gt_dist_valid)
+            print(
+                f"EPE: {epe.mean():.03f}, Fl-All: {100*flall.mean():.03f}",
+            )
+
+        preds_npy["flows_viz"] = flow_to_rgb(preds_npy["flows"])[:, :, ::-1]
+        if preds_npy.get("flows_b") is not None:
+            preds_npy["flows_b_viz"] = flow_to_rgb(preds_npy["flows_b"])[:, :, ::-1]
+        if args.write_outputs:
+            write_outputs(
+                preds_npy,
+                args.output_path,
+                img_name,
+                args.flow_format,
+                img_dir_name,
+            )
+        if args.show:
+            key = show_outputs(
+                prev_show_img,
+                show_img,
+                preds_npy,
+                args.auto_forward,
+                args.max_show_side,
+            )
+            if key == 27:
+                return True, next_prev_preds
+    return False, next_prev_preds
+
+
+def _get_batch_size(args: Namespace, model: BaseModel) -> int:
+    batch_size = max(1, args.batch_size)
+    if batch_size > 1 and model.warm_start:
+        # Each pair needs the predictions of the previous one, so the pairs cannot be forwarded together
+        logger.warning(
+            "--batch_size {} is ignored because the model uses warm start.", batch_size
+        )
+        batch_size = 1
+    if batch_size > 1 and len(args.input_path) == 1 and args.input_path[0].isdigit():
+        logger.warning(
+            "--batch_size {} is ignored because the input is a webcam stream.",
+            batch_size,
+        )
+        batch_size = 1
+    return batch_size
+
+
+def _get_max_forward_pixels(args: Namespace) -> Optional[float]:
+    if args.max_forward_pixels is not None:
+        return args.max_forward_pixels
+    if args.scaling_fits_path is None or args.memory_budget is None:
+        return None
+
+    cuda = torch.cuda.is_available()
+    datatype = get_benchmark_datatype(args.fp16, args.autocast, cuda=cuda)
+    max_pixels = get_max_forward_pixels(
+        args.scaling_fits_path,
+        args.model_name,
+        args.memory_budget,
+        device="cuda" if cuda else "cpu",
+        datatype=datatype,
+    )
+    if max_pixels is None:
+        logger.warning(
+            "{} does not have a fit for the model {} with datatype {}, the input will not be downscaled.",
+            args.scaling_fits_path,
+            args.model_name,
+            datatype,
+        )
+    elif max_pixels <= 0:
+        logger.warning(
+            "The model {} is predicted to exceed {} GB with any input size, the input will not be downscaled.",
+            args.model_name,
+            args.memory_budget,
+        )
+        max_pixels = None
+    else:
+        logger.info(
+            "Predicted that inputs up to {:.0f} pixels fit into {} GB.",
+            max_pixels,
+            args.memory_budget,
+        )
+    return max_pixels
+
+
+class FrameReader(object):
+    """Read the input frames in order, optionally decoding them ahead of time in a background thread.
+
+    The iterator yields (image, image dir name, image name, is image valid, image to show) tuples, where the image to show
+    is the image resized to show_size, if provided. The order of the frames is always preserved. The frame reading stops
+    at the first invalid frame, which is also yielded (e.g., the end of a video).
+
+    OpenCV releases the GIL while decoding, so the background thread can decode the next frames while the model runs.
+    """
+
+    def __init__(
+        self,
+        cap: Optional[cv.VideoCapture],
+        img_paths: Optional[List[Path]],
+        num_imgs: int,
+        prefetch: int = 4,
+        show_size: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        """Initialize FrameReader.
+
+        Parameters
+        ----------
+        cap : Optional[cv.VideoCapture]
+            The video capture, whose first frame was already read, or None if the inputs are images.
+        img_paths : Optional[List[Path]]
+            The paths of the images, if the inputs are images.
+        num_imgs : int
+            The total number of images, including the first one, which is not read here.
+        prefetch : int, default 4
+            Maximum number of frames read ahead of time. If 0, the frames are read when they are requested.
+        show_size : Optional[Tuple[int, int]], optional
+            The (width, height) to resize the images for showing them.
+        """
+        self.cap = cap
+        self.img_paths = img_paths
+        self.num_imgs = num_imgs
+        self.prefetch = prefetch
+        self.show_size = show_size
+
+        self.stop_event = threading.Event()
+        self.queue = None
+        self.thread = None
+        if prefetch > 0:
+            self.queue = queue.Queue(maxsize=prefetch)
+            self.thread = threading.Thread(target=self._produce, daemon=True)
+            self.thread.start()
+
+    def __len__(self) -> int:
+        return self.num_imgs - 1
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, str, str, bool, np.ndarray]]:
+        if self.queue is None:
+            yield from self._read_frames()
+            return
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            elif isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        """Stop the background thread and release the video capture."""
+        self.stop_event.set()
+        if self.thread is not None:
+            # Unblock the thread if it is waiting for space in the queue
+            while self.thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.thread.join()
+        if self.cap is not None:
+            self.cap.release()
+
+    def _read_frames(
+        self,
+    ) -> Iterator[Tuple[np.ndarray, str, str, bool, np.ndarray]]:
+        for i in range(1, self.num_imgs):
+            if self.stop_event.is_set():
+                return
+            img, img_dir_name, img_name, is_img_valid = _read_image(
+                self.cap, self.img_paths, i
+            )
+            show_img = img
+            if is_img_valid and self.show_size is not None:
+                show_img = cv.resize(img, self.show_size)
+            yield img, img_dir_name, img_name, is_img_valid, show_img
+            if not is_img_valid:
+                return
+
+    def _produce(self) -> None:
+        try:
+            for frame in self._read_frames():
+                if not self._put(frame):
+                    return
+        except Exception as e:  # noqa: B902
+            self._put(e)
+        self._put(None)
+
+    def _put(self, item: Optional[Tuple]) -> bool:
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
 
 
 def init_input(
@@ -262,7 +633,7 @@ def init_input(
         input_path = Path(input_path[0])
         if input_path.is_dir():
             # Assumes it is a folder of images
-            img_paths = sorted([p for p in input_path.glob("**/*") if not p.is_dir()])
+            img_paths = _list_files(input_path)
         else:
             inp = str(input_path)
             try:
@@ -354,7 +725,7 @@ def write_outputs(
     img_name : str
         The name to be used to save each image (without extension).
     flow_format : str
-        The format (extension) of the flow file to be saved. It can one of {flo, png}.
+        The format (extension) of the flow file to be saved. It can one of {flo, png, flc}.
 
     See Also
     --------
@@ -379,6 +750,19 @@ def write_outputs(
             cv.imwrite(str(out_path.with_suffix(".png")), v.astype(np.uint8))
 
 
+def _list_files(dir_path: Path) -> List[Path]:
+    # Same order as sorted(dir_path.glob("**/*")), but os.scandir avoids one stat call per file
+    files = []
+    with os.scandir(dir_path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir():
+            files.extend(_list_files(dir_path / entry.name))
+        else:
+            files.append(dir_path / entry.name)
+    return files
+
+
 def _read_image(
     cap: cv.VideoCapture, img_paths: List[Union[str, Path]], i: int
 ) -> Tuple[np.ndarray, str, bool]:
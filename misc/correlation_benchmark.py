@@ -0,0 +1,157 @@
+"""
+
+Compare the speed of the "shift" and "grid_sample" modes of ptlflow.utils.correlation.iter_spatial_correlation_sample.
+
+The correlation is computed at every level of a PWC-Net-like feature pyramid (strides 64 to 4), using the number of
+channels and the displacement range of PWC-Net. If spatial_correlation_sampler is installed, it is also included.
+
+Usage:
+
+    python misc/correlation_benchmark.py --input_size 448 1024 --device cpu
+
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+import time
+
+import pandas as pd
+import torch
+
+from ptlflow.utils.correlation import iter_spatial_correlation_sample
+
+try:
+    from spatial_correlation_sampler import spatial_correlation_sample
+except ModuleNotFoundError:
+    spatial_correlation_sample = None
+
+# (stride, channels) of the PWC-Net pyramid levels
+PYRAMID_LEVELS = ((64, 196), (32, 128), (16, 96), (8, 64), (4, 32))
+
+
+def _init_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument("--input_size", type=int, nargs=2, default=(448, 1024))
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument(
+        "--max_displacement",
+        type=int,
+        default=4,
+        help="The patch_size of the correlation will be 2 * max_displacement + 1.",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        choices=("cpu", "cuda"),
+    )
+    parser.add_argument("--num_warmup", type=int, default=2)
+    parser.add_argument("--num_samples", type=int, default=10)
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        default=None,
+        help="If provided, the results table is saved to this csv file.",
+    )
+    return parser
+
+
+@torch.no_grad()
+def _time_function(fn, num_warmup: int, num_samples: int, device: str) -> float:
+    for _ in range(num_warmup):
+        fn()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        fn()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return 1000 * (time.perf_counter() - start) / num_samples
+
+
+def main(args: Namespace) -> pd.DataFrame:
+    """Run the benchmark.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments for configuring the benchmark.
+
+    Returns
+    -------
+    pd.DataFrame
+        The time, in milliseconds, of each implementation at each pyramid level.
+    """
+    patch_size = 2 * args.max_displacement + 1
+    modes = ["grid_sample", "shift"]
+    if spatial_correlation_sample is not None:
+        modes.append("spatial_correlation_sampler")
+
+    rows = []
+    for stride, channels in PYRAMID_LEVELS:
+        height = max(2, args.input_size[0] // stride)
+        width = max(2, args.input_size[1] // stride)
+        input1 = torch.randn(
+            args.batch_size, channels, height, width, device=args.device
+        )
+        input2 = torch.randn(
+            args.batch_size, channels, height, width, device=args.device
+        )
+
+        row = {"stride": stride, "channels": channels, "size": f"{height}x{width}"}
+        outputs = {}
+        for mode in modes:
+            if mode == "spatial_correlation_sampler":
+
+                def fn():
+                    return spatial_correlation_sample(
+                        input1, input2, kernel_size=1, patch_size=patch_size
+                    )
+
+            else:
+
+                def fn():
+                    return iter_spatial_correlation_sample(
+                        input1, input2, patch_size=patch_size, mode=mode
+                    )
+
+            row[f"{mode}(ms)"] = _time_function(
+                fn, args.num_warmup, args.num_samples, args.device
+            )
+            outputs[mode] = fn()
+        row["speedup"] = row["grid_sample(ms)"] / row["shift(ms)"]
+        row["max_abs_diff"] = (
+            (outputs["shift"] - outputs["grid_sample"]).abs().max().item()
+        )
+        rows.append(row)
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False, float_format="{:.3f}".format))
+    if args.output_path is not None:
+        Path(args.output_path).parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(args.output_path, index=False)
+        print(f"Saved results to {args.output_path}")
+    return df
+
+
+if __name__ == "__main__":
+    parser = _init_parser()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,202 @@
+"""
+
+Measure the throughput of the data loading pipeline: BaseFlowDataset.__getitem__, the transforms, and the collate.
+
+The samples are generated by ptlflow.data.datasets.SyntheticFlowDataset, so no dataset needs to be downloaded. The
+samples can be stored on disk in each of the supported flow formats, or be kept decoded in memory, which isolates the
+cost of the transforms and the collate from the cost of reading and decoding the files.
+
+Usage:
+
+    python misc/data_benchmark.py --flow_formats flo png --storage disk memory --num_workers 0 2 4
+
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+import tempfile
+import time
+from typing import Optional
+
+import pandas as pd
+from torch.utils.data import DataLoader
+
+from ptlflow.data import flow_transforms as ft
+from ptlflow.data.datasets import SyntheticFlowDataset
+from ptlflow.utils.dummy_datasets import SYNTHETIC_FLOW_FORMATS
+
+
+def _init_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument("--img_size", type=int, nargs=2, default=(436, 1024))
+    parser.add_argument(
+        "--crop_size",
+        type=int,
+        nargs=2,
+        default=(368, 768),
+        help="Size of the crops of the train transform.",
+    )
+    parser.add_argument("--num_samples", type=int, default=64)
+    parser.add_argument(
+        "--flow_formats",
+        type=str,
+        nargs="+",
+        default=("flo",),
+        choices=tuple(SYNTHETIC_FLOW_FORMATS.keys()),
+        help="Formats of the flow files. Only used with the disk storage.",
+    )
+    parser.add_argument(
+        "--sparse_density",
+        type=float,
+        default=None,
+        help="If provided, only this fraction of the flow pixels is valid, as in KITTI.",
+    )
+    parser.add_argument(
+        "--storage",
+        type=str,
+        nargs="+",
+        default=("disk", "memory"),
+        choices=("disk", "memory"),
+    )
+    parser.add_argument(
+        "--root_dir",
+        type=str,
+        default=None,
+        help="Directory where the samples are written. If not provided, a temporary directory is used.",
+    )
+    parser.add_argument("--num_workers", type=int, nargs="+", default=(0, 1, 2, 4))
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument(
+        "--transform",
+        type=str,
+        default="train",
+        choices=("none", "train"),
+        help="The train transform is the same augmentation used to train RAFT-like models on FlyingThings3D.",
+    )
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        default=None,
+        help="If provided, the results table is saved to this csv file.",
+    )
+    return parser
+
+
+def _get_transform(args: Namespace) -> ft.Compose:
+    if args.transform == "none":
+        return ft.Compose([ft.ToTensor()])
+
+    # These transforms are based on RAFT: https://github.com/princeton-vl/RAFT
+    return ft.Compose(
+        [
+            ft.ToTensor(),
+            ft.RandomScaleAndCrop(
+                args.crop_size,
+                (-0.4, 0.8),
+                (-0.2, 0.2),
+                sparse=args.sparse_density is not None,
+            ),
+            ft.ColorJitter(0.4, 0.4, 0.4, 0.5 / 3.14, 0.2),
+            ft.GaussianNoise(0.02),
+            ft.RandomPatchEraser(0.5, (1, 3), (50, 100), "mean"),
+            ft.RandomFlip(0.5, 0.1),
+        ]
+    )
+
+
+def _benchmark_dataset(
+    dataset: SyntheticFlowDataset, batch_size: int, num_workers: int
+) -> dict:
+    start = time.perf_counter()
+    dataloader = DataLoader(
+        dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers
+    )
+    iterator = iter(dataloader)
+    next(iterator)
+    first_batch_time = time.perf_counter() - start
+    for _ in iterator:
+        pass
+    total_time = time.perf_counter() - start
+    return {
+        "first_batch(s)": first_batch_time,
+        "total(s)": total_time,
+        "samples/s": len(dataset) / total_time,
+    }
+
+
+def main(args: Namespace, root_dir: Optional[str] = None) -> pd.DataFrame:
+    """Run the benchmark.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments for configuring the benchmark.
+    root_dir : Optional[str], optional
+        Directory where the samples are written. Overrides args.root_dir.
+
+    Returns
+    -------
+    pd.DataFrame
+        The time to get the first batch, the total time and the throughput of each configuration.
+    """
+    if root_dir is None:
+        root_dir = args.root_dir
+    if root_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return main(args, tmp_dir)
+
+    transform = _get_transform(args)
+    configs = []
+    if "disk" in args.storage:
+        configs.extend([("disk", f) for f in args.flow_formats])
+    if "memory" in args.storage:
+        configs.append(("memory", "-"))
+
+    rows = []
+    for storage, flow_format in configs:
+        dataset = SyntheticFlowDataset(
+            num_samples=args.num_samples,
+            img_size=args.img_size,
+            flow_format=flow_format if storage == "disk" else "flo",
+            sparse_density=args.sparse_density,
+            root_dir=root_dir if storage == "disk" else None,
+            transform=transform,
+        )
+        for num_workers in args.num_workers:
+            row = {
+                "storage": storage,
+                "flow_format": flow_format,
+                "num_workers": num_workers,
+            }
+            row.update(_benchmark_dataset(dataset, args.batch_size, num_workers))
+            rows.append(row)
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False, float_format="{:.3f}".format))
+    if args.output_path is not None:
+        Path(args.output_path).parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(args.output_path, index=False)
+        print(f"Saved results to {args.output_path}")
+    return df
+
+
+if __name__ == "__main__":
+    parser = _init_parser()
+    args = parser.parse_args()
+    main(args)
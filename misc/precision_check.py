@@ -0,0 +1,206 @@
+"""
+
+Check which models are safe to run with reduced precision.
+
+For each model, the flow predicted with autocast (fp16 and/or bf16) is compared against the fp32 prediction. If a
+validation dataset is provided, the EPE of each precision against the groundtruth and their difference (epe_delta) are
+also reported. Otherwise, random inputs are used and only the distance to the fp32 prediction is reported.
+
+Usage:
+
+    python misc/precision_check.py --select raft rapidflow --ckpt_path things --val_dataset sintel-clean --max_samples 20
+
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from loguru import logger
+import pandas as pd
+import torch
+
+import ptlflow
+from ptlflow.data.flow_datamodule import FlowDataModule
+from ptlflow.utils.precision import apply_fp32_policy, compute_precision_drift
+
+
+def _init_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--select",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Names of the models to be checked.",
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="If set, check all the available models."
+    )
+    parser.add_argument(
+        "--ckpt_path",
+        type=str,
+        default=None,
+        help="Checkpoint name or path. If not provided, the models are randomly initialized.",
+    )
+    parser.add_argument(
+        "--precisions",
+        type=str,
+        nargs="+",
+        default=["bf16", "fp16"],
+        choices=("bf16", "fp16"),
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        choices=("cpu", "cuda"),
+    )
+    parser.add_argument(
+        "--val_dataset",
+        type=str,
+        default=None,
+        help="Validation dataset string, as in validate.py. If not provided, random inputs are used.",
+    )
+    parser.add_argument("--dataset_config_path", type=str, default="./datasets.yaml")
+    parser.add_argument("--max_samples", type=int, default=10)
+    parser.add_argument(
+        "--input_size",
+        type=int,
+        nargs=2,
+        default=(384, 512),
+        help="Size of the random inputs. Only used when --val_dataset is not provided.",
+    )
+    parser.add_argument(
+        "--output_path", type=str, default="outputs/precision_check.csv"
+    )
+    return parser
+
+
+def _get_samples(args: Namespace) -> Iterable[Dict[str, Any]]:
+    if args.val_dataset is None:
+        generator = torch.Generator().manual_seed(0)
+        for _ in range(args.max_samples):
+            yield {"images": torch.rand(1, 2, 3, *args.input_size, generator=generator)}
+    else:
+        data_module = FlowDataModule(
+            val_dataset=args.val_dataset, dataset_config_path=args.dataset_config_path
+        )
+        data_module.setup("validate")
+        num_samples = 0
+        for dataloader in data_module.val_dataloader():
+            for inputs in dataloader:
+                if num_samples >= args.max_samples:
+                    return
+                yield inputs
+                num_samples += 1
+
+
+def check_model(args: Namespace, model_name: str) -> List[Dict[str, Any]]:
+    """Compare the predictions of one model in fp32 and in reduced precisions.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments for configuring the check.
+    model_name : str
+        Name of the model.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        One row of results for each precision.
+    """
+    rows = [
+        {"model": model_name, "ckpt": args.ckpt_path, "precision": p}
+        for p in args.precisions
+    ]
+    try:
+        model = ptlflow.get_model(model_name, args.ckpt_path)
+        model = model.eval().to(args.device)
+        fp32_names = apply_fp32_policy(model)
+
+        sums = [{} for _ in args.precisions]
+        num_samples = 0
+        for inputs in _get_samples(args):
+            inputs = {
+                k: v.to(args.device) if isinstance(v, torch.Tensor) else v
+                for k, v in inputs.items()
+            }
+            with torch.no_grad():
+                reference_preds = model(dict(inputs))
+            for i, precision in enumerate(args.precisions):
+                drift = compute_precision_drift(
+                    model, inputs, precision, reference_preds
+                )
+                drift = {
+                    k.replace(f"_{precision}", "_lowp"): v for k, v in drift.items()
+                }
+                for k, v in drift.items():
+                    sums[i][k] = sums[i].get(k, 0.0) + v
+            num_samples += 1
+
+        for row, s in zip(rows, sums):
+            row["fp32_submodules"] = ",".join(fp32_names)
+            row.update({k: v / max(1, num_samples) for k, v in s.items()})
+            row["status"] = "ok"
+    except Exception as e:  # noqa: B902
+        logger.warning("Model {} failed with exception {}", model_name, e)
+        for row in rows:
+            row["status"] = f"error: {e}"
+    return rows
+
+
+def main(args: Namespace) -> pd.DataFrame:
+    """Run the check for all the selected models.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments for configuring the check.
+
+    Returns
+    -------
+    pd.DataFrame
+        The results table.
+    """
+    if args.all:
+        model_names = ptlflow.get_model_names()
+    elif args.select is not None:
+        model_names = args.select
+    else:
+        raise ValueError("Either --select or --all must be provided.")
+
+    rows = []
+    for mname in model_names:
+        logger.info("Model: {}", mname)
+        rows.extend(check_model(args, mname))
+        df = pd.DataFrame(rows)
+        Path(args.output_path).parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(args.output_path, index=False)
+
+    print(df.to_string(index=False, float_format="{:.4f}".format))
+    logger.info("Saved results to {}", args.output_path)
+    return df
+
+
+if __name__ == "__main__":
+    parser = _init_parser()
+    args = parser.parse_args()
+    main(args)
@@ -16,27 +16,51 @@
 # limitations under the License.
 # =============================================================================
 
+from copy import copy
+import gc
+import math
 from jsonargparse import ArgumentParser, Namespace
 import os
 from pathlib import Path
+import resource
 import sys
 import time
-from typing import Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import cv2 as cv
 from loguru import logger
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import torch
+from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 import yaml
 
 import ptlflow
+from ptlflow.data.flow_datamodule import FlowDataModule
+from ptlflow.data.flow_transforms import ToTensor
 from ptlflow.models.base_model.base_model import BaseModel
+from ptlflow.utils.benchmark_history import (
+    BenchmarkHistory,
+    get_environment_fingerprint,
+)
+from ptlflow.utils.compile_utils import compile_model
+from ptlflow.utils.flow_utils import flow_write
+from ptlflow.utils.resolution_scaling import (
+    fit_benchmark_results,
+    get_max_pixels,
+    get_sweep_sizes,
+    save_fits,
+)
+from ptlflow.utils.io_adapter import IOAdapter
 from ptlflow.utils.lightning.ptlflow_cli import PTLFlowCLI
+from ptlflow.utils.precision import apply_fp32_policy, autocast
+from ptlflow.utils.quantization import quantize_model
 from ptlflow.utils.registry import RegisteredModel
-from ptlflow.utils.timer import Timer
-from ptlflow.utils.utils import count_parameters
+from ptlflow.utils.stage_profiler import profile_stages
+from ptlflow.utils.timer import Timer, TimerManager
+from ptlflow.utils.utils import ShapeBuckets, count_parameters, get_image_resizer
 
 NUM_COMMON_COLUMNS = 6
 TABLE_KEYS_LEGENDS = {
@@ -48,9 +72,15 @@ TABLE_KEYS_LEGENDS = {
     "input_px": "InputPx",
     "time": "Time(ms)",
     "memory": "Memory(GB)",
+    "device": "Device",
+    "threads": "Threads",
+    "batch_size": "BatchSize",
 }
 TABLE_KEYS = list(TABLE_KEYS_LEGENDS.keys())
 TABLE_LEGENDS = [TABLE_KEYS_LEGENDS[x] for x in TABLE_KEYS]
+# Datatypes that run the model with autocast, and the autocast precision they use
+AUTOCAST_DATATYPES = {"bf16": "bf16", "fp16_autocast": "fp16"}
+IMAGE_EXTENSIONS = (".bmp", ".jpeg", ".jpg", ".png", ".ppm", ".tif", ".tiff", ".webp")
 
 from torch.profiler import profile, record_function, ProfilerActivity
 
@@ -176,15 +206,202 @@ def _init_parser() -> ArgumentParser:
         "--datatypes",
         type=str,
         nargs="+",
-        choices=("fp16", "fp32"),
+        choices=("bf16", "fp16", "fp16_autocast", "fp32", "int8"),
         default=["fp32"],
-        help="Datatypes to use during benchmark.",
+        help=(
+            "Datatypes to use during benchmark. fp16 converts the model to half precision (CUDA only), "
+            "while bf16 and fp16_autocast run the model with torch.autocast (bf16 also works on CPU). "
+            "The autocast modes keep the model's fp32_submodules in fp32. int8 quantizes the model's "
+            "quantize_submodules (CPU only), calibrated with random inputs, since only the latency is measured."
+        ),
     )
     parser.add_argument(
         "--batch_size",
         type=int,
         default=1,
     )
+    parser.add_argument(
+        "--device",
+        type=str,
+        choices=("auto", "cpu", "cuda"),
+        default="auto",
+        help="Device to run the benchmark on. auto uses CUDA, if available.",
+    )
+    parser.add_argument(
+        "--sweep_num_threads",
+        type=int,
+        nargs="+",
+        default=None,
+        help=(
+            "A list of values for torch.set_num_threads. The benchmark is repeated for each number of intra-op threads. "
+            "Mostly useful with --device cpu."
+        ),
+    )
+    parser.add_argument(
+        "--num_interop_threads",
+        type=int,
+        default=None,
+        help="If set, the number of inter-op threads is set with torch.set_num_interop_threads.",
+    )
+    parser.add_argument(
+        "--sweep_batch_sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="A list of batch sizes. If set, the benchmark is repeated for each batch size, overriding --batch_size.",
+    )
+    parser.add_argument(
+        "--e2e_input_path",
+        type=str,
+        default=None,
+        help=(
+            "Path to a folder of frames. If set, the end-to-end throughput (decode, preprocess, forward, postprocess, write) "
+            "is also measured on consecutive pairs of these frames."
+        ),
+    )
+    parser.add_argument(
+        "--e2e_dataset",
+        type=str,
+        default=None,
+        help=(
+            "Name of a dataset, in the same format as --data.val_dataset (e.g., sintel-clean). If set, the end-to-end "
+            "throughput is also measured on the frames of this dataset."
+        ),
+    )
+    parser.add_argument(
+        "--e2e_dataset_config_path",
+        type=str,
+        default="./datasets.yaml",
+        help="Path to the yaml file with the dataset paths. Used with --e2e_dataset.",
+    )
+    parser.add_argument(
+        "--e2e_num_workers",
+        type=int,
+        default=0,
+        help="Number of dataloader workers used to decode the frames in the end-to-end benchmark.",
+    )
+    parser.add_argument(
+        "--e2e_max_pairs",
+        type=int,
+        default=100,
+        help="Maximum number of frame pairs used in the end-to-end benchmark.",
+    )
+    parser.add_argument(
+        "--e2e_write_outputs",
+        action="store_true",
+        help="If set, the predicted flows are written to disk during the end-to-end benchmark.",
+    )
+    parser.add_argument(
+        "--mixed_input_sizes",
+        action="store_true",
+        help=(
+            "If set, all the sizes given in --input_size are alternated inside the same timing loop, instead of being "
+            "benchmarked separately. This simulates workloads with mixed input resolutions."
+        ),
+    )
+    parser.add_argument(
+        "--bucket_multiple",
+        type=int,
+        default=None,
+        help=(
+            "If set, the model pads the inputs to a canvas whose sides are multiples of this value. "
+            "See ptlflow.utils.utils.ShapeBuckets."
+        ),
+    )
+    parser.add_argument(
+        "--bucket_sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help=(
+            "A list of fixed canvas sizes used to pad the inputs. Must provide an even number of values. "
+            "Each pair of values will be interpreted as one canvas (height, width)."
+        ),
+    )
+    parser.add_argument(
+        "--fuse",
+        action="store_true",
+        help=(
+            "If set, BatchNorm layers are folded into the convolutions and other layers that are only needed for "
+            "training are removed before running the model. See ptlflow.utils.fusion."
+        ),
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help=(
+            "If set, the model's compile_submodules are compiled with torch.compile. The compilation happens in a "
+            "warm-up forward for each input size, whose time is reported separately in the CompileTime(s) columns."
+        ),
+    )
+    parser.add_argument(
+        "--compile_cache_dir",
+        type=str,
+        default=None,
+        help="Directory where the compiled artifacts are cached across runs. See ptlflow.utils.compile_utils.",
+    )
+    parser.add_argument(
+        "--sweep_resolutions",
+        type=int,
+        default=None,
+        help=(
+            "If set, the models are benchmarked with this number of input sizes, following a geometric series of "
+            "scales of the first size in --input_size, between --sweep_min_scale and --sweep_max_scale. Then the time "
+            "and memory of each model are fitted as a function of the number of pixels and saved to "
+            "model_benchmark_scaling-<name>.json, which can be used by validate.py and infer.py to choose the input "
+            "size automatically. See ptlflow.utils.resolution_scaling."
+        ),
+    )
+    parser.add_argument(
+        "--sweep_min_scale",
+        type=float,
+        default=0.25,
+        help="Scale of the smallest input size of --sweep_resolutions.",
+    )
+    parser.add_argument(
+        "--sweep_max_scale",
+        type=float,
+        default=1.0,
+        help="Scale of the largest input size of --sweep_resolutions.",
+    )
+    parser.add_argument(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help=(
+            "Memory budget in GB. If set together with --sweep_resolutions, the largest number of pixels that fits "
+            "into this budget is predicted for each model."
+        ),
+    )
+    parser.add_argument(
+        "--history_dir",
+        type=str,
+        default=None,
+        help=(
+            "If set, the results of this run, its individual measurements and a fingerprint of the environment are "
+            "appended to this directory. The runs can be compared with compare_benchmarks.py. See "
+            "ptlflow.utils.benchmark_history."
+        ),
+    )
+    parser.add_argument(
+        "--breakdown",
+        action="store_true",
+        help=(
+            "If set, the time, peak memory, activations and FLOPs of each stage of the model (its direct submodules and "
+            "its correlation classes and functions) are also measured with the first input size, and saved to "
+            "model_benchmark_breakdown-<suffix>.csv. See ptlflow.utils.stage_profiler."
+        ),
+    )
+    parser.add_argument(
+        "--breakdown_modules",
+        type=str,
+        nargs="+",
+        default=None,
+        help=(
+            "Names of the submodules to be measured with --breakdown, as in model.named_modules(). If not set, the direct "
+            "submodules of the model are used."
+        ),
+    )
 
     return parser
 
@@ -213,8 +430,17 @@ def benchmark(args: Namespace, device_handle) -> pd.DataFrame:
     for dtype_str in args.datatypes:
         df_dict[f"{TABLE_LEGENDS[6]}-{dtype_str}"] = pd.Series([], dtype="float")
         df_dict[f"{TABLE_LEGENDS[7]}-{dtype_str}"] = pd.Series([], dtype="float")
+    df_dict[TABLE_LEGENDS[8]] = pd.Series([], dtype="str")
+    df_dict[TABLE_LEGENDS[9]] = pd.Series([], dtype="int")
+    df_dict[TABLE_LEGENDS[10]] = pd.Series([], dtype="int")
+    if args.compile:
+        for dtype_str in args.datatypes:
+            df_dict[f"CompileTime(s)-{dtype_str}"] = pd.Series([], dtype="float")
 
     df = pd.DataFrame(df_dict)
+    e2e_df = pd.DataFrame()
+    breakdown_df = pd.DataFrame()
+    history_samples = []
 
     output_path = Path(args.output_path)
     output_path.mkdir(parents=True, exist_ok=True)
@@ -247,161 +473,503 @@ def benchmark(args: Namespace, device_handle) -> pd.DataFrame:
             assert name in available_model_names
 
     assert (len(args.input_size) % 2) == 0
+    input_sizes = [
+        args.input_size[i : i + 2] for i in range(0, len(args.input_size), 2)
+    ]
+    if args.sweep_resolutions is not None:
+        assert (
+            not args.mixed_input_sizes
+        ), "--sweep_resolutions cannot be combined with --mixed_input_sizes"
+        input_sizes = get_sweep_sizes(
+            input_sizes[0],
+            args.sweep_resolutions,
+            args.sweep_min_scale,
+            args.sweep_max_scale,
+        )
+    if args.mixed_input_sizes:
+        input_sizes = [input_sizes]
+    else:
+        input_sizes = [[isize] for isize in input_sizes]
+
+    shape_buckets = None
+    if args.bucket_multiple is not None or args.bucket_sizes is not None:
+        bucket_sizes = None
+        if args.bucket_sizes is not None:
+            assert (len(args.bucket_sizes) % 2) == 0
+            bucket_sizes = [
+                args.bucket_sizes[i : i + 2]
+                for i in range(0, len(args.bucket_sizes), 2)
+            ]
+        shape_buckets = ShapeBuckets(args.bucket_multiple, bucket_sizes)
+
+    device = _get_device(args)
+    if args.num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(args.num_interop_threads)
+        except RuntimeError as e:
+            logger.warning("Could not set the number of inter-op threads: {}", e)
+
+    sweep_num_threads = args.sweep_num_threads
+    if sweep_num_threads is None:
+        sweep_num_threads = [torch.get_num_threads()]
+    sweep_batch_sizes = args.sweep_batch_sizes
+    if sweep_batch_sizes is None:
+        sweep_batch_sizes = [args.batch_size]
 
+    device_initial_used = 0
     if pynvml is not None and device_handle is not None:
         device_info = pynvml.nvmlDeviceGetMemoryInfo(device_handle)
         device_initial_used = device_info.used
 
-    for isize in range(0, len(args.input_size), 2):
-        input_size = args.input_size[isize : isize + 2]
-
+    for input_size_list in input_sizes:
         for mname in tqdm(model_names):
             if mname in exclude:
                 continue
 
-            new_df_dict = {}
-            for idtype, dtype_str in enumerate(args.datatypes):
-                try:
-                    all_times = []
-                    all_memories = []
-                    first_memory_used = 0
-                    for irep in range(args.num_trials + 1):
-                        torch.cuda.empty_cache()
-                        time.sleep(args.sleep_interval)
-                        if pynvml is not None and device_handle is not None:
-                            device_info = pynvml.nvmlDeviceGetMemoryInfo(device_handle)
-                            device_start_rep_used = device_info.used
-                        model = ptlflow.get_model(mname, args=model_args)
-                        model = model.eval()
-                        if torch.cuda.is_available():
-                            model = model.cuda()
-                            if dtype_str == "fp16":
-                                model = model.half()
-                        model_params = count_parameters(model)
-                        repetition_times = estimate_inference_time(
-                            args, model, input_size, dtype_str
-                        )
-                        if irep > 0:
-                            all_times.extend(repetition_times)
-
-                        if device_handle is not None:
-                            device_info = pynvml.nvmlDeviceGetMemoryInfo(device_handle)
-                            model_memory_used = device_info.used - device_start_rep_used
-                            if irep > 0:
-                                all_memories.extend(
-                                    [model_memory_used] * args.num_samples
-                                )
-                            else:
-                                first_memory_used = (
-                                    device_info.used - device_initial_used
-                                )
-                        model = model.cpu()
-                        model = None
-
-                    model = ptlflow.get_model(mname, args=model_args)
-                    model = model.eval()
-
-                    inputs = {
-                        "images": torch.rand(
-                            1,
-                            2,
-                            3,
-                            input_size[0],
-                            input_size[1],
-                        )
-                    }
-
-                    if torch.cuda.is_available():
-                        model = model.cuda()
-                        inputs["images"] = inputs["images"].cuda()
-                        if dtype_str == "fp16":
-                            model = model.half()
-                            inputs["images"] = inputs["images"].half()
-
-                    flops = count_flops(model, inputs)
-
-                    all_times.sort()
-                    final_times = {
-                        "avg": np.array(all_times).mean(),
-                        "median": all_times[len(all_times) // 2],
-                        "perc1": all_times[len(all_times) // 100],
-                        "perc5": all_times[len(all_times) // 20],
-                        "perc10": all_times[len(all_times) // 10],
-                    }
-
-                    if len(all_memories) == 0:
-                        all_memories = [0]
-                    all_memories.sort()
-                    final_memories = {
-                        "avg": np.array(all_memories).mean(),
-                        "median": all_memories[len(all_memories) // 2],
-                        "perc1": all_memories[len(all_memories) // 100],
-                        "perc5": all_memories[len(all_memories) // 20],
-                        "perc10": all_memories[len(all_memories) // 10],
-                        "first": first_memory_used,
-                    }
-
-                    if len(new_df_dict) == 0:
+            for num_threads in sweep_num_threads:
+                torch.set_num_threads(num_threads)
+                for batch_size in sweep_batch_sizes:
+                    run_args = copy(args)
+                    run_args.batch_size = batch_size
+
+                    new_df_dict = {}
+                    for idtype, dtype_str in enumerate(args.datatypes):
+                        try:
+                            results = _benchmark_one_model(
+                                run_args,
+                                mname,
+                                model_args,
+                                input_size_list,
+                                dtype_str,
+                                device,
+                                shape_buckets,
+                                device_handle,
+                                device_initial_used,
+                            )
+                        except Exception as e:  # noqa: B902
+                            logger.warning(
+                                "Skipping model {} with datatype {} due to exception {}",
+                                mname,
+                                dtype_str,
+                                e,
+                            )
+                            continue
+
+                        if len(new_df_dict) == 0:
+                            # With mixed input sizes, the largest height and width and the average number of pixels are reported
+                            values = [
+                                mname,
+                                float(results["params"]) / 1e6,
+                                results["flops"] / 1e9,
+                                max([isz[0] for isz in input_size_list]),
+                                max([isz[1] for isz in input_size_list]),
+                                int(
+                                    np.mean(
+                                        [isz[0] * isz[1] for isz in input_size_list]
+                                    )
+                                ),
+                            ]
+                            new_df_dict.update(
+                                {
+                                    c: [v]
+                                    for c, v in zip(
+                                        df.columns[:NUM_COMMON_COLUMNS], values
+                                    )
+                                }
+                            )
+                            new_df_dict.update(
+                                {
+                                    TABLE_KEYS_LEGENDS["device"]: [device.type],
+                                    TABLE_KEYS_LEGENDS["threads"]: [num_threads],
+                                    TABLE_KEYS_LEGENDS["batch_size"]: [batch_size],
+                                }
+                            )
+
                         values = [
-                            mname,
-                            float(model_params) / 1e6,
-                            flops / 1e9,
-                            input_size[0],
-                            input_size[1],
-                            input_size[0] * input_size[1],
+                            results["times"][args.final_speed_mode] * 1000,
+                            results["memories"][args.final_memory_mode] / 1024**3,
                         ]
                         new_df_dict.update(
                             {
                                 c: [v]
-                                for c, v in zip(df.columns[:NUM_COMMON_COLUMNS], values)
+                                for c, v in zip(
+                                    df.columns[
+                                        NUM_COMMON_COLUMNS
+                                        + 2 * idtype : NUM_COMMON_COLUMNS
+                                        + 2 * (idtype + 1)
+                                    ],
+                                    values,
+                                )
                             }
                         )
 
-                    values = [
-                        final_times[args.final_speed_mode] * 1000,
-                        final_memories[args.final_memory_mode] / 1024**3,
-                    ]
-                    new_df_dict.update(
-                        {
-                            c: [v]
-                            for c, v in zip(
-                                df.columns[
-                                    NUM_COMMON_COLUMNS
-                                    + 2 * idtype : NUM_COMMON_COLUMNS
-                                    + 2 * (idtype + 1)
+                        history_samples.append(
+                            {
+                                "Model": mname,
+                                "Datatype": dtype_str,
+                                "Device": device.type,
+                                "Threads": num_threads,
+                                "BatchSize": batch_size,
+                                "InputH": max([isz[0] for isz in input_size_list]),
+                                "InputW": max([isz[1] for isz in input_size_list]),
+                                "times": results["time_samples"],
+                                "memories": results["memory_samples"],
+                            }
+                        )
+
+                        if results.get("compile_time") is not None:
+                            new_df_dict[f"CompileTime(s)-{dtype_str}"] = [
+                                results["compile_time"]
+                            ]
+
+                        if results.get("e2e") is not None:
+                            e2e_df = pd.concat(
+                                [
+                                    e2e_df,
+                                    pd.DataFrame(
+                                        {
+                                            "Model": [mname],
+                                            "Datatype": [dtype_str],
+                                            "Device": [device.type],
+                                            "Threads": [num_threads],
+                                            **{
+                                                k: [v]
+                                                for k, v in results["e2e"].items()
+                                            },
+                                        }
+                                    ),
+                                ],
+                                ignore_index=True,
+                            )
+                            e2e_csv_suffix = (
+                                output_suffix if output_suffix is not None else mname
+                            )
+                            e2e_df.round(3).to_csv(
+                                output_path
+                                / f"model_benchmark_e2e-{e2e_csv_suffix}.csv",
+                                index=False,
+                            )
+
+                        if results.get("breakdown") is not None:
+                            breakdown_df = pd.concat(
+                                [
+                                    breakdown_df,
+                                    _get_breakdown_df(
+                                        results["breakdown"],
+                                        mname,
+                                        dtype_str,
+                                        device.type,
+                                        num_threads,
+                                        batch_size,
+                                        input_size_list[0],
+                                    ),
                                 ],
-                                values,
+                                ignore_index=True,
                             )
-                        }
-                    )
-                except Exception as e:  # noqa: B902
-                    logger.warning(
-                        "Skipping model {} with datatype {} due to exception {}",
-                        mname,
-                        dtype_str,
-                        e,
-                    )
-
-            if len(new_df_dict) > 0:
-                new_df = pd.DataFrame(new_df_dict)
-                df = pd.concat([df, new_df], ignore_index=True)
-                df = df.round(3)
-                csv_suffix = output_suffix if output_suffix is not None else mname
-                df.to_csv(
-                    output_path / f"model_benchmark-{csv_suffix}.csv", index=False
-                )
-                save_plot(
-                    output_path,
-                    mname,
-                    df,
-                    args.plot_axes,
-                    args.plot_log_x,
-                    args.plot_log_y,
-                    args.datatypes[0],
-                )
+                            breakdown_csv_suffix = (
+                                output_suffix if output_suffix is not None else mname
+                            )
+                            breakdown_df.round(3).to_csv(
+                                output_path
+                                / f"model_benchmark_breakdown-{breakdown_csv_suffix}.csv",
+                                index=False,
+                            )
+                            save_breakdown_plot(
+                                output_path, breakdown_csv_suffix, breakdown_df
+                            )
+
+                    if len(new_df_dict) > 0:
+                        new_df = pd.DataFrame(new_df_dict)
+                        df = pd.concat([df, new_df], ignore_index=True)
+                        df = df.round(3)
+                        csv_suffix = (
+                            output_suffix if output_suffix is not None else mname
+                        )
+                        df.to_csv(
+                            output_path / f"model_benchmark-{csv_suffix}.csv",
+                            index=False,
+                        )
+                        save_plot(
+                            output_path,
+                            mname,
+                            df,
+                            args.plot_axes,
+                            args.plot_log_x,
+                            args.plot_log_y,
+                            args.datatypes[0],
+                        )
+
+    if args.sweep_resolutions is not None and len(df) > 0:
+        scaling_suffix = output_suffix if output_suffix is not None else model_names[0]
+        save_scaling_fits(args, df, output_path, scaling_suffix)
+
+    if args.history_dir is not None:
+        history = BenchmarkHistory(args.history_dir)
+        run_id = history.add_run(
+            df,
+            history_samples,
+            get_environment_fingerprint(_get_history_settings(args)),
+        )
+        logger.info("Saved the run {} to the history at {}", run_id, args.history_dir)
     return df
 
 
+def _benchmark_one_model(
+    args: Namespace,
+    mname: str,
+    model_args: Optional[Namespace],
+    input_size_list: List[Tuple[int, int]],
+    dtype_str: str,
+    device: torch.device,
+    shape_buckets: Optional[ShapeBuckets],
+    device_handle,
+    device_initial_used: int,
+) -> Dict[str, Any]:
+    all_times = []
+    all_memories = []
+    first_memory_used = 0
+
+    # The model is instantiated only once per datatype and reused by all the trials
+    is_cuda = device.type == "cuda"
+    if is_cuda:
+        torch.cuda.empty_cache()
+    if is_cuda and pynvml is not None and device_handle is not None:
+        device_info = pynvml.nvmlDeviceGetMemoryInfo(device_handle)
+        device_start_rep_used = device_info.used
+    elif not is_cuda:
+        gc.collect()
+        _reset_peak_rss()
+        device_start_rep_used = _get_rss()
+    model = ptlflow.get_model(mname, args=model_args)
+    model = model.eval()
+    if shape_buckets is not None:
+        model.shape_buckets = shape_buckets
+    model = model.to(device)
+    if args.fuse:
+        model.fuse_for_inference(input_size=input_size_list[0])
+    if dtype_str == "fp16":
+        if not is_cuda:
+            # Otherwise the model would silently run in fp32 and be reported as fp16
+            raise ValueError(
+                "The fp16 datatype is only supported on CUDA, use bf16 or fp16_autocast on the CPU."
+            )
+        model = model.half()
+    if dtype_str in AUTOCAST_DATATYPES:
+        apply_fp32_policy(model)
+    model_params = count_parameters(model)
+    if dtype_str == "int8":
+        if is_cuda:
+            raise ValueError(
+                "The int8 datatype is only supported on the CPU, use --device cpu."
+            )
+        calibration_inputs = [
+            {"images": torch.rand(args.batch_size, 2, 3, isize[0], isize[1])}
+            for isize in input_size_list
+        ]
+        quantize_model(model, calibration_inputs)
+
+    compile_time = None
+    if args.compile:
+        compile_model(model, cache_dir=args.compile_cache_dir)
+        # The compilation happens in the first forward of each input size, so it is excluded from the timed trials
+        compile_time = _warmup_compiled_model(args, model, input_size_list, dtype_str)
+
+    for irep in range(args.num_trials + 1):
+        time.sleep(args.sleep_interval)
+        repetition_times = estimate_inference_time(
+            args, model, input_size_list, dtype_str
+        )
+        if irep > 0:
+            all_times.extend(repetition_times)
+
+        model_memory_used = None
+        if is_cuda and pynvml is not None and device_handle is not None:
+            device_info = pynvml.nvmlDeviceGetMemoryInfo(device_handle)
+            model_memory_used = device_info.used - device_start_rep_used
+            if irep == 0:
+                first_memory_used = device_info.used - device_initial_used
+        elif not is_cuda:
+            # On CPU, the memory is the increase of the peak resident set size of this process
+            model_memory_used = _get_peak_rss() - device_start_rep_used
+            if irep == 0:
+                first_memory_used = model_memory_used
+        if model_memory_used is not None and irep > 0:
+            all_memories.extend([model_memory_used] * args.num_samples)
+
+    input_size = input_size_list[0]
+    inputs = {
+        "images": torch.rand(
+            1,
+            2,
+            3,
+            input_size[0],
+            input_size[1],
+        )
+    }
+    inputs["images"] = inputs["images"].to(device)
+    if is_cuda and dtype_str == "fp16":
+        inputs["images"] = inputs["images"].half()
+
+    with _autocast(device, dtype_str):
+        flops = count_flops(model, inputs)
+
+    e2e_results = None
+    if args.e2e_input_path is not None or args.e2e_dataset is not None:
+        e2e_results = estimate_end_to_end_throughput(args, model, dtype_str)
+
+    breakdown_results = None
+    if args.breakdown:
+        breakdown_inputs = {
+            "images": torch.rand(
+                args.batch_size, 2, 3, input_size[0], input_size[1], device=device
+            )
+        }
+        if is_cuda and dtype_str == "fp16":
+            breakdown_inputs["images"] = breakdown_inputs["images"].half()
+
+        def forward_fn() -> Dict[str, torch.Tensor]:
+            with _autocast(device, dtype_str):
+                return model(breakdown_inputs)
+
+        breakdown_results = profile_stages(
+            model, forward_fn, args.num_samples, args.breakdown_modules
+        )
+
+    model = model.cpu()
+    model = None
+
+    # The individual measurements are kept for the statistical comparison of the runs in the benchmark history
+    time_samples = [1000 * t for t in all_times]
+    memory_samples = list(all_memories)
+
+    all_times.sort()
+    final_times = {
+        "avg": np.array(all_times).mean(),
+        "median": all_times[len(all_times) // 2],
+        "perc1": all_times[len(all_times) // 100],
+        "perc5": all_times[len(all_times) // 20],
+        "perc10": all_times[len(all_times) // 10],
+    }
+
+    if len(all_memories) == 0:
+        all_memories = [0]
+    all_memories.sort()
+    final_memories = {
+        "avg": np.array(all_memories).mean(),
+        "median": all_memories[len(all_memories) // 2],
+        "perc1": all_memories[len(all_memories) // 100],
+        "perc5": all_memories[len(all_memories) // 20],
+        "perc10": all_memories[len(all_memories) // 10],
+        "first": first_memory_used,
+    }
+
+    return {
+        "params": model_params,
+        "flops": flops,
+        "times": final_times,
+        "memories": final_memories,
+        "e2e": e2e_results,
+        "compile_time": compile_time,
+        "breakdown": breakdown_results,
+        "time_samples": time_samples,
+        "memory_samples": memory_samples,
+    }
+
+
+@torch.no_grad()
+def _warmup_compiled_model(
+    args: Namespace,
+    model: BaseModel,
+    input_size_list: List[Tuple[int, int]],
+    dtype_str: str,
+) -> float:
+    """Run one forward for each input size and return the total time, in seconds, which is dominated by the compilation."""
+    start = time.perf_counter()
+    for isize in input_size_list:
+        images = torch.rand(args.batch_size, 2, 3, isize[0], isize[1]).to(model.device)
+        if model.device.type == "cuda" and dtype_str == "fp16":
+            images = images.half()
+        with _autocast(model.device, dtype_str):
+            model({"images": images})
+    if model.device.type == "cuda":
+        torch.cuda.synchronize()
+    return time.perf_counter() - start
+
+
+def _get_history_settings(args: Namespace) -> Dict[str, Any]:
+    settings = {
+        name: getattr(args, name, None)
+        for name in [
+            "all",
+            "select",
+            "exclude",
+            "ckpt_path",
+            "num_trials",
+            "num_samples",
+            "input_size",
+            "mixed_input_sizes",
+            "sweep_resolutions",
+            "sweep_min_scale",
+            "sweep_max_scale",
+            "final_speed_mode",
+            "final_memory_mode",
+            "datatypes",
+            "batch_size",
+            "sweep_batch_sizes",
+            "sweep_num_threads",
+            "num_interop_threads",
+            "device",
+            "bucket_multiple",
+            "bucket_sizes",
+            "fuse",
+            "compile",
+        ]
+    }
+    if not args.all and (args.select is None or len(args.select) == 0):
+        settings["model"] = str(args.model)
+    return settings
+
+
+def _get_device(args: Namespace) -> torch.device:
+    if args.device == "auto":
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if args.device == "cuda" and not torch.cuda.is_available():
+        logger.warning("--device cuda was requested, but CUDA is not available.")
+    return torch.device(args.device)
+
+
+def _autocast(device: torch.device, dtype_str: str) -> Any:
+    return autocast(device, AUTOCAST_DATATYPES.get(dtype_str))
+
+
+def _get_rss(key: str = "VmRSS") -> int:
+    """Return the resident set size (or its peak, if key == "VmHWM") of this process in bytes."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(f"{key}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Fallback for systems without procfs. ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _get_peak_rss() -> int:
+    return _get_rss("VmHWM")
+
+
+def _reset_peak_rss() -> None:
+    # Writing 5 to clear_refs resets the peak RSS (VmHWM) on Linux. On other systems the peak is never reset,
+    # so the measured memory is only an upper bound.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
 @torch.no_grad()
 def count_flops(model, inputs):
     with profile(
@@ -422,7 +990,7 @@ def count_flops(model, inputs):
 def estimate_inference_time(
     args: Namespace,
     model: BaseModel,
-    input_size: Tuple[int, int],
+    input_size: Union[Tuple[int, int], List[Tuple[int, int]]],
     dtype_str: str,
 ) -> float:
     """Compute the average forward time for one model.
@@ -433,39 +1001,240 @@ def estimate_inference_time(
         Arguments for configuring the benchmark.
     model : BaseModel
         The model to perform the estimation.
+    input_size : Union[Tuple[int, int], List[Tuple[int, int]]]
+        The size of the inputs. If a list of sizes is given, the sizes are alternated at every forward.
+    dtype_str : str
+        Name of the datatype.
 
     Returns
     -------
     float
         The average time of the runs.
     """
-    timer = Timer("inference")
-    time_vals = []
-    for i in range(args.num_samples + 1):
+    if isinstance(input_size[0], int):
+        input_size = [input_size]
+
+    # Allocate the inputs only once, outside of the timing loop
+    all_inputs = []
+    for isize in input_size:
         inputs = {
             "images": torch.rand(
                 args.batch_size,
                 2,
                 3,
-                input_size[0],
-                input_size[1],
+                isize[0],
+                isize[1],
             )
         }
-        if torch.cuda.is_available():
-            inputs["images"] = inputs["images"].cuda()
-            if dtype_str == "fp16":
-                inputs["images"] = inputs["images"].half()
+        inputs["images"] = inputs["images"].to(device=model.device)
+        if model.device.type == "cuda" and dtype_str == "fp16":
+            inputs["images"] = inputs["images"].half()
+        all_inputs.append(inputs)
+
+    timer = Timer("inference")
+    time_vals = []
+    for i in range(args.num_samples + 1):
+        inputs = all_inputs[i % len(all_inputs)]
         if i > 0:
             # Skip first time, it is slow due to memory allocation
             timer.reset()
             timer.tic()
-        model(inputs)
+        with _autocast(model.device, dtype_str):
+            model(inputs)
         if i > 0:
             timer.toc()
             time_vals.append(timer.total() / args.batch_size)
     return time_vals
 
 
+class _FramePairDataset(Dataset):
+    """Decode pairs of frames from disk to feed the end-to-end benchmark."""
+
+    def __init__(self, img_pairs: List[List[Path]]) -> None:
+        self.img_pairs = img_pairs
+        # The names keep the path relative to the common root, since frames in different directories often have the
+        # same file name (e.g., the scenes of Sintel)
+        self.root_dir = Path(
+            os.path.commonpath([str(Path(p[0]).parent) for p in img_pairs])
+        )
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        images = np.stack([cv.imread(str(p)) for p in self.img_pairs[index]])
+        decode_time = time.perf_counter() - start
+        return {
+            "images": images,
+            "decode_time": decode_time,
+            "name": str(
+                Path(self.img_pairs[index][0])
+                .relative_to(self.root_dir)
+                .with_suffix("")
+            ),
+        }
+
+    def __len__(self) -> int:
+        return len(self.img_pairs)
+
+
+def _get_e2e_image_pairs(args: Namespace) -> List[List[Path]]:
+    if args.e2e_input_path is not None:
+        img_paths = sorted(
+            [
+                p
+                for p in Path(args.e2e_input_path).glob("**/*")
+                if p.suffix.lower() in IMAGE_EXTENSIONS
+            ]
+        )
+        img_pairs = [
+            [img_paths[i], img_paths[i + 1]]
+            for i in range(len(img_paths) - 1)
+            if img_paths[i].parent == img_paths[i + 1].parent
+        ]
+    else:
+        data_module = FlowDataModule(dataset_config_path=args.e2e_dataset_config_path)
+        data_module._load_dataset_paths()
+        img_pairs = []
+        for parsed_vals in data_module._parse_dataset_selection(args.e2e_dataset):
+            dataset = getattr(data_module, f"_get_{parsed_vals[1]}_dataset")(
+                False, *parsed_vals[2:]
+            )
+            img_pairs.extend([paths[:2] for paths in dataset.img_paths])
+
+    if args.e2e_max_pairs is not None:
+        img_pairs = img_pairs[: args.e2e_max_pairs]
+    assert len(img_pairs) > 0, "No image pairs were found for the end-to-end benchmark."
+    return img_pairs
+
+
+@torch.no_grad()
+def estimate_end_to_end_throughput(
+    args: Namespace,
+    model: BaseModel,
+    dtype_str: str,
+) -> Dict[str, float]:
+    """Measure the throughput of the full inference pipeline, from reading the frames to writing the predictions.
+
+    The pipeline mimics infer.py: the frames are decoded from disk (by the dataloader workers), converted to tensors,
+    preprocessed by IOAdapter (including the host to device copy), forwarded, unscaled, and finally converted back to numpy
+    and optionally written to disk.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments for configuring the benchmark.
+    model : BaseModel
+        The model to perform the estimation.
+    dtype_str : str
+        Name of the datatype.
+
+    Returns
+    -------
+    Dict[str, float]
+        The sustained frames per second and the average time of each stage per frame pair, in milliseconds.
+    """
+    img_pairs = _get_e2e_image_pairs(args)
+    dataloader = DataLoader(
+        _FramePairDataset(img_pairs),
+        batch_size=args.batch_size,
+        shuffle=False,
+        num_workers=args.e2e_num_workers,
+        collate_fn=list,
+    )
+
+    write_dir = None
+    if args.e2e_write_outputs:
+        write_dir = Path(args.output_path) / "e2e_outputs"
+        write_dir.mkdir(parents=True, exist_ok=True)
+
+    to_tensor = ToTensor()
+    fp16 = model.device.type == "cuda" and dtype_str == "fp16"
+    timers = TimerManager()
+    stage_names = ["to_tensor", "preprocess", "forward", "unpad", "write"]
+    decode_time = 0.0
+    num_pairs = 0
+    io_adapter = None
+    io_adapter_size = None
+
+    start = time.perf_counter()
+    timers["wait"].tic()
+    for batch in dataloader:
+        timers["wait"].toc()
+
+        timers["to_tensor"].tic()
+        images = [to_tensor({"images": sample["images"]})["images"] for sample in batch]
+        orig_sizes = [tuple(img.shape[-2:]) for img in images]
+        canvas_size = (
+            max([size[0] for size in orig_sizes]),
+            max([size[1] for size in orig_sizes]),
+        )
+        # Frames of different sizes are padded to the largest one of the batch, as done by BucketPadCollate
+        images = torch.stack(
+            [
+                get_image_resizer(size, size=canvas_size, resize_mode="pad").fill(img)
+                for img, size in zip(images, orig_sizes)
+            ]
+        )
+        timers["to_tensor"].toc()
+
+        timers["preprocess"].tic()
+        if io_adapter is None or io_adapter_size != tuple(images.shape[-2:]):
+            io_adapter_size = tuple(images.shape[-2:])
+            io_adapter = IOAdapter(
+                output_stride=model.output_stride,
+                input_size=io_adapter_size,
+                cuda=model.device.type == "cuda",
+                fp16=fp16,
+            )
+        inputs = io_adapter.prepare_inputs(inputs={"images": images})
+        timers["preprocess"].toc()
+
+        timers["forward"].tic()
+        with _autocast(model.device, dtype_str):
+            preds = model(inputs)
+        timers["forward"].toc()
+
+        timers["unpad"].tic()
+        preds = io_adapter.unscale(preds)
+        timers["unpad"].toc()
+
+        timers["write"].tic()
+        flows = preds["flows"].detach().float().cpu()
+        for i, sample in enumerate(batch):
+            flow = get_image_resizer(
+                orig_sizes[i], size=canvas_size, resize_mode="pad"
+            ).unfill(flows[i, 0])
+            flow = flow.permute(1, 2, 0).numpy()
+            if write_dir is not None:
+                flow_path = write_dir / f"{sample['name']}.flo"
+                flow_path.parent.mkdir(parents=True, exist_ok=True)
+                flow_write(flow_path, flow)
+        timers["write"].toc()
+
+        decode_time += sum([sample["decode_time"] for sample in batch])
+        num_pairs += len(batch)
+        timers["wait"].tic()
+    timers["wait"].toc()
+    total_time = time.perf_counter() - start
+
+    results = {
+        "BatchSize": args.batch_size,
+        "NumWorkers": args.e2e_num_workers,
+        "NumPairs": num_pairs,
+        "FPS": num_pairs / total_time,
+        "decode(ms)": 1000 * decode_time / num_pairs,
+        "wait(ms)": 1000 * timers["wait"].total() / num_pairs,
+    }
+    for name in stage_names:
+        results[f"{name}(ms)"] = 1000 * timers[name].total() / num_pairs
+    logger.info(
+        "End-to-end throughput of {} ({}): {:.2f} FPS",
+        model.__class__.__name__,
+        dtype_str,
+        results["FPS"],
+    )
+    return results
+
+
 def save_plot(
     output_dir: Union[str, Path],
     model_name: str,
@@ -540,6 +1309,145 @@ def save_plot(
         )
 
 
+def save_scaling_fits(
+    args: Namespace, df: pd.DataFrame, output_dir: Union[str, Path], name: str
+) -> None:
+    """Fit the time and memory of each model as a function of the number of pixels, and save the fits to disk.
+
+    The fits are saved to model_benchmark_scaling-<name>.json, and a summary table to model_benchmark_scaling-<name>.csv.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments of the benchmark.
+    df : pd.DataFrame
+        A DataFrame with the benchmark results of a resolution sweep.
+    output_dir : Union[str, Path]
+        Path to the directory where the fits will be saved.
+    name : str
+        Used just to name the resulting files.
+
+    See Also
+    --------
+    ptlflow.utils.resolution_scaling : The fitting functions.
+    """
+    rows = []
+    for _, row in df.iterrows():
+        for dtype_str in args.datatypes:
+            time_ms = row[f"{TABLE_KEYS_LEGENDS['time']}-{dtype_str}"]
+            memory_gb = row[f"{TABLE_KEYS_LEGENDS['memory']}-{dtype_str}"]
+            if pd.isna(time_ms) or pd.isna(memory_gb):
+                continue
+            batch_size = int(row[TABLE_KEYS_LEGENDS["batch_size"]])
+            # The table reports the time per sample, while the fit models one forward of the whole batch
+            rows.append(
+                {
+                    "Model": row[TABLE_LEGENDS[0]],
+                    "Datatype": dtype_str,
+                    "Device": row[TABLE_KEYS_LEGENDS["device"]],
+                    "Threads": int(row[TABLE_KEYS_LEGENDS["threads"]]),
+                    "BatchSize": batch_size,
+                    "num_pixels": int(row[TABLE_LEGENDS[5]]) * batch_size,
+                    "time": float(time_ms) * batch_size,
+                    "memory": float(memory_gb),
+                }
+            )
+    fits = fit_benchmark_results(rows)
+
+    output_dir = Path(output_dir)
+    json_path = output_dir / f"model_benchmark_scaling-{name}.json"
+    save_fits(json_path, fits)
+
+    summary = []
+    for model_name, model_fits in fits.items():
+        for fit in model_fits:
+            summary_row = {
+                "Model": model_name,
+                "Datatype": fit["Datatype"],
+                "Device": fit["Device"],
+                "Threads": fit["Threads"],
+                "BatchSize": fit["BatchSize"],
+                "TimeExponent": fit["time"]["exponent"],
+                "MemoryExponent": fit["memory"]["exponent"],
+            }
+            if args.memory_budget is not None:
+                max_pixels = get_max_pixels(fit["memory"], args.memory_budget)
+                summary_row["MaxPixels"] = max_pixels
+                # Largest square-equivalent side, as a reference for --max_forward_side
+                summary_row["MaxSide(1:1)"] = math.sqrt(max_pixels)
+            summary.append(summary_row)
+    pd.DataFrame(summary).round(3).to_csv(
+        output_dir / f"model_benchmark_scaling-{name}.csv", index=False
+    )
+    logger.info("Saved the resolution scaling fits at: {}", json_path)
+
+
+def _get_breakdown_df(
+    breakdown_results: List[Dict[str, Any]],
+    model_name: str,
+    dtype_str: str,
+    device_type: str,
+    num_threads: int,
+    batch_size: int,
+    input_size: Tuple[int, int],
+) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Model": model_name,
+            "Datatype": dtype_str,
+            "Device": device_type,
+            "Threads": num_threads,
+            "BatchSize": batch_size,
+            "InputH": input_size[0],
+            "InputW": input_size[1],
+            "Stage": [r["stage"] for r in breakdown_results],
+            "Calls": [r["calls"] for r in breakdown_results],
+            "Time(ms)": [r["time"] for r in breakdown_results],
+            "Time(%)": [100 * r["time_fraction"] for r in breakdown_results],
+            "PeakMemory(MB)": [r["peak_memory"] / 1024**2 for r in breakdown_results],
+            "Activations(MB)": [r["activations"] / 1024**2 for r in breakdown_results],
+            "FLOPs(G)": [r["flops"] / 1e9 for r in breakdown_results],
+        }
+    )
+
+
+def save_breakdown_plot(
+    output_dir: Union[str, Path], name: str, breakdown_df: pd.DataFrame
+) -> None:
+    """Create a bar plot with the time of each stage of the models and save to disk.
+
+    Parameters
+    ----------
+    output_dir : Union[str, Path]
+        Path to the directory where the plot will be saved.
+    name : str
+        Used just to name the resulting file.
+    breakdown_df : pd.DataFrame
+        A DataFrame with the stage results, as saved in model_benchmark_breakdown-<suffix>.csv.
+    """
+    df_tmp = breakdown_df[breakdown_df["Stage"] != "total"].copy()
+    df_tmp["Run"] = df_tmp["Model"] + "-" + df_tmp["Datatype"]
+    # The stages may be nested (e.g., the correlation inside the update block), so they are not stacked
+    fig = px.bar(
+        df_tmp,
+        x="Run",
+        y="Time(ms)",
+        color="Stage",
+        barmode="group",
+        hover_data=[
+            "Calls",
+            "Time(%)",
+            "PeakMemory(MB)",
+            "Activations(MB)",
+            "FLOPs(G)",
+        ],
+        title="Time of each stage",
+    )
+    out_path = Path(output_dir) / f"benchmark_breakdown-{name}.html"
+    fig.write_html(out_path)
+    logger.info("Saved the stage breakdown plot at: {}", out_path)
+
+
 def _show_v04_warning():
     ignore_args = ["-h", "--help", "--model", "--config", "--all", "--select"]
     for arg in ignore_args:
@@ -583,8 +1491,10 @@ if __name__ == "__main__":
         auto_configure_optimizers=False,
     )
 
+    cfg = cli.config
+
     device_handle = None
-    if pynvml is not None:
+    if pynvml is not None and cfg.device != "cpu":
         try:
             device_id = int(os.environ["CUDA_VISIBLE_DEVICES"])
         except (KeyError, ValueError):
@@ -593,8 +1503,6 @@ if __name__ == "__main__":
         pynvml.nvmlInit()
         device_handle = pynvml.nvmlDeviceGetHandleByIndex(device_id)
 
-    cfg = cli.config
-
     if cfg.csv_path is None:
         df = benchmark(cfg, device_handle)
     else:
@@ -0,0 +1,283 @@
+"""Export models to ONNX, check their numerical parity with PyTorch and measure their ONNX Runtime latency on CPU."""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from pathlib import Path
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from jsonargparse import ArgumentParser, Namespace
+from loguru import logger
+import pandas as pd
+import torch
+from tqdm import tqdm
+import yaml
+
+import ptlflow
+from ptlflow.utils.export_utils import (
+    benchmark_onnx,
+    check_onnx_parity,
+    create_onnx_session,
+    export_onnx,
+    prepare_model_for_export,
+)
+from ptlflow.utils.lightning.ptlflow_cli import PTLFlowCLI
+from ptlflow.utils.registry import RegisteredModel
+
+
+def _init_parser() -> ArgumentParser:
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="If set, export all available models.",
+    )
+    parser.add_argument(
+        "--select",
+        type=str,
+        nargs="+",
+        default=None,
+        help="The select mode can be used to export multiple models at once. Put a list of model names here separated by spaces.",
+    )
+    parser.add_argument(
+        "--exclude",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Used in combination with --all. A list of model names that will not be exported.",
+    )
+    parser.add_argument(
+        "--ckpt_path",
+        type=str,
+        default=None,
+        help="Name of the pretrained weights or path to a ckpt file for the chosen model.",
+    )
+    parser.add_argument(
+        "--input_size",
+        type=int,
+        nargs=2,
+        default=[384, 1280],
+        help="Size (height, width) of the input used for the export.",
+    )
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument(
+        "--iters",
+        type=int,
+        default=None,
+        help=(
+            "Number of refinement iterations fixed in the exported graph, for models that have an iters argument. "
+            "If not set, the default of each model is used."
+        ),
+    )
+    parser.add_argument(
+        "--dynamic_axes",
+        action="store_true",
+        help="If set, the batch, height and width axes of the exported model are dynamic.",
+    )
+    parser.add_argument("--opset_version", type=int, default=17)
+    parser.add_argument(
+        "--parity_atol",
+        type=float,
+        default=1e-2,
+        help="Maximum EPE between the PyTorch and ONNX Runtime predictions for the export to be considered correct.",
+    )
+    parser.add_argument(
+        "--num_samples",
+        type=int,
+        default=10,
+        help="Number of forwards used to measure the latency.",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="Number of CPU threads used by PyTorch and ONNX Runtime. If not set, the defaults of each library are used.",
+    )
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        default="outputs/export",
+        help="Path to the folder where the exported models and the report will be saved.",
+    )
+    return parser
+
+
+def export(args: Namespace) -> pd.DataFrame:
+    """Export all the chosen models and create the report.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments for configuring the export.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame with the export status, parity and latency of each model.
+    """
+    output_path = Path(args.output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    model_args = args
+    if args.all:
+        model_names = ptlflow.get_model_names()
+        model_args = None
+        output_suffix = "all"
+    elif args.select is not None and len(args.select) > 0:
+        model_names = args.select
+        model_args = None
+        output_suffix = "select"
+    else:
+        model_names = [args.model.class_path.split(".")[-1]]
+        output_suffix = model_names[0]
+
+    exclude = [] if args.exclude is None else args.exclude
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    rows = []
+    for mname in tqdm(model_names):
+        if mname in exclude:
+            continue
+        rows.append(export_one_model(args, mname, model_args))
+        df = pd.DataFrame(rows).round(4)
+        df.to_csv(output_path / f"model_export-{output_suffix}.csv", index=False)
+    return df
+
+
+def export_one_model(
+    args: Namespace, mname: str, model_args: Optional[Namespace]
+) -> Dict[str, Any]:
+    """Export one model to ONNX and check it with ONNX Runtime.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments for configuring the export.
+    mname : str
+        Name of the model.
+    model_args : Optional[Namespace]
+        Arguments for the model, or None to use its defaults.
+
+    Returns
+    -------
+    Dict[str, Any]
+        One row of the report. The status is one of "ok", "parity_failed", "export_failed" or "runtime_failed".
+    """
+    row = {
+        "Model": mname,
+        "Status": "export_failed",
+        "ExportTime(s)": None,
+        "MaxAbsDiff": None,
+        "EPE": None,
+        "TorchTime(ms)": None,
+        "ORTTime(ms)": None,
+        "Error": None,
+    }
+    onnx_path = Path(args.output_path) / f"{mname}.onnx"
+    try:
+        model = ptlflow.get_model(mname, args.ckpt_path, model_args)
+        model = prepare_model_for_export(model, args.iters)
+        start = time.perf_counter()
+        export_onnx(
+            model,
+            onnx_path,
+            args.input_size,
+            args.batch_size,
+            args.dynamic_axes,
+            args.opset_version,
+        )
+        row["ExportTime(s)"] = time.perf_counter() - start
+
+        row["Status"] = "runtime_failed"
+        session = create_onnx_session(onnx_path, args.num_threads)
+        images = torch.rand(
+            args.batch_size, 2, 3, args.input_size[0], args.input_size[1]
+        )
+        parity = check_onnx_parity(model, session, images)
+        row["MaxAbsDiff"] = parity["max_abs_diff"]
+        row["EPE"] = parity["epe"]
+        row["Status"] = "ok" if row["EPE"] <= args.parity_atol else "parity_failed"
+
+        row["ORTTime(ms)"] = benchmark_onnx(
+            session, images.numpy(), num_samples=args.num_samples
+        )
+        row["TorchTime(ms)"] = _benchmark_torch(model, images, args.num_samples)
+    except Exception as e:  # noqa: B902
+        logger.warning("Export of model {} failed with exception {}", mname, e)
+        row["Error"] = str(e).split("\n")[0]
+    return row
+
+
+@torch.no_grad()
+def _benchmark_torch(
+    model: torch.nn.Module, images: torch.Tensor, num_samples: int
+) -> float:
+    model(images)
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        model(images)
+    return 1000 * (time.perf_counter() - start) / max(1, num_samples)
+
+
+def _show_v04_warning():
+    ignore_args = ["-h", "--help", "--model", "--config", "--all", "--select"]
+    for arg in ignore_args:
+        if arg in sys.argv:
+            return
+
+    logger.warning(
+        "Since v0.4, it is now necessary to inform the model using the --model argument. For example, use: python model_export.py --model rapidflow --ckpt_path things"
+    )
+
+
+if __name__ == "__main__":
+    _show_v04_warning()
+
+    parser = _init_parser()
+
+    is_export_list = False
+    if "--config" in sys.argv:
+        config_file_idx = sys.argv.index("--config") + 1
+        with open(sys.argv[config_file_idx], "r") as f:
+            config = yaml.safe_load(f)
+        if config["all"] or config["select"] is not None:
+            is_export_list = True
+
+    if "--all" in sys.argv or "--select" in sys.argv:
+        is_export_list = True
+
+    if is_export_list:
+        model_class = None
+        subclass_mode_model = False
+    else:
+        model_class = RegisteredModel
+        subclass_mode_model = True
+
+    cli = PTLFlowCLI(
+        model_class=model_class,
+        subclass_mode_model=subclass_mode_model,
+        parser_kwargs={"parents": [parser]},
+        run=False,
+        parse_only=False,
+        auto_configure_optimizers=False,
+    )
+
+    df = export(cli.config)
+    print(df.to_string(index=False))
+    print(f"Results saved to {cli.config.output_path}.")
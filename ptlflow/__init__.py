@@ -19,7 +19,8 @@
 __version__ = "0.4.2"
 
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import urlparse
 
 from jsonargparse import ArgumentParser, Namespace
 from loguru import logger
@@ -66,6 +67,7 @@ def get_model(
     model_name: str,
     ckpt_path: Optional[str] = None,
     args: Optional[Namespace] = None,
+    use_cache: bool = False,
 ) -> BaseModel:
     """Return an instance of a chosen model.
 
@@ -84,6 +86,10 @@ def get_model(
         Name of the pretrained weight to load or a path to a local checkpoint file.
     args : Optional[Namespace], optional
         Some arguments that ill be provided to the model.
+    use_cache : bool, default False
+        If True, the instance is taken from the process-level model cache, and it is only created if it is not cached
+        yet. Note that the same instance is returned for the same inputs, so changes made to it are seen by later
+        callers. See ptlflow.utils.model_cache.ModelCache for more details.
 
     Returns
     -------
@@ -101,6 +107,11 @@ def get_model(
     --------
     get_model_reference : To get a reference to the class of a model.
     """
+    if use_cache:
+        from ptlflow.utils.model_cache import get_default_model_cache
+
+        return get_default_model_cache().get(model_name, ckpt_path, args)
+
     model_ref = get_model_reference(model_name)
     if args is None:
         parser = ArgumentParser()
@@ -198,7 +209,12 @@ def get_ptlflow_trained_model_names() -> List[str]:
     return _ptlflow_trained_models
 
 
-def load_checkpoint(ckpt_path: str, model_ref: BaseModel) -> Dict[str, Any]:
+def load_checkpoint(
+    ckpt_path: str,
+    model_ref: BaseModel,
+    map_location: Optional[Union[str, torch.device]] = None,
+    mmap: bool = True,
+) -> Dict[str, Any]:
     """Try to load the checkpoint specified in ckpt_path.
 
     Parameters
@@ -207,6 +223,13 @@ def load_checkpoint(ckpt_path: str, model_ref: BaseModel) -> Dict[str, Any]:
         Path to a local file or name of a pretrained checkpoint.
     model_ref : BaseModel
         A reference to the model class. See the function get_model_reference() for more details.
+    map_location : Optional[Union[str, torch.device]], optional
+        Where to load the checkpoint tensors. If None, the tensors are loaded to cuda, if it is available, or to the cpu
+        otherwise.
+    mmap : bool, default True
+        If True, the checkpoint file is memory-mapped, instead of being fully read into memory. The tensors are then only
+        read from the disk when they are accessed. Checkpoints saved with the legacy (non-zip) format are always fully
+        loaded.
 
     Returns
     -------
@@ -233,22 +256,55 @@ def load_checkpoint(ckpt_path: str, model_ref: BaseModel) -> Dict[str, Any]:
             f"Cannot find checkpoint {ckpt_path} for model {model_ref.__name__}"
         )
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if map_location is None:
+        map_location = "cuda" if torch.cuda.is_available() else "cpu"
+    map_location = torch.device(map_location)
 
-    if Path(ckpt_path).exists():
-        ckpt = torch.load(
-            ckpt_path, map_location=torch.device(device), weights_only=True
+    if not Path(ckpt_path).exists():
+        ckpt_path = _download_checkpoint(ckpt_path)
+
+    return _load_checkpoint_file(ckpt_path, map_location, mmap)
+
+
+def _download_checkpoint(url: str) -> Path:
+    model_dir = Path(hub.get_dir()) / "checkpoints"
+    model_dir.mkdir(parents=True, exist_ok=True)
+    filename = Path(urlparse(url).path).name
+    cached_path = model_dir / filename
+    if not cached_path.exists():
+        logger.info("Downloading: {} to {}", url, cached_path)
+        hash_match = hub.HASH_REGEX.search(filename)
+        hash_prefix = hash_match.group(1) if hash_match else None
+        hub.download_url_to_file(
+            url, str(cached_path), hash_prefix=hash_prefix, progress=True
         )
-    else:
-        model_dir = Path(hub.get_dir()) / "checkpoints"
-        ckpt = hub.load_state_dict_from_url(
-            ckpt_path,
-            model_dir=model_dir,
-            map_location=torch.device(device),
-            check_hash=True,
-            weights_only=True,
+    return cached_path
+
+
+def _load_checkpoint_file(
+    ckpt_path: Union[str, Path], map_location: torch.device, mmap: bool
+) -> Dict[str, Any]:
+    if str(ckpt_path).endswith(".safetensors"):
+        try:
+            from safetensors.torch import load_file
+        except ImportError:
+            logger.error(
+                "safetensors is required to load {}. Install it with: pip install safetensors",
+                ckpt_path,
+            )
+            raise
+        state_dict = load_file(str(ckpt_path), device=str(map_location))
+        return {"state_dict": state_dict}
+
+    try:
+        return torch.load(
+            ckpt_path, map_location=map_location, weights_only=True, mmap=mmap
         )
-    return ckpt
+    except RuntimeError:
+        if not mmap:
+            raise
+        # Checkpoints saved with the legacy serialization format cannot be memory-mapped
+        return torch.load(ckpt_path, map_location=map_location, weights_only=True)
 
 
 def restore_model(model, ckpt_path):
@@ -267,7 +323,9 @@ def restore_model(model, ckpt_path):
         An instance of the restored model.
     """
     if ckpt_path is not None:
-        ckpt = load_checkpoint(ckpt_path, model.__class__)
+        # The checkpoint is memory-mapped on the cpu, so only the tensors in the state_dict are read from the disk, and
+        # they are copied directly into the parameters of the model, on whichever device the model already is.
+        ckpt = load_checkpoint(ckpt_path, model.__class__, map_location="cpu")
 
         state_dict = ckpt["state_dict"]
         if "hyper_parameters" in ckpt:
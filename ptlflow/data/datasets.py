@@ -18,6 +18,7 @@
 
 import math
 from pathlib import Path
+import time
 from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import cv2 as cv
@@ -26,8 +27,8 @@ from loguru import logger
 import numpy as np
 import torch
 import torch.nn.functional as F
-from torch.utils.data import Dataset
-from ptlflow.utils import flow_utils
+from torch.utils.data import Dataset, get_worker_info
+from ptlflow.utils import dummy_datasets, flow_utils
 
 THIS_DIR = Path(__file__).resolve().parent
 
@@ -65,8 +66,14 @@ class BaseFlowDataset(Dataset):
         Backward motion boundary mask paths, read mb_paths and flow_b_paths above.
     metadata : list[Any]
         Some metadata for each input. It can include anything. A good recommendation would be to put a dict with the metadata.
+    record_timings : bool
+        If True, each input also contains a 'timings' dict with the time spent reading the files and applying the
+        transform, and the id of the worker that loaded it. It is used by ptlflow.utils.callbacks.stall_monitor. This is a
+        class attribute, so that it can be enabled before the datasets and their workers are created.
     """
 
+    record_timings = False
+
     def __init__(
         self,
         dataset_name: str,
@@ -143,9 +150,10 @@ class BaseFlowDataset(Dataset):
             size, but rather to the number of images of a given key. For example, typically 'images' will have N=2, and
             'flows' will have N=1, and so on. Therefore, a batch of these inputs will be a 5D tensor BNCHW.
         """
+        read_start = time.perf_counter() if self.record_timings else None
         inputs = {}
 
-        inputs["images"] = [cv.imread(str(path)) for path in self.img_paths[index]]
+        inputs["images"] = [self._read_image(path) for path in self.img_paths[index]]
 
         if index < len(self.flow_paths):
             inputs["flows"], valids = self._get_flows_and_valids(
@@ -201,9 +209,13 @@ class BaseFlowDataset(Dataset):
                     for path in self.mb_b_paths[index]
                 ]
 
+        transform_start = time.perf_counter() if self.record_timings else None
         if self.transform is not None:
             inputs = self.transform(inputs)
 
+        if self.record_timings:
+            self._add_timings(inputs, read_start, transform_start)
+
         if self.get_meta:
             inputs["meta"] = {
                 "dataset_name": self.dataset_name,
@@ -226,11 +238,11 @@ class BaseFlowDataset(Dataset):
         valids = []
         for path in flow_paths:
             if self.is_two_file_flow:
-                flow_x = -flow_utils.flow_read(path[0], format=flow_format)
-                flow_y = -flow_utils.flow_read(path[1], format=flow_format)
+                flow_x = -self._read_flow(path[0], flow_format)
+                flow_y = -self._read_flow(path[1], flow_format)
                 flow = np.stack([flow_x, flow_y], 2)
             else:
-                flow = flow_utils.flow_read(path, format=flow_format)
+                flow = self._read_flow(path, flow_format)
 
             nan_mask = np.isnan(flow)
             flow[nan_mask] = self.max_flow + 1
@@ -246,6 +258,24 @@ class BaseFlowDataset(Dataset):
             flows.append(flow)
         return flows, valids
 
+    def _add_timings(
+        self, inputs: Dict[str, torch.Tensor], read_start: float, transform_start: float
+    ) -> None:
+        worker_info = get_worker_info()
+        inputs["timings"] = {
+            "read": transform_start - read_start,
+            "transform": time.perf_counter() - transform_start,
+            "worker_id": 0 if worker_info is None else worker_info.id,
+        }
+
+    def _read_image(self, path: Union[str, Path]) -> np.ndarray:
+        return cv.imread(str(path))
+
+    def _read_flow(
+        self, path: Union[str, Path], flow_format: Optional[str] = None
+    ) -> np.ndarray:
+        return flow_utils.flow_read(path, format=flow_format)
+
     def _log_status(self) -> None:
         if self.__len__() == 0:
             logger.warning(
@@ -1877,6 +1907,7 @@ class SpringDataset(BaseFlowDataset):
             size, but rather to the number of images of a given key. For example, typically 'images' will have N=2, and
             'flows' will have N=1, and so on. Therefore, a batch of these inputs will be a 5D tensor BNCHW.
         """
+        read_start = time.perf_counter() if self.record_timings else None
         inputs = {}
 
         inputs["images"] = [cv.imread(str(path)) for path in self.img_paths[index]]
@@ -1894,6 +1925,7 @@ class SpringDataset(BaseFlowDataset):
                 if self.get_valid_mask:
                     inputs["valids_b"] = valids_b
 
+        transform_start = time.perf_counter() if self.record_timings else None
         if self.subsample:
             inputs["flows"] = [f[::2, ::2] for f in inputs["flows"]]
             inputs["valids"] = [v[::2, ::2] for v in inputs["valids"]]
@@ -1953,6 +1985,9 @@ class SpringDataset(BaseFlowDataset):
                     )
                     inputs["valids_b"] = inputs["valids_b"][:, :, ::2, ::2]
 
+        if self.record_timings:
+            self._add_timings(inputs, read_start, transform_start)
+
         if self.get_meta:
             inputs["meta"] = {
                 "dataset_name": self.dataset_name,
@@ -2648,3 +2683,114 @@ class ViperDataset(BaseFlowDataset):
                     raise NotImplementedError()
 
         self._log_status()
+
+
+class SyntheticFlowDataset(BaseFlowDataset):
+    """Generate realistic-size synthetic samples, to benchmark the data loading pipeline without downloading a dataset.
+
+    The samples are created by ptlflow.utils.dummy_datasets.generate_synthetic_sample. They can either be written to disk,
+    in which case they are read by the same code used by the real datasets, or be kept decoded in memory, which removes the
+    cost of reading and decoding the files and leaves only the transforms.
+    """
+
+    def __init__(
+        self,
+        num_samples: int = 16,
+        img_size: Tuple[int, int] = (436, 1024),
+        flow_format: str = "flo",
+        sparse_density: Optional[float] = None,
+        root_dir: Optional[Union[str, Path]] = None,
+        seed: int = 0,
+        transform: Callable[[Dict[str, torch.Tensor]], Dict[str, torch.Tensor]] = None,
+        max_flow: float = 10000.0,
+        get_valid_mask: bool = True,
+        get_meta: bool = True,
+    ) -> None:
+        """Initialize SyntheticFlowDataset.
+
+        Parameters
+        ----------
+        num_samples : int, default 16
+            Number of image pairs.
+        img_size : Tuple[int, int], default (436, 1024)
+            The (height, width) of the samples.
+        flow_format : str, default "flo"
+            The format of the flow files. It can be one of {'flc', 'flo', 'flo5', 'npz', 'pfm', 'png'}. Only used when
+            root_dir is provided.
+        sparse_density : Optional[float], optional
+            If provided, only this fraction of the flow pixels is valid, as in KITTI.
+        root_dir : Optional[Union[str, Path]], optional
+            Path to the directory where the samples will be written. If None, the samples are kept in memory.
+        seed : int, default 0
+            Seed used to generate the samples.
+        transform : Callable[[Dict[str, torch.Tensor]], Dict[str, torch.Tensor]], optional
+            Transform to be applied on the inputs.
+        max_flow : float, default 10000.0
+            Maximum optical flow absolute value. Flow absolute values that go over this limit are clipped, and also marked
+            as zero in the valid mask.
+        get_valid_mask : bool, default True
+            Whether to get or generate valid masks.
+        get_meta : bool, default True
+            Whether to get metadata.
+        """
+        super().__init__(
+            dataset_name="Synthetic",
+            split_name=flow_format if root_dir is not None else "memory",
+            transform=transform,
+            max_flow=max_flow,
+            get_valid_mask=get_valid_mask,
+            get_occlusion_mask=False,
+            get_motion_boundary_mask=False,
+            get_backward=False,
+            get_meta=get_meta,
+        )
+        self.root_dir = root_dir
+        self.sequence_length = 2
+
+        self.memory = None
+        if root_dir is None:
+            self.memory = {}
+            rng = np.random.default_rng(seed)
+            for i in range(num_samples):
+                img1, img2, flow = dummy_datasets.generate_synthetic_sample(
+                    img_size, sparse_density=sparse_density, rng=rng
+                )
+                self.memory[f"{i:06d}_img1"] = img1
+                self.memory[f"{i:06d}_img2"] = img2
+                self.memory[f"{i:06d}_flow"] = flow
+                self.img_paths.append([f"{i:06d}_img1", f"{i:06d}_img2"])
+                self.flow_paths.append([f"{i:06d}_flow"])
+        else:
+            self.img_paths, self.flow_paths = dummy_datasets.write_synthetic(
+                root_dir,
+                num_samples,
+                img_size,
+                flow_format,
+                sparse_density=sparse_density,
+                seed=seed,
+            )
+            self.flow_format = dummy_datasets.SYNTHETIC_FLOW_FORMATS[flow_format][1]
+
+        self.metadata = [
+            {
+                "image_paths": [str(p) for p in paths],
+                "is_val": False,
+                "misc": "",
+                "is_seq_start": True,
+            }
+            for paths in self.img_paths
+        ]
+
+        self._log_status()
+
+    def _read_image(self, path: Union[str, Path]) -> np.ndarray:
+        if self.memory is None:
+            return super()._read_image(path)
+        return self.memory[path].copy()
+
+    def _read_flow(
+        self, path: Union[str, Path], flow_format: Optional[str] = None
+    ) -> np.ndarray:
+        if self.memory is None:
+            return super()._read_flow(path, flow_format)
+        return self.memory[path].copy()
@@ -14,11 +14,12 @@
 # limitations under the License.
 # =============================================================================
 
-from typing import Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
 import lightning.pytorch as pl
 from loguru import logger
-from torch.utils.data import DataLoader, Dataset
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler, default_collate
 import yaml
 
 from ptlflow.data import flow_transforms as ft
@@ -37,7 +38,89 @@ from ptlflow.data.datasets import (
     TartanAirDataset,
     ViperDataset,
 )
-from ptlflow.utils.utils import make_divisible
+from ptlflow.utils.utils import ShapeBuckets, get_image_resizer, make_divisible
+
+
+class BucketPadCollate(object):
+    """Collate samples of different sizes by padding them to the canvas of their shape bucket.
+
+    Images are padded by replication, while all other tensors (flows, valids, occlusions, etc.) are padded with zeros.
+    Therefore, the padded area is never valid and the metrics are not affected by the padding. The original size of each
+    sample is stored in meta["orig_size"] as (height, width).
+    """
+
+    def __init__(self, shape_buckets: ShapeBuckets, stride: int = 1) -> None:
+        """Initialize BucketPadCollate.
+
+        Parameters
+        ----------
+        shape_buckets : ShapeBuckets
+            The policy used to choose the canvas size of each batch.
+        stride : int, default 1
+            The canvas size is rounded up to be divisible by this value.
+        """
+        self.shape_buckets = shape_buckets
+        self.stride = stride
+
+    def __call__(self, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        max_height = max([s["images"].shape[-2] for s in samples])
+        max_width = max([s["images"].shape[-1] for s in samples])
+        bucket_size = self.shape_buckets((max_height, max_width), self.stride)
+        for s in samples:
+            orig_size = tuple(s["images"].shape[-2:])
+            for k, v in s.items():
+                if isinstance(v, torch.Tensor) and tuple(v.shape[-2:]) == orig_size:
+                    padder = get_image_resizer(
+                        orig_size,
+                        size=bucket_size,
+                        resize_mode="pad",
+                        pad_mode="replicate" if k.startswith("image") else "constant",
+                    )
+                    s[k] = padder.fill(v)
+            if "meta" in s:
+                s["meta"]["orig_size"] = orig_size
+        return default_collate(samples)
+
+
+class SequenceLaneBatchSampler(Sampler[List[int]]):
+    """Batch sampler that assigns whole sequences to fixed positions of the batch, called lanes.
+
+    Each lane receives the frames of its sequences in order, so models with warm start can keep one previous prediction
+    per lane and evaluate with batch size larger than one. The sequences are assigned to the lanes by length, always to
+    the lane with the fewest frames, and the lanes are sorted from the longest to the shortest. When some lanes run out of
+    frames, the batches become smaller, but the remaining lanes keep their positions: lane b is always at index b.
+
+    The sequence boundaries are given by the is_seq_start metadata of the samples. A sample without metadata is
+    considered to be the start of a new sequence.
+    """
+
+    def __init__(self, is_seq_start: Sequence[bool], batch_size: int) -> None:
+        """Initialize SequenceLaneBatchSampler.
+
+        Parameters
+        ----------
+        is_seq_start : Sequence[bool]
+            Whether each sample of the dataset is the first of a sequence.
+        batch_size : int
+            The maximum number of lanes.
+        """
+        sequences = []
+        for i, is_start in enumerate(is_seq_start):
+            if is_start or len(sequences) == 0:
+                sequences.append([])
+            sequences[-1].append(i)
+
+        self.lanes = [[] for _ in range(min(batch_size, len(sequences)))]
+        for seq in sorted(sequences, key=len, reverse=True):
+            min(self.lanes, key=len).extend(seq)
+        self.lanes = sorted(self.lanes, key=len, reverse=True)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        for t in range(len(self)):
+            yield [lane[t] for lane in self.lanes if len(lane) > t]
+
+    def __len__(self) -> int:
+        return len(self.lanes[0]) if len(self.lanes) > 0 else 0
 
 
 class FlowDataModule(pl.LightningDataModule):
@@ -52,6 +135,11 @@ class FlowDataModule(pl.LightningDataModule):
         train_crop_size: tuple[int, int] = None,
         train_transform_cuda: bool = False,
         train_transform_fp16: bool = False,
+        val_batch_size: int = 1,
+        val_bucket_multiple: Optional[int] = None,
+        val_bucket_sizes: Optional[list[tuple[int, int]]] = None,
+        eval_uint8_images: bool = False,
+        val_sequence_lanes: bool = False,
         autoflow_root_dir: Optional[str] = None,
         flying_chairs_root_dir: Optional[str] = None,
         flying_chairs2_root_dir: Optional[str] = None,
@@ -78,6 +166,11 @@ class FlowDataModule(pl.LightningDataModule):
         self.train_crop_size = train_crop_size
         self.train_transform_cuda = train_transform_cuda
         self.train_transform_fp16 = train_transform_fp16
+        self.val_batch_size = val_batch_size
+        self.val_bucket_multiple = val_bucket_multiple
+        self.val_bucket_sizes = val_bucket_sizes
+        self.eval_uint8_images = eval_uint8_images
+        self.val_sequence_lanes = val_sequence_lanes
 
         self.autoflow_root_dir = autoflow_root_dir
         self.flying_chairs_root_dir = flying_chairs_root_dir
@@ -222,22 +315,41 @@ class FlowDataModule(pl.LightningDataModule):
         dataloaders = []
         self.val_dataloader_names = []
         self.val_dataloader_lengths = []
+        collate_fn = None
+        if self.val_bucket_multiple is not None or self.val_bucket_sizes is not None:
+            collate_fn = BucketPadCollate(
+                ShapeBuckets(self.val_bucket_multiple, self.val_bucket_sizes),
+                stride=self._get_model_output_stride(),
+            )
         for parsed_vals in self.val_dataset_parsed:
             dataset_name = parsed_vals[1]
             dataset = getattr(self, f"_get_{dataset_name}_dataset")(
                 False, *parsed_vals[2:]
             )
-            dataloaders.append(
-                DataLoader(
-                    dataset,
-                    1,
-                    shuffle=False,
-                    num_workers=1,
-                    pin_memory=False,
-                    drop_last=False,
-                    persistent_workers=self.train_transform_cuda,
+            if self.val_sequence_lanes:
+                dataloaders.append(
+                    DataLoader(
+                        dataset,
+                        batch_sampler=self._get_sequence_lane_batch_sampler(dataset),
+                        num_workers=1,
+                        pin_memory=False,
+                        persistent_workers=self.train_transform_cuda,
+                        collate_fn=collate_fn,
+                    )
+                )
+            else:
+                dataloaders.append(
+                    DataLoader(
+                        dataset,
+                        self.val_batch_size,
+                        shuffle=False,
+                        num_workers=1,
+                        pin_memory=False,
+                        drop_last=False,
+                        persistent_workers=self.train_transform_cuda,
+                        collate_fn=collate_fn,
+                    )
                 )
-            )
 
             self.val_dataloader_names.append("-".join(parsed_vals[1:]))
             self.val_dataloader_lengths.append(len(dataset))
@@ -310,6 +422,22 @@ class FlowDataModule(pl.LightningDataModule):
         else:
             return 1
 
+    def _get_sequence_lane_batch_sampler(
+        self, dataset: Dataset
+    ) -> SequenceLaneBatchSampler:
+        metadata = getattr(dataset, "metadata", [])
+        if len(metadata) == len(dataset):
+            is_seq_start = [
+                m.get("is_seq_start", True) if isinstance(m, dict) else True
+                for m in metadata
+            ]
+        else:
+            is_seq_start = [True] * len(dataset)
+        return SequenceLaneBatchSampler(is_seq_start, self.val_batch_size)
+
+    def _get_eval_transform(self) -> ft.ToTensor:
+        return ft.ToTensor(uint8_keys=["images"] if self.eval_uint8_images else None)
+
     ###########################################################################
     # _get_datasets
     ###########################################################################
@@ -364,7 +492,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         split = "trainval"
         if len(args) > 0 and args[0] in ["train", "val", "trainval"]:
@@ -427,7 +555,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         dataset = FlyingChairsDataset(
             self.flying_chairs_root_dir, split=split, transform=transform
@@ -499,7 +627,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         dataset = FlyingChairs2Dataset(
             self.flying_chairs2_root_dir,
@@ -569,7 +697,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         dataset = Hd1kDataset(
             self.hd1k_root_dir,
@@ -637,7 +765,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         dataset = KittiDataset(
             self.kitti_2012_root_dir,
@@ -653,7 +781,7 @@ class FlowDataModule(pl.LightningDataModule):
         if is_train:
             raise NotImplementedError()
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         get_backward = False
         sequence_length = 2
@@ -740,7 +868,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         dataset = SintelDataset(
             self.mpi_sintel_root_dir,
@@ -1003,7 +1131,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         if len(side_names) == 0:
             side_names = ["left", "right"]
@@ -1084,7 +1212,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         dataset = TartanAirDataset(
             self.tartanair_root_dir,
@@ -1177,7 +1305,7 @@ class FlowDataModule(pl.LightningDataModule):
                 ]
             )
         else:
-            transform = ft.ToTensor()
+            transform = self._get_eval_transform()
 
         if is_subset:
             dataset = FlyingThings3DSubsetDataset(
@@ -1211,7 +1339,7 @@ class FlowDataModule(pl.LightningDataModule):
 
     def _get_middlebury_st_dataset(self, is_train: bool, *args: str) -> Dataset:
         assert not is_train
-        transform = ft.ToTensor()
+        transform = self._get_eval_transform()
 
         dataset = MiddleburySTDataset(
             self.middlebury_st_root_dir,
@@ -1221,7 +1349,7 @@ class FlowDataModule(pl.LightningDataModule):
 
     def _get_viper_dataset(self, is_train: bool, *args: str) -> Dataset:
         assert not is_train
-        transform = ft.ToTensor()
+        transform = self._get_eval_transform()
 
         dataset = ViperDataset(
             self.viper_root_dir,
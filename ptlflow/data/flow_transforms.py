@@ -72,7 +72,8 @@ class Compose(object):
 class ToTensor(object):
     """Converts a 4D numpy.ndarray or a list of 3D numpy.ndarrays into a 4D torch.Tensor.
 
-    If an input is of type uint8, then it is converted to float and its values are divided by 255.
+    If an input is of type uint8, then it is converted to float and its values are divided by 255, unless its key is in
+    uint8_keys.
     """
 
     def __init__(
@@ -81,6 +82,7 @@ class ToTensor(object):
         device: Union[str, torch.device] = "cpu",
         use_keys: Optional[Union[KeysView, Sequence[str]]] = None,
         ignore_keys: Optional[Union[KeysView, Sequence[str]]] = None,
+        uint8_keys: Optional[Union[KeysView, Sequence[str]]] = None,
     ) -> None:
         """Initialize ToTensor.
 
@@ -95,11 +97,16 @@ class ToTensor(object):
             except the keys that are listed in ignore_keys.
         ignore_keys : Optional[Union[KeysView, Sequence[str]]], optional
             If use_keys is None, the these keys are NOT transformed by this operation.
+        uint8_keys : Optional[Union[KeysView, Sequence[str]]], optional
+            The uint8 inputs with these keys are kept as uint8 tensors, with values in [0, 255]. This reduces the memory
+            used by the batches and the amount of data transferred to the device. The models convert uint8 images to
+            float on the device (see ptlflow.models.base_model.base_model.BaseModel.preprocess_images).
         """
         self.dtype = torch.float16 if fp16 else torch.float32
         self.device = device
         self.use_keys = use_keys
         self.ignore_keys = ignore_keys
+        self.uint8_keys = [] if uint8_keys is None else uint8_keys
 
     def __call__(
         self, inputs: Dict[str, Union[np.ndarray, Sequence[np.ndarray]]]
@@ -129,9 +136,14 @@ class ToTensor(object):
             elif len(v.shape) == 3:
                 v = v[None]
 
+            v = v.transpose(0, 3, 1, 2)
+            if v.dtype == np.uint8 and k in self.uint8_keys:
+                inputs[k] = torch.from_numpy(np.ascontiguousarray(v)).to(
+                    device=self.device
+                )
+                continue
             if v.dtype == np.uint8:
                 v = v.astype(np.float32) / 255.0
-            v = v.transpose(0, 3, 1, 2)
             inputs[k] = torch.from_numpy(v).to(device=self.device, dtype=self.dtype)
         return inputs
 
@@ -24,7 +24,7 @@ In order to use this module, the concrete model should just need to:
 
 from abc import abstractmethod
 import math
-from typing import Any, Callable, Dict, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import lightning.pytorch as pl
 from loguru import logger
@@ -33,8 +33,14 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 
-from ptlflow.utils.utils import InputPadder, InputScaler
-from ptlflow.utils.utils import bgr_val_as_tensor
+from ptlflow.utils.compile_utils import compile_model
+from ptlflow.utils.fusion import fuse_for_inference
+from ptlflow.utils.utils import InputPadder, InputScaler, ShapeBuckets
+from ptlflow.utils.utils import (
+    bgr_val_as_tensor,
+    get_image_resizer,
+    images_to_float,
+)
 from ptlflow.utils.flow_metrics import FlowMetrics
 
 DATASET_MAIN_METRIC = {
@@ -62,6 +68,17 @@ DATASET_MAIN_METRIC = {
 class BaseModel(pl.LightningModule):
     """A base abstract optical flow model."""
 
+    # Names of the submodules or methods that must run in fp32 when the model is used with autocast.
+    # See ptlflow.utils.precision.apply_fp32_policy.
+    fp32_submodules: Tuple[str, ...] = ()
+    # Names of the submodules that are compiled when use_compile is True. See ptlflow.utils.compile_utils.compile_model.
+    compile_submodules: Tuple[str, ...] = ()
+    # Names of the submodules that are quantized to INT8 for CPU inference. See ptlflow.utils.quantization.quantize_model.
+    quantize_submodules: Tuple[str, ...] = ()
+    # Whether inputs["images"] is only used through preprocess_images, which normalizes uint8 images on the device. For the
+    # other models, uint8 images are converted to float before the forward.
+    supports_uint8_images: bool = False
+
     def __init__(
         self,
         output_stride: int,
@@ -70,6 +87,9 @@ class BaseModel(pl.LightningModule):
         wdecay: Optional[float] = None,
         warm_start: bool = False,
         metric_interpolate_pred_to_target_size: bool = False,
+        bucket_multiple: Optional[int] = None,
+        bucket_sizes: Optional[List[Tuple[int, int]]] = None,
+        use_compile: bool = False,
     ) -> None:
         """Initialize BaseModel.
 
@@ -88,6 +108,17 @@ class BaseModel(pl.LightningModule):
             If True, use warm start to initialize the flow prediction. The warm_start strategy was presented by the RAFT method and forward interpolates the prediction from the last frame.
         metric_interpolate_pred_to_target_size : bool, default False
             If True, the prediction is bilinearly interpolated to match the target size during metric calculation, if their sizes are different.
+        bucket_multiple : Optional[int], default None
+            If provided, the inputs are resized to a canvas whose height and width are multiples of this value (e.g., 64 or 128),
+            instead of the closest multiple of output_stride. Using a few fixed canvas shapes allows the same kernels to be reused
+            for inputs of different sizes. See ptlflow.utils.utils.ShapeBuckets.
+        bucket_sizes : Optional[List[Tuple[int, int]]], default None
+            A list of fixed canvas sizes (height, width). Each input is resized to the smallest canvas that contains it.
+            Inputs that do not fit in any canvas fall back to bucket_multiple, or to output_stride.
+        use_compile : bool, default False
+            If True, the submodules listed in compile_submodules are compiled with torch.compile before the first forward.
+            They are specialized to static shapes, so using it together with bucket_multiple or bucket_sizes limits the
+            number of compilations. See ptlflow.utils.compile_utils.compile_model.
         """
         super(BaseModel, self).__init__()
 
@@ -99,6 +130,25 @@ class BaseModel(pl.LightningModule):
         self.metric_interpolate_pred_to_target_size = (
             metric_interpolate_pred_to_target_size
         )
+        self.bucket_multiple = bucket_multiple
+        self.bucket_sizes = bucket_sizes
+
+        self.shape_buckets = None
+        if bucket_multiple is not None or bucket_sizes is not None:
+            self.shape_buckets = ShapeBuckets(bucket_multiple, bucket_sizes)
+
+        self.use_compile = use_compile
+        self._compile_hook_handle = None
+        if use_compile:
+            # The submodules do not exist yet, so they are compiled when the model is called for the first time
+            self._compile_hook_handle = self.register_forward_pre_hook(
+                _compile_pre_hook
+            )
+
+        # Images given as uint8 are converted to float before the forward, unless supports_uint8_images is True
+        self.register_forward_pre_hook(_uint8_images_pre_hook)
+        # Cache of the normalization constants used by preprocess_images
+        self._preprocess_constants = {}
 
         self.train_size = None
         self.train_avg_length = None
@@ -142,6 +192,41 @@ class BaseModel(pl.LightningModule):
             self.extra_params = {}
         self.extra_params[name] = value
 
+    def fuse_for_inference(
+        self,
+        inputs: Optional[Dict[str, torch.Tensor]] = None,
+        input_size: Tuple[int, int] = (384, 512),
+        max_epe: float = 1e-2,
+    ) -> Dict[str, int]:
+        """Simplify the model for inference by folding and removing layers that are not needed after training.
+
+        BatchNorm layers are folded into the preceding convolutions, submodules that define their own fuse_for_inference()
+        merge their weights, and Dropout and DropPath are removed. The model is modified in place and set to eval mode,
+        so it should not be trained after this call. If the fused model does not produce the same outputs as before,
+        all the changes are reverted. See ptlflow.utils.fusion.fuse_for_inference.
+
+        Parameters
+        ----------
+        inputs : Optional[Dict[str, torch.Tensor]], optional
+            Sample inputs for the forward passes used to find the layers to fuse and to check the outputs. If None, random
+            images of size input_size are used.
+        input_size : Tuple[int, int], default (384, 512)
+            The (height, width) of the random images, when inputs is None.
+        max_epe : float, default 1e-2
+            Maximum average end-point-error between the flows predicted before and after the fusion.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of fused submodules, folded BatchNorm layers and removed dropouts.
+        """
+        if inputs is None:
+            device = next(self.parameters()).device
+            inputs = {"images": torch.rand(1, 2, 3, *input_size, device=device)}
+        counts = fuse_for_inference(self, inputs, max_epe)
+        self.prev_preds = None
+        return counts
+
     def preprocess_images(
         self,
         images: torch.Tensor,
@@ -166,12 +251,17 @@ class BaseModel(pl.LightningModule):
         1. images = images + bgr_add
         2. images = images * bgr_mult
         3. (optional) Convert BGR channels to RGB
-        4. Pad or resize the input to the closest larger size multiple of self.output_stride
+        4. Pad or resize the input to the closest larger size multiple of self.output_stride, or to the canvas chosen by
+           self.shape_buckets, if it is set.
+
+        Steps 1 to 3 are computed by a single multiply-add. If the images are uint8, with values in [0, 255], the division by
+        255 is also folded into it, so the images are converted to float directly on the device.
 
         Parameters
         ----------
         images : torch.Tensor
-            A tensor with at least 3 dimensions in this order: [..., 3, H, W].
+            A tensor with at least 3 dimensions in this order: [..., 3, H, W]. It can be either float, with values in
+            [0, 1], or uint8, with values in [0, 255].
         bgr_add : Union[float, Tuple[float, float, float], np.ndarray, torch.Tensor], default 0
             BGR values to be added to the images. It can be a single value, a triple, or a tensor with a shape compatible with images.
         bgr_mult : Union[float, Tuple[float, float, float], np.ndarray, torch.Tensor], default 1
@@ -180,7 +270,8 @@ class BaseModel(pl.LightningModule):
             If True, flip the channels to convert from BGR to RGB.
         image_resizer : Optional[Union[InputPadder, InputScaler]]
             An instance of InputPadder or InputScaler that will be used to resize the images.
-            If not provided, a new one will be created based on the given resize_mode.
+            If not provided, one will be obtained based on the given resize_mode. Resizers are cached, so inputs with the same
+            size share the same instance.
         resize_mode : str, default "pad"
             How to resize the input. Accepted values are "pad" and "interpolation".
         target_size : Optional[Tuple[int, int]], default None
@@ -204,48 +295,83 @@ class BaseModel(pl.LightningModule):
             An instance of InputPadder or InputScaler that was used to resize the images.
             Can be used to reverse the resizing operations.
         """
-        bgr_add = bgr_val_as_tensor(
-            bgr_add, reference_tensor=images, bgr_tensor_shape_position=-3
+        # (x * input_scale + bgr_add) * bgr_mult = x * scale + shift
+        scale, shift = self._get_preprocess_constants(
+            images, bgr_add, bgr_mult, bgr_to_rgb
         )
-        images = images + bgr_add
-        bgr_mult = bgr_val_as_tensor(
-            bgr_mult, reference_tensor=images, bgr_tensor_shape_position=-3
-        )
-        images *= bgr_mult
         if bgr_to_rgb:
+            # The constants are already flipped, so the flip can be done before the conversion to float
             images = torch.flip(images, [-3])
+        images = torch.addcmul(shift, images, scale)
 
         stride = self.output_stride if stride is None else stride
+        if target_size is None and self.shape_buckets is not None:
+            target_size = self.shape_buckets(images.shape[-2:], stride)
         if target_size is not None:
             stride = None
 
         if image_resizer is None:
-            if resize_mode == "pad":
-                image_resizer = InputPadder(
-                    images.shape,
-                    stride=stride,
-                    size=target_size,
-                    pad_mode=pad_mode,
-                    two_side_pad=pad_two_side,
-                    pad_value=pad_value,
-                )
-            elif resize_mode == "interpolation":
-                image_resizer = InputScaler(
-                    images.shape,
-                    stride=stride,
-                    size=target_size,
-                    interpolation_mode=interpolation_mode,
-                    interpolation_align_corners=interpolation_align_corners,
-                )
-            else:
-                raise ValueError(
-                    f"resize_mode must be one of (pad, interpolation). Found: {resize_mode}."
-                )
+            image_resizer = get_image_resizer(
+                images.shape,
+                stride=stride,
+                size=target_size,
+                resize_mode=resize_mode,
+                pad_mode=pad_mode,
+                pad_value=pad_value,
+                pad_two_side=pad_two_side,
+                interpolation_mode=interpolation_mode,
+                interpolation_align_corners=interpolation_align_corners,
+            )
 
         images = image_resizer.fill(images)
         images = images.contiguous()
         return images, image_resizer
 
+    def _get_preprocess_constants(
+        self,
+        images: torch.Tensor,
+        bgr_add: Union[float, Tuple[float, float, float], np.ndarray, torch.Tensor],
+        bgr_mult: Union[float, Tuple[float, float, float], np.ndarray, torch.Tensor],
+        bgr_to_rgb: bool,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        is_uint8 = images.dtype == torch.uint8
+        dtype = _get_float_dtype(self) if is_uint8 else images.dtype
+        cache_key = None
+        if not isinstance(bgr_add, (torch.Tensor, np.ndarray)) and not isinstance(
+            bgr_mult, (torch.Tensor, np.ndarray)
+        ):
+            # Constant values given as numbers or sequences are cached, the tensors may change at every call
+            cache_key = (
+                tuple(bgr_add) if isinstance(bgr_add, (tuple, list)) else bgr_add,
+                tuple(bgr_mult) if isinstance(bgr_mult, (tuple, list)) else bgr_mult,
+                bgr_to_rgb,
+                is_uint8,
+                images.dim(),
+                images.device,
+                dtype,
+            )
+            if cache_key in self._preprocess_constants:
+                return self._preprocess_constants[cache_key]
+
+        reference = torch.empty((), dtype=dtype, device=images.device).expand(
+            images.shape
+        )
+        bgr_add = bgr_val_as_tensor(
+            bgr_add, reference_tensor=reference, bgr_tensor_shape_position=-3
+        ).to(dtype=dtype, device=images.device)
+        bgr_mult = bgr_val_as_tensor(
+            bgr_mult, reference_tensor=reference, bgr_tensor_shape_position=-3
+        ).to(dtype=dtype, device=images.device)
+        scale = bgr_mult / 255.0 if is_uint8 else bgr_mult
+        shift = bgr_add * bgr_mult
+        if bgr_to_rgb:
+            scale = torch.flip(scale, [-3])
+            shift = torch.flip(shift, [-3])
+
+        if cache_key is not None:
+            self._preprocess_constants[cache_key] = (scale, shift)
+        return scale, shift
+
     def postprocess_predictions(
         self,
         prediction: torch.Tensor,
@@ -393,7 +519,7 @@ class BaseModel(pl.LightningModule):
             self.val_dataset_names.append(None)
 
         if self.warm_start:
-            batch["prev_preds"] = self.prev_preds
+            batch["prev_preds"] = self._get_warm_start_prev_preds(batch)
 
         preds = self(batch)
         self.last_inputs = batch
@@ -419,13 +545,9 @@ class BaseModel(pl.LightningModule):
         )
 
         if self.warm_start:
-            if "is_seq_start" in batch["meta"] and batch["meta"]["is_seq_start"][0]:
-                self.prev_preds = None
-            else:
-                self.prev_preds = preds
-                for k, v in self.prev_preds.items():
-                    if isinstance(v, torch.Tensor):
-                        self.prev_preds[k] = v.detach()
+            self.prev_preds = {
+                k: v.detach() for k, v in preds.items() if isinstance(v, torch.Tensor)
+            }
 
         return {"preds": preds, "metrics": metrics}
 
@@ -471,20 +593,16 @@ class BaseModel(pl.LightningModule):
             When using multiple loaders, indicate from which loader this input is coming from.
         """
         if self.warm_start:
-            batch["prev_preds"] = self.prev_preds
+            batch["prev_preds"] = self._get_warm_start_prev_preds(batch)
 
         preds = self(batch)
         self.last_inputs = batch
         self.last_predictions = preds
 
         if self.warm_start:
-            if "is_seq_start" in batch["meta"] and batch["meta"]["is_seq_start"][0]:
-                self.prev_preds = None
-            else:
-                self.prev_preds = preds
-                for k, v in self.prev_preds.items():
-                    if isinstance(v, torch.Tensor):
-                        self.prev_preds[k] = v.detach()
+            self.prev_preds = {
+                k: v.detach() for k, v in preds.items() if isinstance(v, torch.Tensor)
+            }
 
         return preds
 
@@ -564,6 +682,48 @@ class BaseModel(pl.LightningModule):
             "lr_scheduler": {"scheduler": lr_scheduler, "interval": "step"},
         }
 
+    def _get_warm_start_prev_preds(
+        self, batch: Dict[str, Any]
+    ) -> Optional[Dict[str, torch.Tensor]]:
+        """Get the previous predictions to be used for the warm start of each sample of the batch.
+
+        Each position of the batch is a lane that receives the frames of its sequences in order (see
+        ptlflow.data.flow_datamodule.SequenceLaneBatchSampler). With batch size 1, this is the usual sequential
+        evaluation. The previous predictions of the lanes whose sample starts a new sequence (meta["is_seq_start"]) are
+        zeroed, which is the same as not using warm start, since the models use them as an initial flow offset.
+
+        Parameters
+        ----------
+        batch : Dict[str, Any]
+            The current batch.
+
+        Returns
+        -------
+        Optional[Dict[str, torch.Tensor]]
+            The previous predictions, or None if all the samples start a new sequence or if there are no previous
+            predictions for all the lanes.
+        """
+        if self.prev_preds is None:
+            return None
+
+        batch_size = batch["images"].shape[0]
+        is_seq_start = torch.zeros(batch_size, dtype=torch.bool)
+        if batch.get("meta") is not None and "is_seq_start" in batch["meta"]:
+            is_seq_start = torch.as_tensor(batch["meta"]["is_seq_start"]).bool().cpu()
+        if is_seq_start.all():
+            return None
+
+        prev_preds = {}
+        for k, v in self.prev_preds.items():
+            if v.shape[0] < batch_size:
+                return None
+            v = v[:batch_size]
+            if is_seq_start.any():
+                keep = (~is_seq_start).to(device=v.device, dtype=v.dtype)
+                v = v * keep.view(-1, *([1] * (v.dim() - 1)))
+            prev_preds[k] = v
+        return prev_preds
+
     def _split_train_val_metrics(
         self, metrics: Dict[str, float], inputs_meta: Optional[Dict[str, Any]] = None
     ) -> Dict[str, float]:
@@ -617,3 +777,21 @@ class BaseModel(pl.LightningModule):
                     log_metrics[f"val/{split}/{k}"] = v
 
         return log_metrics
+
+
+def _get_float_dtype(model: BaseModel) -> torch.dtype:
+    return model.dtype if model.dtype.is_floating_point else torch.float32
+
+
+def _uint8_images_pre_hook(model: BaseModel, args: Any) -> None:
+    if model.supports_uint8_images or len(args) == 0 or not isinstance(args[0], dict):
+        return
+    images = args[0].get("images")
+    if isinstance(images, torch.Tensor) and images.dtype == torch.uint8:
+        args[0]["images"] = images_to_float(images, _get_float_dtype(model))
+
+
+def _compile_pre_hook(model: BaseModel, args: Any) -> None:
+    compile_model(model)
+    model._compile_hook_handle.remove()
+    model._compile_hook_handle = None
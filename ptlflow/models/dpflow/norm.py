@@ -21,13 +21,13 @@ class LayerNorm2d(nn.LayerNorm):
         if self.weight is not None:
             x = F.layer_norm(
                 x,
-                (x.shape[-1],),
+                (int(x.shape[-1]),),
                 self.weight,
                 self.bias,
                 self.eps,
             )
         else:
-            x = F.layer_norm(x, (x.shape[-1],), eps=self.eps)
+            x = F.layer_norm(x, (int(x.shape[-1]),), eps=self.eps)
         x = x.permute(0, 3, 1, 2)
         return x
 
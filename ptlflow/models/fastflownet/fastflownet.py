@@ -100,6 +100,27 @@ class FastFlowNet(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/fastflownet-sintel-6475ea96.ckpt",
         "things": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/fastflownet-things3d-fc093d29.ckpt",
     }
+    fp32_submodules = ("corr_layer",)
+    quantize_submodules = (
+        "pconv1_1",
+        "pconv1_2",
+        "pconv2_1",
+        "pconv2_2",
+        "pconv2_3",
+        "pconv3_1",
+        "pconv3_2",
+        "pconv3_3",
+        "rconv2",
+        "rconv3",
+        "rconv4",
+        "rconv5",
+        "rconv6",
+        "decoder2",
+        "decoder3",
+        "decoder4",
+        "decoder5",
+        "decoder6",
+    )
 
     def __init__(
         self,
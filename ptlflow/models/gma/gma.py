@@ -55,6 +55,7 @@ class GMA(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/gma-sintel-98d6f3d0.ckpt",
         "kitti": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/gma-kitti-8ca3ec80.ckpt",
     }
+    supports_uint8_images = True
 
     def __init__(
         self,
@@ -50,6 +50,8 @@ class GMFlow(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/gmflow-sintel-d6f83ccd.ckpt",
         "kitti": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/gmflow-kitti-af50eb2e.ckpt",
     }
+    fp32_submodules = ("upsample_flow",)
+    compile_submodules = ("backbone", "transformer")
 
     def __init__(
         self,
@@ -254,6 +254,13 @@ class LiteFlowNet(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/liteflownet-sintel-17991e50.ckpt",
         "things": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/liteflownet-things-a4d066e2.ckpt",
     }
+    quantize_submodules = (
+        "feature_net",
+        "matching_nets",
+        "subpixel_nets",
+        "regularization_nets",
+        "feat2_conv",
+    )
 
     def __init__(
         self,
@@ -317,6 +317,14 @@ class LiteFlowNet2(BaseModel):
     pretrained_checkpoints = {
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/liteflownet2-sintel-1e1eb282.ckpt"
     }
+    quantize_submodules = (
+        "feature_net",
+        "matching_nets",
+        "subpixel_nets",
+        "regularization_nets",
+        "pseudo_subpixel",
+        "pseudo_regularization",
+    )
 
     def __init__(
         self,
@@ -449,6 +449,16 @@ class LiteFlowNet3(BaseModel):
     pretrained_checkpoints = {
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/liteflownet3-sintel-d985929f.ckpt"
     }
+    quantize_submodules = (
+        "feature_net",
+        "deformation_nets",
+        "modulation_nets",
+        "matching_nets",
+        "subpixel_nets",
+        "regularization_nets",
+        "pseudo_subpixel",
+        "pseudo_regularization",
+    )
 
     def __init__(
         self,
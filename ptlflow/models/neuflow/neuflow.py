@@ -47,6 +47,16 @@ class NeuFlow(BaseModel):
         "things": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/neuflow-things-c402aa7a.ckpt",
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/neuflow-sintel-0d969ea2.ckpt",
     }
+    quantize_submodules = (
+        "backbone",
+        "cross_attn_s16",
+        "flow_attn_s16",
+        "merge_s8",
+        "refine_s8",
+        "conv_s8",
+        "upsample_s1",
+    )
+    supports_uint8_images = True
 
     def __init__(
         self,
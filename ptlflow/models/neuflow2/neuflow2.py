@@ -48,6 +48,17 @@ class NeuFlow2(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/neuflow2-sintel-15c625f8.ckpt",
         "things": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/neuflow2-things-6ed47437.ckpt",
     }
+    quantize_submodules = (
+        "backbone",
+        "cross_attn_s16",
+        "merge_s8",
+        "context_merge_s8",
+        "refine_s16",
+        "refine_s8",
+        "conv_s8",
+        "upsample_s8",
+    )
+    supports_uint8_images = True
 
     def __init__(
         self,
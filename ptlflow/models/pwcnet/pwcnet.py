@@ -48,6 +48,7 @@ class PWCNet(BaseModel):
         "things": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/pwcnet-things-6a2e540b.ckpt",
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/pwcnet-sintel-533815e5.ckpt",
     }
+    fp32_submodules = ("corr",)
 
     def __init__(
         self,
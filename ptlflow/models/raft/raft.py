@@ -52,6 +52,9 @@ class RAFT(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/raft-sintel-fb44381e.ckpt",
         "kitti": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/raft-kitti-3a831a4b.ckpt",
     }
+    fp32_submodules = ("upsample_flow",)
+    compile_submodules = ("fnet", "cnet", "update_block")
+    supports_uint8_images = True
 
     def __init__(
         self,
@@ -27,6 +27,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch.nn.common_types import _size_2_t
+from torch.nn.modules.utils import _pair
 
 from .local_timm.create_conv2d import create_conv2d
 from .local_timm.drop import DropPath
@@ -143,6 +144,24 @@ class FusedConv1d(pl.LightningModule):
             )
         return x
 
+    def fuse_for_inference(self) -> None:
+        """Replace the horizontal and vertical weights by a single 2D weight.
+
+        After this call, the state dict of this module has the same format as when fuse_weights=True.
+        """
+        # The fused weight is only used with a 2D convolution, so the arguments can be stored as pairs, as in nn.Conv2d
+        self.stride = _pair(self.stride)
+        self.padding = _pair(self.padding)
+        self.dilation = _pair(self.dilation)
+        if self.fuse_weights:
+            return
+        weight = torch.einsum("cijk,cimj->cimk", self.weight_h, self.weight_v)
+        del self.weight_h
+        del self.weight_v
+        del self.weight
+        self.register_parameter("weight", nn.Parameter(weight.detach()))
+        self.fuse_weights = True
+
 
 class NeXt1DBlock(pl.LightningModule):
     def __init__(
@@ -75,6 +75,10 @@ class RAPIDFlow(BaseModel):
         "sintel": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/rapidflow-sintel-89a21262.ckpt",
         "kitti": "https://github.com/hmorimitsu/ptlflow/releases/download/weights1/rapidflow-kitti-2561329f.ckpt",
     }
+    fp32_submodules = ("upsample_flow",)
+    compile_submodules = ("fnet", "cnet", "update_block")
+    quantize_submodules = ("fnet", "cnet", "update_block")
+    supports_uint8_images = True
 
     def __init__(
         self,
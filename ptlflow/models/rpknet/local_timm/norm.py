@@ -20,13 +20,13 @@ class LayerNorm(nn.LayerNorm):
         if self.weight is not None:
             x = F.layer_norm(
                 x,
-                (x.shape[-1],),
+                (int(x.shape[-1]),),
                 self.weight[: x.shape[-1]],
                 self.bias[: x.shape[-1]],
                 self.eps,
             )
         else:
-            x = F.layer_norm(x, (x.shape[-1],), eps=self.eps)
+            x = F.layer_norm(x, (int(x.shape[-1]),), eps=self.eps)
         return x
 
 
@@ -41,13 +41,13 @@ class LayerNorm2d(nn.LayerNorm):
         if self.weight is not None:
             x = F.layer_norm(
                 x,
-                (x.shape[-1],),
+                (int(x.shape[-1]),),
                 self.weight[: x.shape[-1]],
                 self.bias[: x.shape[-1]],
                 self.eps,
             )
         else:
-            x = F.layer_norm(x, (x.shape[-1],), eps=self.eps)
+            x = F.layer_norm(x, (int(x.shape[-1]),), eps=self.eps)
         x = x.permute(0, 3, 1, 2)
         return x
 
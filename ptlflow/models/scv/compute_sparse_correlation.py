@@ -1,5 +1,5 @@
 import torch
-from .knn import knn_faiss_raw
+from .knn import knn
 from .utils import coords_grid, coords_grid_y_first
 
 
@@ -12,7 +12,7 @@ def normalize_coords(coords, H, W):
     return (coords - center[:, :, None]) / scaling[:, :, None]
 
 
-def compute_sparse_corr_init(fmap1, fmap2, k=32):
+def compute_sparse_corr_init(fmap1, fmap2, k=32, knn_backend="auto"):
     """
     Compute a cost volume containing the k-largest hypotheses for each pixel.
     Output: corr_mink
@@ -24,7 +24,7 @@ def compute_sparse_corr_init(fmap1, fmap2, k=32):
     fmap1, fmap2 = fmap1.view(B, C, -1), fmap2.view(B, C, -1)
 
     with torch.no_grad():
-        _, indices = knn_faiss_raw(fmap1, fmap2, k)  # [B, k, H1*W1]
+        _, indices = knn(fmap1, fmap2, k, knn_backend)  # [B, k, H1*W1]
 
         indices_coord = indices.unsqueeze(1).expand(-1, 2, -1, -1)  # [B, 2, k, H1*W1]
         coords0 = (
@@ -3,7 +3,8 @@ try:
 
     res = faiss.StandardGpuResources()
     res.setDefaultNullStreamAllDevices()
-except ImportError:
+except (ImportError, AttributeError):
+    # AttributeError: faiss-cpu does not provide StandardGpuResources
     faiss = None
 import torch
 
@@ -114,3 +115,92 @@ def knn_faiss_raw(fmap1, fmap2, k):
         dist = torch.cat(dist, dim=0)
         indx = torch.cat(indx, dim=0)
     return dist, indx
+
+
+# Maximum amount of memory, in bytes, used by the score matrix of one chunk in knn_torch_topk
+TOPK_CHUNK_MEMORY_BUDGET = 256 * 2**20
+
+
+def knn_torch_topk(fmap1, fmap2, k, chunk_size=None):
+    """Find the k largest inner products between each vector of fmap1 and all the vectors of fmap2.
+
+    This is a dependency-free alternative to knn_faiss_raw, which returns the results in the same format. The queries
+    from fmap1 are processed in chunks with one batched matmul followed by topk. Therefore, the memory used by the
+    intermediate scores is bounded by chunk_size * B * N2, instead of N1 * B * N2.
+
+    Parameters
+    ----------
+    fmap1 : torch.Tensor
+        The query vectors, with shape [B, C, N1].
+    fmap2 : torch.Tensor
+        The database vectors, with shape [B, C, N2].
+    k : int
+        Number of hypotheses to return for each query.
+    chunk_size : Optional[int], optional
+        Number of queries processed at the same time. If None, it is chosen to fit the scores of one chunk into
+        TOPK_CHUNK_MEMORY_BUDGET.
+
+    Returns
+    -------
+    Tuple[torch.Tensor, torch.Tensor]
+        The inner products [B, k, N1] and the indices in fmap2 [B, k, N1] of the k hypotheses, sorted from the largest
+        inner product to the smallest.
+    """
+    b, ch, n1 = fmap1.shape
+    n2 = fmap2.shape[2]
+    fmap1 = fmap1.view(b, ch, n1).transpose(1, 2)  # [B, N1, C]
+    fmap2 = fmap2.view(b, ch, n2)
+
+    if chunk_size is None:
+        bytes_per_query = b * n2 * fmap1.element_size()
+        chunk_size = max(1, TOPK_CHUNK_MEMORY_BUDGET // bytes_per_query)
+
+    dist = fmap1.new_empty(b, n1, k)
+    indx = torch.empty(b, n1, k, dtype=torch.int64, device=fmap1.device)
+    for start in range(0, n1, chunk_size):
+        end = min(start + chunk_size, n1)
+        scores = torch.bmm(fmap1[:, start:end], fmap2)  # [B, chunk, N2]
+        dist[:, start:end], indx[:, start:end] = torch.topk(scores, k, dim=2)
+
+    dist = dist.transpose(1, 2).contiguous()
+    indx = indx.transpose(1, 2).contiguous()
+    return dist, indx
+
+
+def knn(fmap1, fmap2, k, backend="auto"):
+    """Find the k largest inner products between each vector of fmap1 and all the vectors of fmap2.
+
+    Parameters
+    ----------
+    fmap1 : torch.Tensor
+        The query vectors, with shape [B, C, N1].
+    fmap2 : torch.Tensor
+        The database vectors, with shape [B, C, N2].
+    k : int
+        Number of hypotheses to return for each query.
+    backend : str, default "auto"
+        Either "faiss", "torch", or "auto". "auto" uses faiss when it is installed and the inputs are on the GPU, and
+        knn_torch_topk otherwise.
+
+    Returns
+    -------
+    Tuple[torch.Tensor, torch.Tensor]
+        The inner products [B, k, N1] and the indices in fmap2 [B, k, N1] of the k hypotheses.
+    """
+    if backend == "auto":
+        backend = "faiss" if faiss is not None and fmap1.is_cuda else "torch"
+
+    if backend == "faiss":
+        if faiss is None:
+            raise ImportError(
+                "ERROR: faiss not found."
+                " The faiss knn backend requires faiss library to run."
+                " Install with pip install faiss-gpu, or use the torch backend"
+            )
+        return knn_faiss_raw(fmap1, fmap2, k)
+    elif backend == "torch":
+        return knn_torch_topk(fmap1, fmap2, k)
+    else:
+        raise ValueError(
+            f"Invalid knn backend {backend}. It must be one of {{auto, faiss, torch}}."
+        )
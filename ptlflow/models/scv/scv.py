@@ -13,7 +13,7 @@ from .utils import (
     upflow4,
     compute_interpolation_weights,
 )
-from .knn import knn_faiss_raw
+from .knn import knn
 from ..base_model.base_model import BaseModel
 
 
@@ -45,7 +45,7 @@ class SequenceLoss(nn.Module):
         return flow_loss
 
 
-def compute_sparse_corr(fmap1, fmap2, k=32):
+def compute_sparse_corr(fmap1, fmap2, k=32, knn_backend="auto"):
     """
     Compute a cost volume containing the k-largest hypotheses for each pixel.
     Output: corr_mink
@@ -57,7 +57,7 @@ def compute_sparse_corr(fmap1, fmap2, k=32):
     fmap1, fmap2 = fmap1.view(B, C, -1), fmap2.view(B, C, -1)
 
     with torch.no_grad():
-        _, indices = knn_faiss_raw(fmap1, fmap2, k)  # [B, k, H1*W1]
+        _, indices = knn(fmap1, fmap2, k, knn_backend)  # [B, k, H1*W1]
 
         indices_coord = indices.unsqueeze(1).expand(-1, 2, -1, -1)  # [B, 2, k, H1*W1]
         coords0 = (
@@ -116,6 +116,7 @@ class SCVBase(BaseModel):
         gamma: float = 0.8,
         max_flow: float = 400.0,
         iters: int = 32,
+        knn_backend: str = "auto",
         **kwargs,
     ) -> None:
         super().__init__(
@@ -126,6 +127,7 @@ class SCVBase(BaseModel):
 
         self.num_k = num_k
         self.iters = iters
+        self.knn_backend = knn_backend
 
         try:
             import torch_scatter
@@ -135,14 +137,15 @@ class SCVBase(BaseModel):
                 " SCV requires torch_scatter library to run."
                 " Check instructions at: https://github.com/rusty1s/pytorch_scatter"
             )
-        try:
-            import faiss
-        except ImportError:
-            raise ImportError(
-                "ERROR: faiss not found."
-                " CSV requires faiss library to run."
-                " Install with pip install faiss-gpu"
-            )
+        if knn_backend == "faiss":
+            try:
+                import faiss
+            except ImportError:
+                raise ImportError(
+                    "ERROR: faiss not found."
+                    " SCV with knn_backend=faiss requires faiss library to run."
+                    " Install with pip install faiss-gpu, or use knn_backend=torch"
+                )
 
 
 class SCVQuarter(SCVBase):
@@ -159,10 +162,16 @@ class SCVQuarter(SCVBase):
         gamma: float = 0.8,
         max_flow: float = 400,
         iters: int = 32,
+        knn_backend: str = "auto",
         **kwargs,
     ) -> None:
         super().__init__(
-            num_k=num_k, gamma=gamma, max_flow=max_flow, iters=iters, **kwargs
+            num_k=num_k,
+            gamma=gamma,
+            max_flow=max_flow,
+            iters=iters,
+            knn_backend=knn_backend,
+            **kwargs,
         )
 
         # feature network, context network, and update block
@@ -235,7 +244,7 @@ class SCVQuarter(SCVBase):
 
         # Generate sparse cost volume for GRU
         corr_val, coords0_cv, coords1_cv, batch_index_cv = compute_sparse_corr(
-            fmap1, fmap2, k=self.num_k
+            fmap1, fmap2, k=self.num_k, knn_backend=self.knn_backend
         )
 
         delta_flow = torch.zeros_like(coords0)
@@ -337,10 +346,16 @@ class SCVEighth(SCVBase):
         gamma: float = 0.8,
         max_flow: float = 400,
         iters: int = 32,
+        knn_backend: str = "auto",
         **kwargs,
     ) -> None:
         super().__init__(
-            num_k=num_k, gamma=gamma, max_flow=max_flow, iters=iters, **kwargs
+            num_k=num_k,
+            gamma=gamma,
+            max_flow=max_flow,
+            iters=iters,
+            knn_backend=knn_backend,
+            **kwargs,
         )
 
         # feature network, context network, and update block
@@ -411,7 +426,7 @@ class SCVEighth(SCVBase):
 
         # Generate sparse cost volume for GRU
         corr_val, coords0_cv, coords1_cv, batch_index_cv = compute_sparse_corr(
-            fmap1, fmap2, k=self.num_k
+            fmap1, fmap2, k=self.num_k, knn_backend=self.knn_backend
         )
 
         delta_flow = torch.zeros_like(coords0)
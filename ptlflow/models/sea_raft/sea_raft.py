@@ -51,6 +51,8 @@ class SequenceLoss(nn.Module):
 
 
 class SEARAFT(BaseModel):
+    supports_uint8_images = True
+
     def __init__(
         self,
         corr_levels: int = 4,
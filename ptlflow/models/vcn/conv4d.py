@@ -7,76 +7,41 @@ import torch.nn.functional as F
 from torch.nn import Module
 from torch.nn.modules.conv import _ConvNd
 from torch.nn.modules.utils import _quadruple
-from torch.autograd import Variable
 from torch.nn import Conv2d
 
 
 def conv4d(data, filters, bias=None, permute_filters=True, use_half=False):
     """
-    This is done by stacking results of multiple 3D convolutions, and is very slow.
-    Taken from https://github.com/ignacio-rocco/ncnet
+    4D convolution of data [b, c, h, w, d, t] with filters [c_out, c, kh, kw, kd, kt] (or [kh, c_out, c, kw, kd, kt] if
+    already permuted), with zero padding that preserves the size of the input.
+
+    The h dimension of the data is folded into the batch, and the kh shifted copies of the data are concatenated along
+    the channels, so that the whole 4D convolution is computed by a single conv3d.
+    Adapted from https://github.com/ignacio-rocco/ncnet, which computed one conv3d per output slice and kernel tap.
+
+    use_half is kept for compatibility. The output always has the same dtype as the data.
     """
     b, c, h, w, d, t = data.size()
 
-    data = data.permute(
-        2, 0, 1, 3, 4, 5
-    ).contiguous()  # permute to avoid making contiguous inside loop
-
     # Same permutation is done with filters, unless already provided with permutation
     if permute_filters:
-        filters = filters.permute(
-            2, 0, 1, 3, 4, 5
-        ).contiguous()  # permute to avoid making contiguous inside loop
-
-    c_out = filters.size(1)
-    if use_half:
-        output = Variable(
-            torch.HalfTensor(h, b, c_out, w, d, t), requires_grad=data.requires_grad
-        )
-    else:
-        output = Variable(
-            torch.zeros(h, b, c_out, w, d, t), requires_grad=data.requires_grad
-        )
+        filters = filters.permute(2, 0, 1, 3, 4, 5)
 
-    padding = filters.size(0) // 2
-    if use_half:
-        Z = Variable(torch.zeros(padding, b, c, w, d, t).half())
-    else:
-        Z = Variable(torch.zeros(padding, b, c, w, d, t))
+    kh, c_out = filters.shape[:2]
+    padding = kh // 2
 
-    if data.is_cuda:
-        Z = Z.cuda(data.get_device())
-        output = output.cuda(data.get_device())
+    data = data.permute(2, 0, 1, 3, 4, 5)  # [h, b, c, w, d, t]
+    data = F.pad(data, (0, 0) * 5 + (padding, padding))  # [h + 2 * padding, b, ...]
+    data = torch.cat([data[p : p + h] for p in range(kh)], dim=2)
+    data = data.reshape(h * b, kh * c, w, d, t)
 
-    data_padded = torch.cat((Z, data, Z), 0)
-
-    for i in range(output.size(0)):  # loop on first feature dimension
-        # convolve with center channel of filter (at position=padding)
-        output[i, :, :, :, :, :] = F.conv3d(
-            data_padded[i + padding, :, :, :, :, :],
-            filters[padding, :, :, :, :, :],
-            bias=bias,
-            stride=1,
-            padding=padding,
-        )
-        # convolve with upper/lower channels of filter (at postions [:padding] [padding+1:])
-        for p in range(1, padding + 1):
-            output[i, :, :, :, :, :] = output[i, :, :, :, :, :] + F.conv3d(
-                data_padded[i + padding - p, :, :, :, :, :],
-                filters[padding - p, :, :, :, :, :],
-                bias=None,
-                stride=1,
-                padding=padding,
-            )
-            output[i, :, :, :, :, :] = output[i, :, :, :, :, :] + F.conv3d(
-                data_padded[i + padding + p, :, :, :, :, :],
-                filters[padding + p, :, :, :, :, :],
-                bias=None,
-                stride=1,
-                padding=padding,
-            )
+    # [kh, c_out, c, kw, kd, kt] -> [c_out, kh * c, kw, kd, kt], in the same order as the channels of data
+    filters = filters.permute(1, 0, 2, 3, 4, 5).reshape(
+        c_out, kh * c, *filters.shape[3:]
+    )
 
-    output = output.permute(1, 2, 0, 3, 4, 5).contiguous()
+    output = F.conv3d(data, filters, bias=bias, stride=1, padding=padding)
+    output = output.view(h, b, c_out, w, d, t).permute(1, 2, 0, 3, 4, 5).contiguous()
     return output
 
 
@@ -114,6 +79,7 @@ class Conv4d(_ConvNd):
             _quadruple(0),
             groups,
             bias,
+            "zeros",
         )
         # weights will be sliced along one dimension during convolution loop
         # make the looping dimension to be the first one in the tensor,
@@ -0,0 +1,408 @@
+"""Store the results of model_benchmark.py over time, and detect performance regressions between runs.
+
+Each run is saved in its own directory, together with a fingerprint of the environment where it was executed (versions
+of the libraries, hardware, number of threads, git revision and benchmark settings), so that a change of performance can
+be traced back to its cause. Besides the results table, the individual time and memory measurements of every benchmark
+sample are stored, which allows comparing two runs with a statistical test, instead of only comparing their medians.
+
+The layout of the history is::
+
+    root_dir/
+        <YYYYmmdd-HHMMSS>_<hash>/
+            run.json
+            results.csv
+            samples.json
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from datetime import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import platform
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+import torch
+
+import ptlflow
+
+# Columns that identify one benchmark configuration inside a run
+SAMPLE_KEYS = (
+    "Model",
+    "Datatype",
+    "Device",
+    "Threads",
+    "BatchSize",
+    "InputH",
+    "InputW",
+)
+
+
+def get_environment_fingerprint(
+    settings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Collect the information about the environment that may affect the benchmark results.
+
+    Parameters
+    ----------
+    settings : Optional[Dict[str, Any]], optional
+        The settings of the benchmark, which are stored together with the environment.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The environment information.
+    """
+    env = {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cuda": torch.version.cuda,
+        "cudnn": (
+            torch.backends.cudnn.version()
+            if torch.backends.cudnn.is_available()
+            else None
+        ),
+        "ptlflow": ptlflow.__version__,
+        "platform": platform.platform(),
+        "cpu": _get_cpu_name(),
+        "cpu_count": os.cpu_count(),
+        "gpu": (
+            torch.cuda.get_device_name(torch.cuda.current_device())
+            if torch.cuda.is_available()
+            else None
+        ),
+        "num_threads": torch.get_num_threads(),
+        "num_interop_threads": torch.get_num_interop_threads(),
+        "git_revision": _get_git_revision(),
+    }
+    env["settings"] = {} if settings is None else settings
+    return env
+
+
+class BenchmarkHistory(object):
+    """Append the benchmark runs to a directory, and load them back.
+
+    Examples
+    --------
+    >>> history = BenchmarkHistory("outputs/benchmark_history")
+    >>> run_id = history.add_run(results_df, samples, get_environment_fingerprint(settings))
+    >>> comparison_df = compare_runs(history.load_run(history.list_runs()[-2]), history.load_run(run_id))
+    """
+
+    def __init__(self, root_dir: Union[str, Path]) -> None:
+        """Initialize BenchmarkHistory.
+
+        Parameters
+        ----------
+        root_dir : Union[str, Path]
+            Directory where the runs are stored.
+        """
+        self.root_dir = Path(root_dir)
+
+    def add_run(
+        self,
+        results_df: pd.DataFrame,
+        samples: List[Dict[str, Any]],
+        environment: Dict[str, Any],
+    ) -> str:
+        """Save a new run.
+
+        Parameters
+        ----------
+        results_df : pd.DataFrame
+            The results table created by model_benchmark.py.
+        samples : List[Dict[str, Any]]
+            The measurements of each configuration. Each element contains the values of SAMPLE_KEYS, the list of times
+            (in milliseconds) "times", and the list of memories (in bytes) "memories".
+        environment : Dict[str, Any]
+            The environment fingerprint. See get_environment_fingerprint().
+
+        Returns
+        -------
+        str
+            The id of the new run.
+        """
+        created = datetime.now()
+        env_str = json.dumps(environment, sort_keys=True, default=str)
+        env_hash = hashlib.sha1(
+            f"{created.isoformat()}\n{env_str}".encode()
+        ).hexdigest()[:8]
+        run_id = f"{created:%Y%m%d-%H%M%S}_{env_hash}"
+        run_dir = self.root_dir / run_id
+        run_dir.mkdir(parents=True, exist_ok=False)
+
+        results_df.to_csv(run_dir / "results.csv", index=False)
+        with open(run_dir / "samples.json", "w") as f:
+            json.dump(samples, f, default=_to_json)
+        # run.json is written last, so a run is only listed when all of its files are complete
+        with open(run_dir / "run.json", "w") as f:
+            json.dump(
+                {"run_id": run_id, "created": created.isoformat(), **environment},
+                f,
+                indent=2,
+                default=_to_json,
+            )
+        return run_id
+
+    def list_runs(self) -> List[str]:
+        """Return the ids of the stored runs, from the oldest to the newest.
+
+        Returns
+        -------
+        List[str]
+            The ids of the runs.
+        """
+        runs = []
+        for run_info_path in self.root_dir.glob("*/run.json"):
+            with open(run_info_path, "r") as f:
+                created = json.load(f)["created"]
+            runs.append((created, run_info_path.parent.name))
+        # The creation time has a finer resolution than the id, so it also orders the runs created in the same second
+        return [run_id for _, run_id in sorted(runs)]
+
+    def load_run(self, run_id: Union[str, int]) -> Dict[str, Any]:
+        """Load one run.
+
+        Parameters
+        ----------
+        run_id : Union[str, int]
+            The id of the run, or its index in list_runs() (e.g., -1 for the newest run).
+
+        Returns
+        -------
+        Dict[str, Any]
+            A dict with the keys "environment", "results" (a pd.DataFrame) and "samples".
+        """
+        run_id = self.resolve_run_id(run_id)
+        run_dir = self.root_dir / run_id
+        with open(run_dir / "run.json", "r") as f:
+            environment = json.load(f)
+        with open(run_dir / "samples.json", "r") as f:
+            samples = json.load(f)
+        return {
+            "environment": environment,
+            "results": pd.read_csv(run_dir / "results.csv"),
+            "samples": samples,
+        }
+
+    def resolve_run_id(self, run_id: Union[str, int]) -> str:
+        """Convert an index of list_runs() to the id of the run.
+
+        Parameters
+        ----------
+        run_id : Union[str, int]
+            The id of the run, or its index in list_runs(). Strings of integers are also treated as indices.
+
+        Returns
+        -------
+        str
+            The id of the run.
+        """
+        run_ids = self.list_runs()
+        if isinstance(run_id, int) or str(run_id).lstrip("-").isdigit():
+            return run_ids[int(run_id)]
+        if run_id not in run_ids:
+            raise ValueError(f"The run {run_id} is not in {self.root_dir}.")
+        return run_id
+
+    def get_runs_table(self) -> pd.DataFrame:
+        """Return a table with the main environment information of each run.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per run.
+        """
+        rows = []
+        for run_id in self.list_runs():
+            with open(self.root_dir / run_id / "run.json", "r") as f:
+                env = json.load(f)
+            rows.append(
+                {
+                    k: env.get(k)
+                    for k in [
+                        "run_id",
+                        "created",
+                        "git_revision",
+                        "torch",
+                        "cuda",
+                        "cpu",
+                        "gpu",
+                        "num_threads",
+                    ]
+                }
+            )
+        return pd.DataFrame(rows)
+
+
+def compare_runs(
+    baseline: Dict[str, Any],
+    candidate: Dict[str, Any],
+    alpha: float = 0.01,
+    min_change: float = 0.05,
+) -> pd.DataFrame:
+    """Compare the time and memory of the configurations that are present in two runs.
+
+    The times are compared with a two-sided Mann-Whitney U test on the individual measurements of each run. A change is
+    only flagged if it is statistically significant (p-value < alpha) and the median changes by more than min_change.
+    The memory is measured once per trial, so its values have almost no variation, and it is only compared by the
+    relative change of the medians.
+
+    Parameters
+    ----------
+    baseline : Dict[str, Any]
+        The reference run, as returned by BenchmarkHistory.load_run().
+    candidate : Dict[str, Any]
+        The run to be checked, as returned by BenchmarkHistory.load_run().
+    alpha : float, default 0.01
+        Significance level of the test.
+    min_change : float, default 0.05
+        Minimum relative change of the median to flag a regression or an improvement.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per configuration and metric ("time" or "memory"), with the medians of each run, the relative change,
+        the p-value and the status: "regression", "improvement", or "unchanged".
+    """
+    baseline_samples = {_get_sample_key(s): s for s in baseline["samples"]}
+    rows = []
+    for cand in candidate["samples"]:
+        key = _get_sample_key(cand)
+        base = baseline_samples.get(key)
+        if base is None:
+            continue
+        for metric, values_key in [("time", "times"), ("memory", "memories")]:
+            base_values = np.array(base[values_key], dtype=np.float64)
+            cand_values = np.array(cand[values_key], dtype=np.float64)
+            if len(base_values) == 0 or len(cand_values) == 0:
+                continue
+            base_median = float(np.median(base_values))
+            cand_median = float(np.median(cand_values))
+            change = (cand_median - base_median) / max(abs(base_median), 1e-12)
+
+            p_value = np.nan
+            is_significant = True
+            if metric == "time":
+                if len(base_values) > 1 and len(cand_values) > 1:
+                    p_value = float(
+                        stats.mannwhitneyu(
+                            cand_values, base_values, alternative="two-sided"
+                        ).pvalue
+                    )
+                is_significant = p_value < alpha
+
+            status = "unchanged"
+            if is_significant and change > min_change:
+                status = "regression"
+            elif is_significant and change < -min_change:
+                status = "improvement"
+            rows.append(
+                {
+                    **dict(zip(SAMPLE_KEYS, key)),
+                    "Metric": metric,
+                    "Baseline": base_median,
+                    "Candidate": cand_median,
+                    "Change(%)": 100 * change,
+                    "PValue": p_value,
+                    "Status": status,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def diff_environments(
+    baseline_env: Dict[str, Any], candidate_env: Dict[str, Any]
+) -> Dict[str, Tuple[Any, Any]]:
+    """Find the environment values that differ between two runs.
+
+    Parameters
+    ----------
+    baseline_env : Dict[str, Any]
+        The environment of the reference run.
+    candidate_env : Dict[str, Any]
+        The environment of the run to be checked.
+
+    Returns
+    -------
+    Dict[str, Tuple[Any, Any]]
+        The differing values, as (baseline, candidate). The settings are compared individually, as settings.<name>.
+    """
+    ignore_keys = ("run_id", "created")
+    diffs = {}
+    for prefix, base, cand in [
+        ("", baseline_env, candidate_env),
+        (
+            "settings.",
+            baseline_env.get("settings", {}),
+            candidate_env.get("settings", {}),
+        ),
+    ]:
+        for k in sorted(set(base.keys()) | set(cand.keys())):
+            if k in ignore_keys or (prefix == "" and k == "settings"):
+                continue
+            if base.get(k) != cand.get(k):
+                diffs[f"{prefix}{k}"] = (base.get(k), cand.get(k))
+    return diffs
+
+
+def _get_sample_key(sample: Dict[str, Any]) -> Tuple[Any, ...]:
+    return tuple(sample[k] for k in SAMPLE_KEYS)
+
+
+def _get_cpu_name() -> str:
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def _get_git_revision() -> Optional[str]:
+    repo_dir = Path(ptlflow.__file__).resolve().parent
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        is_dirty = (
+            subprocess.run(
+                ["git", "diff", "--quiet", "HEAD"], cwd=repo_dir, capture_output=True
+            ).returncode
+            != 0
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{revision}-dirty" if is_dirty else revision
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
@@ -48,7 +48,7 @@ except ImportError:
 
 from ptlflow.models.base_model.base_model import BaseModel
 from ptlflow.utils import flow_utils
-from ptlflow.utils.utils import config_logging
+from ptlflow.utils.utils import config_logging, images_to_float
 
 config_logging()
 
@@ -366,7 +366,7 @@ class LoggerCallback(Callback):
                 else:
                     img = source[k]
 
-                img = img[:1, 0].detach().cpu()
+                img = images_to_float(img[:1, 0].detach().cpu())
                 img = F.interpolate(img, self.image_size)
                 img = img[0]
 
@@ -0,0 +1,306 @@
+"""Implement a callback to find out whether the training is limited by the data loading.
+
+At every training step, the callback records the time spent:
+
+- waiting for the next batch from the dataloader,
+- moving the batch to the device,
+- on the forward (training_step), backward and optimizer step,
+
+and, for each sample, the time its dataloader worker spent reading the files and applying the transforms.
+
+The loop times are collected by temporarily wrapping the profiler of the trainer, so they use the same hooks as the
+profilers of Lightning and are not affected by the other callbacks. When the callback is not used, nothing is recorded.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import time
+from typing import Any, Callable, Dict, Optional
+
+from lightning.pytorch.callbacks import Callback
+from lightning.pytorch.profilers import Profiler
+from lightning.pytorch.trainer.trainer import Trainer
+from loguru import logger
+import numpy as np
+import torch
+
+from ptlflow.data.datasets import BaseFlowDataset
+from ptlflow.models.base_model.base_model import BaseModel
+
+# Keys of the logged times, and the profiler actions whose durations are recorded in each of them
+LOOP_ACTIONS = {
+    "data_wait": ("[_TrainingEpochLoop].train_dataloader_next",),
+    "transfer": ("[Strategy]", ".batch_to_device"),
+    "forward": ("[Strategy]", ".training_step"),
+    "backward": ("[Strategy]", ".backward"),
+    "optimizer_step": ("[LightningModule]", ".optimizer_step"),
+}
+
+
+class StallMonitorCallback(Callback):
+    """Callback to log the time spent on each part of the training step and on the data loading.
+
+    The times (in milliseconds) of every step are logged as scalars under stall/. At the end of each epoch, the averages
+    are logged and summarized, together with the fraction of the step time spent waiting for the data, and the read and
+    transform times of each dataloader worker.
+
+    Notes
+    -----
+    The optimizer_step time only includes the optimizer itself: the forward and backward, which Lightning runs inside the
+    optimizer closure, are subtracted from it.
+    """
+
+    def __init__(
+        self,
+        log_every_n_steps: int = 1,
+        synchronize: bool = True,
+        stall_warning_fraction: float = 0.1,
+    ) -> None:
+        """Initialize StallMonitorCallback.
+
+        Parameters
+        ----------
+        log_every_n_steps : int, default 1
+            How often to log the step times. The epoch summary always uses all the steps.
+        synchronize : bool, default True
+            If True, the CUDA device is synchronized before and after each timed part of the step. Otherwise, the GPU
+            times only measure the kernel launches.
+        stall_warning_fraction : float, default 0.1
+            A warning is shown at the end of the epoch if the fraction of the step time spent waiting for the data is
+            above this value.
+        """
+        self.log_every_n_steps = log_every_n_steps
+        self.synchronize = synchronize
+        self.stall_warning_fraction = stall_warning_fraction
+
+        self.profiler = None
+        self.original_profiler = None
+        self.step_times = []
+        self.worker_times = {}
+        self.batch_timings = None
+        self.last_step_end = None
+
+    def setup(self, trainer: Trainer, pl_module: BaseModel, stage: str) -> None:
+        if stage != "fit" or self.profiler is not None:
+            return
+        self.original_profiler = trainer.profiler
+        self.profiler = _StepTimingProfiler(
+            trainer.profiler,
+            is_active=lambda: trainer.training,
+            synchronize=self.synchronize and torch.cuda.is_available(),
+        )
+        trainer.profiler = self.profiler
+        # The dataloader workers are created before on_train_start, so the timings must be enabled here
+        BaseFlowDataset.record_timings = True
+
+    def teardown(self, trainer: Trainer, pl_module: BaseModel, stage: str) -> None:
+        if self.profiler is not None:
+            trainer.profiler = self.original_profiler
+            self.profiler = None
+            self.original_profiler = None
+            BaseFlowDataset.record_timings = False
+
+    def on_train_epoch_start(self, trainer: Trainer, pl_module: BaseModel) -> None:
+        self.step_times = []
+        self.worker_times = {}
+        self.last_step_end = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.pop_times()
+
+    def on_train_batch_start(
+        self,
+        trainer: Trainer,
+        pl_module: BaseModel,
+        batch: Dict[str, Any],
+        batch_idx: int,
+    ) -> None:
+        # Remove the timings before the forward, so that the model never sees them
+        self.batch_timings = None
+        if isinstance(batch, dict):
+            self.batch_timings = batch.pop("timings", None)
+
+    def on_train_batch_end(
+        self,
+        trainer: Trainer,
+        pl_module: BaseModel,
+        outputs: Dict[str, torch.Tensor],
+        batch: Dict[str, Any],
+        batch_idx: int,
+    ) -> None:
+        now = time.perf_counter()
+        times = {} if self.profiler is None else self.profiler.pop_times()
+        if "optimizer_step" in times:
+            times["optimizer_step"] = max(
+                0.0,
+                times["optimizer_step"]
+                - times.get("forward", 0.0)
+                - times.get("backward", 0.0),
+            )
+        times["step"] = 1000 * (now - self.last_step_end)
+        self.last_step_end = now
+
+        if self.batch_timings is not None:
+            read_times = 1000 * _to_numpy(self.batch_timings["read"])
+            transform_times = 1000 * _to_numpy(self.batch_timings["transform"])
+            worker_ids = _to_numpy(self.batch_timings["worker_id"]).astype(np.int64)
+            times["read"] = float(read_times.mean())
+            times["transform"] = float(transform_times.mean())
+            for wid, rt, tt in zip(worker_ids, read_times, transform_times):
+                wtimes = self.worker_times.setdefault(int(wid), [0, 0.0, 0.0])
+                wtimes[0] += 1
+                wtimes[1] += rt
+                wtimes[2] += tt
+            self.batch_timings = None
+
+        self.step_times.append(times)
+        if (batch_idx + 1) % self.log_every_n_steps == 0:
+            pl_module.log_dict(
+                {f"stall/{k}": v for k, v in times.items()},
+                on_step=True,
+                on_epoch=False,
+                batch_size=1,
+            )
+
+    def on_train_epoch_end(self, trainer: Trainer, pl_module: BaseModel) -> None:
+        if len(self.step_times) == 0:
+            return
+
+        keys = []
+        for times in self.step_times:
+            keys.extend([k for k in times.keys() if k not in keys])
+        means = {
+            k: float(np.mean([t[k] for t in self.step_times if k in t])) for k in keys
+        }
+        total_step = sum([t["step"] for t in self.step_times])
+        total_wait = sum([t.get("data_wait", 0.0) for t in self.step_times])
+        wait_fraction = total_wait / max(total_step, 1e-6)
+
+        metrics = {f"stall/epoch_{k}": v for k, v in means.items()}
+        metrics["stall/epoch_data_wait_fraction"] = wait_fraction
+        for wid, (count, read_time, transform_time) in sorted(
+            self.worker_times.items()
+        ):
+            metrics[f"stall/worker{wid}_read"] = read_time / count
+            metrics[f"stall/worker{wid}_transform"] = transform_time / count
+        pl_module.log_dict(metrics, on_step=False, on_epoch=True, batch_size=1)
+
+        summary = ", ".join([f"{k}: {v:.1f}" for k, v in means.items()])
+        logger.info(
+            "Epoch {} average step times (ms): {}. Data wait fraction: {:.1%}.",
+            trainer.current_epoch,
+            summary,
+            wait_fraction,
+        )
+        for wid, (count, read_time, transform_time) in sorted(
+            self.worker_times.items()
+        ):
+            logger.info(
+                "Worker {}: {} samples, read {:.1f} ms, transform {:.1f} ms per sample.",
+                wid,
+                count,
+                read_time / count,
+                transform_time / count,
+            )
+        if wait_fraction > self.stall_warning_fraction:
+            logger.warning(
+                "The training waited for the data during {:.1%} of the time. Consider increasing the number of "
+                "dataloader workers or simplifying the transforms.",
+                wait_fraction,
+            )
+
+
+class _StepTimingProfiler(Profiler):
+    """Profiler that records the durations of the training step actions, and forwards all calls to another profiler."""
+
+    def __init__(
+        self,
+        profiler: Optional[Profiler],
+        is_active: Callable[[], bool],
+        synchronize: bool = False,
+    ) -> None:
+        super().__init__()
+        self.profiler = profiler
+        self.is_active = is_active
+        self.synchronize = synchronize
+        self.start_times = {}
+        self.times = {}
+
+    def start(self, action_name: str) -> None:
+        if self.profiler is not None:
+            self.profiler.start(action_name)
+        if self._get_key(action_name) is not None and self.is_active():
+            if self.synchronize:
+                torch.cuda.synchronize()
+            self.start_times[action_name] = time.perf_counter()
+
+    def stop(self, action_name: str) -> None:
+        start_time = self.start_times.pop(action_name, None)
+        if start_time is not None:
+            if self.synchronize:
+                torch.cuda.synchronize()
+            key = self._get_key(action_name)
+            self.times[key] = self.times.get(key, 0.0) + 1000 * (
+                time.perf_counter() - start_time
+            )
+        if self.profiler is not None:
+            self.profiler.stop(action_name)
+
+    def pop_times(self) -> Dict[str, float]:
+        """Return the times (in milliseconds) recorded since the last call.
+
+        Returns
+        -------
+        Dict[str, float]
+            The time of each key of LOOP_ACTIONS.
+        """
+        times = self.times
+        self.times = {}
+        return times
+
+    def summary(self) -> str:
+        return "" if self.profiler is None else self.profiler.summary()
+
+    def describe(self) -> None:
+        if self.profiler is not None:
+            self.profiler.describe()
+
+    def setup(
+        self,
+        stage: str,
+        local_rank: Optional[int] = None,
+        log_dir: Optional[str] = None,
+    ) -> None:
+        super().setup(stage, local_rank, log_dir)
+        if self.profiler is not None:
+            self.profiler.setup(stage, local_rank, log_dir)
+
+    def _get_key(self, action_name: str) -> Optional[str]:
+        for key, patterns in LOOP_ACTIONS.items():
+            if len(patterns) == 1:
+                if action_name == patterns[0]:
+                    return key
+            elif action_name.startswith(patterns[0]) and action_name.endswith(
+                patterns[1]
+            ):
+                return key
+        return None
+
+
+def _to_numpy(values: Any) -> np.ndarray:
+    if isinstance(values, torch.Tensor):
+        return values.detach().cpu().numpy()
+    return np.array(values)
@@ -0,0 +1,174 @@
+"""Utilities to reduce the size and loading cost of checkpoint files.
+
+Training checkpoints saved by Lightning also contain the optimizer and scheduler states, callbacks, loops, etc. These
+entries are not needed for inference, but they make the files larger and slower to load. This module strips them away,
+keeping only the model weights and the hyperparameters used by ptlflow.restore_model().
+
+It can be run as a script to convert, once, all the checkpoints downloaded to the torch hub cache:
+
+    python -m ptlflow.utils.checkpoint_utils --hub
+
+or specific checkpoint files:
+
+    python -m ptlflow.utils.checkpoint_utils --ckpt_paths path/to/ckpt1.ckpt path/to/ckpt2.ckpt
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+from loguru import logger
+import torch
+from torch import hub
+
+INFERENCE_KEYS = ("state_dict", "hyper_parameters", "pytorch-lightning_version")
+
+
+def strip_checkpoint(
+    ckpt_path: Union[str, Path],
+    output_path: Optional[Union[str, Path]] = None,
+    keep_keys: Sequence[str] = INFERENCE_KEYS,
+) -> bool:
+    """Remove the training-only content from a checkpoint file.
+
+    The stripped checkpoint is saved with the zip serialization format, so that it can be memory-mapped by
+    ptlflow.load_checkpoint().
+
+    Parameters
+    ----------
+    ckpt_path : Union[str, Path]
+        Path to the checkpoint file.
+    output_path : Optional[Union[str, Path]], optional
+        Path where the stripped checkpoint will be saved. If None, the input file is replaced.
+    keep_keys : Sequence[str], default INFERENCE_KEYS
+        The top-level keys of the checkpoint that will be kept.
+
+    Returns
+    -------
+    bool
+        True if a stripped checkpoint was written, False if the checkpoint did not have any content to be removed and
+        it was left untouched.
+    """
+    ckpt_path = Path(ckpt_path)
+    output_path = ckpt_path if output_path is None else Path(output_path)
+
+    orig_size = ckpt_path.stat().st_size
+    ckpt = torch.load(ckpt_path, map_location="cpu", weights_only=True)
+    if "state_dict" not in ckpt:
+        raise ValueError(f"{ckpt_path} does not contain a state_dict.")
+
+    removed_keys = [k for k in ckpt.keys() if k not in keep_keys]
+    if len(removed_keys) == 0 and output_path == ckpt_path:
+        logger.info("{} has no training-only content, skipping.", ckpt_path)
+        return False
+
+    stripped_ckpt = {k: v for k, v in ckpt.items() if k in keep_keys}
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Save to a temporary file first, so that the original checkpoint is not corrupted if the process is interrupted.
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    torch.save(stripped_ckpt, tmp_path)
+    tmp_path.replace(output_path)
+    logger.info(
+        "Saved stripped checkpoint to {} ({:.1f} MB -> {:.1f} MB). Removed keys: {}",
+        output_path,
+        orig_size / 2**20,
+        output_path.stat().st_size / 2**20,
+        removed_keys,
+    )
+    return True
+
+
+def strip_hub_checkpoints(
+    model_dir: Optional[Union[str, Path]] = None,
+) -> List[Path]:
+    """Strip the training-only content from all the checkpoints in the torch hub cache.
+
+    The files are replaced in place, keeping the same names, so that they are still found by
+    ptlflow.load_checkpoint().
+
+    Parameters
+    ----------
+    model_dir : Optional[Union[str, Path]], optional
+        Directory containing the checkpoints. If None, the checkpoints directory of the torch hub cache is used.
+
+    Returns
+    -------
+    List[Path]
+        The paths of the checkpoints that were stripped.
+    """
+    if model_dir is None:
+        model_dir = Path(hub.get_dir()) / "checkpoints"
+    model_dir = Path(model_dir)
+
+    stripped_paths = []
+    for ckpt_path in sorted(model_dir.glob("*.ckpt")):
+        try:
+            if strip_checkpoint(ckpt_path):
+                stripped_paths.append(ckpt_path)
+        except Exception as e:  # noqa: B902
+            logger.warning("Could not strip {}: {}", ckpt_path, e)
+    return stripped_paths
+
+
+def _init_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--ckpt_paths",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Paths to the checkpoint files to be stripped. The files are replaced in place.",
+    )
+    parser.add_argument(
+        "--hub",
+        action="store_true",
+        help="If set, strip all the checkpoints in the torch hub cache.",
+    )
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=None,
+        help="Directory of the cached checkpoints. Only used with --hub. If not provided, the torch hub cache is used.",
+    )
+    return parser
+
+
+def main(args: Namespace) -> None:
+    """Strip the checkpoints.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments for configuring the conversion.
+    """
+    if args.ckpt_paths is None and not args.hub:
+        raise ValueError("Either --ckpt_paths or --hub must be provided.")
+
+    if args.ckpt_paths is not None:
+        for ckpt_path in args.ckpt_paths:
+            strip_checkpoint(ckpt_path)
+    if args.hub:
+        stripped_paths = strip_hub_checkpoints(args.model_dir)
+        logger.info("Stripped {} checkpoints.", len(stripped_paths))
+
+
+if __name__ == "__main__":
+    parser = _init_parser()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,169 @@
+"""Opt-in torch.compile integration.
+
+Most models spend a large part of their time in many small kernels: the encoders, the recurrent update blocks, etc.
+Compiling these submodules with torch.compile fuses them into fewer kernels. The whole forward is not compiled, because
+the Python logic around them (pre-processing, correlation lookups, iteration loops) often breaks the graph or causes
+frequent recompilations.
+
+Each model declares the submodules that can be compiled in its compile_submodules class attribute. They are compiled
+with static shapes, so one specialized graph is produced for each input shape. When the model uses shape buckets (see
+ptlflow.utils.utils.ShapeBuckets), this results in one graph per bucket. The compiled artifacts are saved to a cache
+directory, so that later runs can reuse them instead of compiling again.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import functools
+import os
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Union
+
+from loguru import logger
+import torch
+from torch import hub
+import torch.nn as nn
+
+
+def get_default_compile_cache_dir() -> Path:
+    """Return the default directory where the compiled artifacts are cached.
+
+    Returns
+    -------
+    Path
+        The directory "ptlflow_compile_cache" inside the torch home directory (usually ~/.cache/torch).
+    """
+    return Path(hub.get_dir()).parent / "ptlflow_compile_cache"
+
+
+def compile_model(
+    model: nn.Module,
+    names: Optional[Sequence[str]] = None,
+    backend: str = "inductor",
+    mode: Optional[str] = None,
+    max_shapes: int = 16,
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> List[str]:
+    """Compile some submodules of the model with torch.compile.
+
+    The compilation is lazy: each submodule is compiled on the first forward with a new input shape. If the compilation
+    or the compiled forward fail, the submodule falls back to its original eager forward and a warning is shown.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be modified in place.
+    names : Optional[Sequence[str]], optional
+        Dotted paths, relative to the model, of the submodules to be compiled. If None, the compile_submodules attribute
+        of the model is used.
+    backend : str, default "inductor"
+        The torch.compile backend.
+    mode : Optional[str], optional
+        The torch.compile mode, e.g., "reduce-overhead" or "max-autotune".
+    max_shapes : int, default 16
+        Number of distinct input shapes (e.g., shape buckets) that each submodule is allowed to be specialized to. After
+        that, torch.compile stops recompiling and runs the submodule eagerly for new shapes.
+    cache_dir : Optional[Union[str, Path]], optional
+        Directory where the compiled artifacts are cached across runs. If None, the TORCHINDUCTOR_CACHE_DIR environment
+        variable is used, if it is set, or get_default_compile_cache_dir() otherwise.
+
+    Returns
+    -------
+    List[str]
+        The names of the submodules that were compiled.
+    """
+    if names is None:
+        names = getattr(model, "compile_submodules", ())
+    if len(names) == 0:
+        logger.info(
+            "{} does not declare any submodules to compile, it will run eagerly.",
+            model.__class__.__name__,
+        )
+        return []
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "TORCHINDUCTOR_CACHE_DIR", get_default_compile_cache_dir()
+        )
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(cache_dir)
+
+    import torch._dynamo.config as dynamo_config
+    import torch._inductor.config as inductor_config
+
+    inductor_config.fx_graph_cache = True
+
+    # Submodules of the same class share the same code object, so the limit is shared among all of them
+    recompile_limit = max_shapes * len(names)
+    limit_name = (
+        "recompile_limit"
+        if hasattr(dynamo_config, "recompile_limit")
+        else "cache_size_limit"
+    )
+    setattr(
+        dynamo_config,
+        limit_name,
+        max(getattr(dynamo_config, limit_name), recompile_limit),
+    )
+
+    compiled_names = []
+    for name in names:
+        try:
+            module = model.get_submodule(name)
+        except AttributeError:
+            logger.warning(
+                "{} does not have the submodule {} to compile",
+                model.__class__.__name__,
+                name,
+            )
+            continue
+
+        if getattr(module.forward, "_ptlflow_compiled", False):
+            compiled_names.append(name)
+            continue
+
+        compiled_forward = torch.compile(
+            module.forward, backend=backend, mode=mode, dynamic=False
+        )
+        module.forward = _with_eager_fallback(
+            compiled_forward, module.forward, f"{model.__class__.__name__}.{name}"
+        )
+        compiled_names.append(name)
+    return compiled_names
+
+
+def _with_eager_fallback(
+    compiled_fn: Callable, eager_fn: Callable, name: str
+) -> Callable:
+    failed = False
+
+    @functools.wraps(eager_fn)
+    def wrapper(*args, **kwargs):
+        nonlocal failed
+        if not failed:
+            try:
+                return compiled_fn(*args, **kwargs)
+            except Exception as e:  # noqa: B902
+                logger.warning(
+                    "torch.compile failed for {}, falling back to eager mode. Exception: {}",
+                    name,
+                    e,
+                )
+                failed = True
+        return eager_fn(*args, **kwargs)
+
+    wrapper._ptlflow_compiled = True
+    return wrapper
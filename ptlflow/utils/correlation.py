@@ -4,7 +4,8 @@ This is meant to be a simplified version of the SpatialCorrelationSampler from
 https://github.com/ClementPinard/Pytorch-Correlation-extension.
 
 This version is implemented purely in PyTorch. However, it only supports correlation with 1x1 kernels.
-It is also not as efficient as the original SpatialCorrelationSampler.
+It is also not as efficient as the original SpatialCorrelationSampler, especially the translated versions, which need
+to interpolate the target features with grid_sample.
 """
 
 # =============================================================================
@@ -31,6 +32,10 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+# Maximum amount of memory, in bytes, used by the intermediate tensors of one chunk of iter_spatial_correlation_sample
+# when running on the GPU
+SHIFT_CHUNK_MEMORY_BUDGET = 64 * 2**20
+
 
 def iter_spatial_correlation_sample(
     input1: torch.Tensor,
@@ -42,6 +47,7 @@ def iter_spatial_correlation_sample(
     dilation: Union[int, Tuple[int, int]] = 1,
     dilation_patch: Union[int, Tuple[int, int]] = 1,
     chunk_size: Optional[int] = None,
+    mode: str = "shift",
 ) -> torch.Tensor:
     """Apply spatial correlation sampling from input1 to input2 using iteration in PyTorch.
 
@@ -68,6 +74,14 @@ def iter_spatial_correlation_sample(
         Similar to dilation in convolution.
     dilation_patch : Union[int, Tuple[int, int]], default 1
         Step for every shift in patch.
+    chunk_size : Optional[int], optional
+        Number of displacements that are processed at the same time. If None, in "shift" mode it is 1 on the CPU, and on
+        the GPU it is chosen to fit the intermediate tensors into SHIFT_CHUNK_MEMORY_BUDGET. In "grid_sample" mode, all
+        the displacements are processed at once.
+    mode : str, default "shift"
+        How to sample input2. It can be either "shift" or "grid_sample". Since all displacements are integers, "shift"
+        mode samples input2 by slicing a zero-padded copy of it, which is exact and much faster. "grid_sample" mode
+        keeps the previous implementation based on F.grid_sample, which is mostly useful for benchmarking.
 
     Returns
     -------
@@ -80,6 +94,8 @@ def iter_spatial_correlation_sample(
         If kernel_size != 1.
     NotImplementedError
         If dilation != 1.
+    ValueError
+        If mode is not a valid choice.
     """
     # Make inputs be tuples
     kernel_size = (
@@ -104,6 +120,96 @@ def iter_spatial_correlation_sample(
         input1 = F.pad(input1, (padding[1], padding[1], padding[0], padding[0]))
         input2 = F.pad(input2, (padding[1], padding[1], padding[0], padding[0]))
 
+    if mode == "shift":
+        return _shift_spatial_correlation_sample(
+            input1, input2, patch_size, stride, dilation_patch, chunk_size
+        )
+    elif mode == "grid_sample":
+        return _grid_sample_spatial_correlation_sample(
+            input1, input2, patch_size, stride, dilation_patch, chunk_size
+        )
+    else:
+        raise ValueError(
+            f"Invalid mode {mode}. It must be either 'shift' or 'grid_sample'."
+        )
+
+
+def _shift_spatial_correlation_sample(
+    input1: torch.Tensor,
+    input2: torch.Tensor,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    dilation_patch: Tuple[int, int],
+    chunk_size: Optional[int],
+) -> torch.Tensor:
+    b, c, h, w = input2.shape
+    input1 = input1[:, :, :: stride[0], :: stride[1]]
+    sh, sw = input1.shape[2:4]
+
+    # Zero-padding input2 by the largest displacements lets every shift be a plain slice of the padded tensor.
+    # Positions outside of input2 read zeros, as in the grid_sample version.
+    offset = (
+        dilation_patch[0] * ((patch_size[0] - 1) // 2),
+        dilation_patch[1] * ((patch_size[1] - 1) // 2),
+    )
+    input2 = F.pad(
+        input2,
+        (
+            offset[1],
+            (patch_size[1] - 1) * dilation_patch[1] - offset[1],
+            offset[0],
+            (patch_size[0] - 1) * dilation_patch[0] - offset[0],
+        ),
+    )
+
+    num_patches = patch_size[0] * patch_size[1]
+    if chunk_size is None:
+        chunk_size = _get_auto_chunk_size(input1)
+    chunk_size = max(1, min(chunk_size, num_patches))
+
+    end_y = (sh - 1) * stride[0] + 1
+    end_x = (sw - 1) * stride[1] + 1
+    corr = input1.new_empty(b, num_patches, sh, sw)
+    for start_idx in range(0, num_patches, chunk_size):
+        end_idx = min(start_idx + chunk_size, num_patches)
+        shifted = []
+        for idx in range(start_idx, end_idx):
+            y0 = (idx // patch_size[1]) * dilation_patch[0]
+            x0 = (idx % patch_size[1]) * dilation_patch[1]
+            shifted.append(
+                input2[:, :, y0 : y0 + end_y : stride[0], x0 : x0 + end_x : stride[1]]
+            )
+        if len(shifted) == 1:
+            corr[:, start_idx] = (input1 * shifted[0]).sum(dim=1)
+        else:
+            shifted = torch.stack(shifted, dim=1)
+            corr[:, start_idx:end_idx] = (input1.unsqueeze(1) * shifted).sum(dim=2)
+
+    corr = corr.view(b, patch_size[0], patch_size[1], sh, sw)
+    return corr
+
+
+def _get_auto_chunk_size(input1: torch.Tensor) -> int:
+    if not input1.is_cuda:
+        # On the CPU, processing one displacement at a time keeps the operands in cache and it is always faster than
+        # stacking several shifted copies.
+        return 1
+    # On the GPU, larger chunks reduce the number of kernel launches. Each displacement in a chunk allocates one shifted
+    # copy of input1 and one product of the same size.
+    free_memory, _ = torch.cuda.mem_get_info(input1.device)
+    budget = min(SHIFT_CHUNK_MEMORY_BUDGET, free_memory // 4)
+    bytes_per_patch = 2 * input1.numel() * input1.element_size()
+    return max(1, int(budget // max(1, bytes_per_patch)))
+
+
+def _grid_sample_spatial_correlation_sample(
+    input1: torch.Tensor,
+    input2: torch.Tensor,
+    patch_size: Tuple[int, int],
+    stride: Tuple[int, int],
+    dilation_patch: Tuple[int, int],
+    chunk_size: Optional[int],
+) -> torch.Tensor:
     b, c, h, w = input2.shape
     input1 = input1[:, :, :: stride[0], :: stride[1]]
     sh, sw = input1.shape[2:4]
@@ -194,6 +300,7 @@ class IterSpatialCorrelationSampler(nn.Module):
         dilation: Union[int, Tuple[int, int]] = 1,
         dilation_patch: Union[int, Tuple[int, int]] = 1,
         chunk_size: Optional[int] = None,
+        mode: str = "shift",
     ) -> None:
         """Initialize IterSpatialCorrelationSampler.
 
@@ -211,6 +318,10 @@ class IterSpatialCorrelationSampler(nn.Module):
             Similar to dilation in convolution.
         dilation_patch : Union[int, Tuple[int, int]], default 1
             Step for every shift in patch.
+        chunk_size : Optional[int], optional
+            Number of displacements that are processed at the same time. See iter_spatial_correlation_sample().
+        mode : str, default "shift"
+            Either "shift" or "grid_sample". See iter_spatial_correlation_sample().
         """
         super(IterSpatialCorrelationSampler, self).__init__()
         self.kernel_size = kernel_size
@@ -220,6 +331,7 @@ class IterSpatialCorrelationSampler(nn.Module):
         self.dilation = dilation
         self.dilation_patch = dilation_patch
         self.chunk_size = chunk_size
+        self.mode = mode
 
     def forward(self, input1: torch.Tensor, input2: torch.Tensor) -> torch.Tensor:
         """Compute the correlation sampling from input1 to input2.
@@ -246,6 +358,7 @@ class IterSpatialCorrelationSampler(nn.Module):
             dilation=self.dilation,
             dilation_patch=self.dilation_patch,
             chunk_size=self.chunk_size,
+            mode=self.mode,
         )
 
 
@@ -5,6 +5,9 @@ for each directory. The samples are just randomly generated noise.
 
 The main purpose of this script is to be used with tests. But it can also be useful to visualize the structure of a dataset
 without having to download it.
+
+This module can also generate realistic-size synthetic samples (see generate_synthetic_sample and write_synthetic), which
+are used by ptlflow.data.datasets.SyntheticFlowDataset to benchmark the data loading pipeline without the real datasets.
 """
 
 # =============================================================================
@@ -26,13 +29,13 @@ without having to download it.
 
 import json
 from pathlib import Path
-from typing import Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 import cv2 as cv
 from loguru import logger
 import numpy as np
 
-from ptlflow.utils import flow_utils
+from ptlflow.utils import flow_container, flow_utils
 
 
 def write_autoflow(
@@ -580,3 +583,152 @@ def write_viper(
         flow_utils.flow_write(flow_path, flow, "viper_npz")
 
     logger.info("Created dataset on {}.", str(root_dir))
+
+
+# Extension and flow_utils format of each flow format supported by write_synthetic
+SYNTHETIC_FLOW_FORMATS = {
+    "flc": ("flc", "flc"),
+    "flo": ("flo", None),
+    "flo5": ("flo5", None),
+    "npz": ("npz", "viper_npz"),
+    "pfm": ("pfm", None),
+    "png": ("png", None),
+}
+
+
+def generate_synthetic_sample(
+    img_size: Tuple[int, int] = (436, 1024),
+    max_flow: float = 20.0,
+    sparse_density: Optional[float] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Generate a pair of images and the optical flow between them.
+
+    Unlike the noise used by the dummy datasets, the images and the flow are smooth, so that their file sizes and the
+    cost to encode and decode them are closer to the real datasets. The second image is the first one warped by the flow.
+
+    Parameters
+    ----------
+    img_size : Tuple[int, int], default (436, 1024)
+        The (height, width) of the sample.
+    max_flow : float, default 20.0
+        Maximum absolute value of each flow component.
+    sparse_density : Optional[float], optional
+        If provided, only this fraction of the flow pixels is valid, as in KITTI. The invalid pixels are set to NaN.
+    rng : Optional[np.random.Generator], optional
+        The random generator. If None, a new one is created.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The two uint8 HW3 BGR images and the float32 HW2 flow.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    height, width = img_size
+
+    img1 = _generate_smooth_noise(rng, img_size, 3, 8) + rng.normal(
+        0.0, 0.02, (height, width, 3)
+    )
+    img1 = (np.clip(img1, 0.0, 1.0) * 255).astype(np.uint8)
+    flow = (
+        2 * np.clip(_generate_smooth_noise(rng, img_size, 2, 32), 0.0, 1.0) - 1
+    ) * max_flow
+    flow = flow.astype(np.float32)
+
+    grid_x, grid_y = np.meshgrid(
+        np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32)
+    )
+    img2 = cv.remap(
+        img1,
+        grid_x - flow[..., 0],
+        grid_y - flow[..., 1],
+        cv.INTER_LINEAR,
+        borderMode=cv.BORDER_REFLECT,
+    )
+
+    if sparse_density is not None:
+        flow[rng.random(img_size) >= sparse_density] = np.nan
+    return img1, img2, flow
+
+
+def write_synthetic(
+    root_dir: Union[str, Path],
+    num_samples: int = 16,
+    img_size: Tuple[int, int] = (436, 1024),
+    flow_format: str = "flo",
+    max_flow: float = 20.0,
+    sparse_density: Optional[float] = None,
+    seed: int = 0,
+) -> Tuple[List[List[Path]], List[List[Union[Path, Tuple[Path, int]]]]]:
+    """Write realistic-size synthetic samples to disk. See generate_synthetic_sample.
+
+    Parameters
+    ----------
+    root_dir : Union[str, Path]
+        Path to the directory where the samples will be written. They are saved in the subdirectory
+        synthetic/<flow_format>.
+    num_samples : int, default 16
+        Number of image pairs.
+    img_size : Tuple[int, int], default (436, 1024)
+        The (height, width) of the samples.
+    flow_format : str, default "flo"
+        The format of the flow files. One of SYNTHETIC_FLOW_FORMATS. With "flc", all the flows are written to a single
+        container file, and each flow path is a (container path, frame index) pair.
+    max_flow : float, default 20.0
+        Maximum absolute value of each flow component.
+    sparse_density : Optional[float], optional
+        If provided, only this fraction of the flow pixels is valid. Note that only the png format stores the valid mask
+        compactly, the other formats store the invalid pixels as NaN.
+    seed : int, default 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    Tuple[List[List[Path]], List[List[Union[Path, Tuple[Path, int]]]]]
+        The image and flow paths, in the same structure as the img_paths and flow_paths of
+        ptlflow.data.datasets.BaseFlowDataset.
+    """
+    if flow_format not in SYNTHETIC_FLOW_FORMATS:
+        raise ValueError(
+            f"Invalid flow_format {flow_format}. Must be one of {list(SYNTHETIC_FLOW_FORMATS.keys())}."
+        )
+    extension, write_format = SYNTHETIC_FLOW_FORMATS[flow_format]
+
+    out_dir = Path(root_dir) / "synthetic" / flow_format
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    img_paths = []
+    flow_paths = []
+    container_writer = None
+    if flow_format == "flc":
+        container_writer = flow_container.FlowContainerWriter(out_dir / "flows.flc")
+    for i in range(num_samples):
+        img1, img2, flow = generate_synthetic_sample(
+            img_size, max_flow, sparse_density, rng
+        )
+        img1_path = out_dir / f"{i:06d}_img1.png"
+        img2_path = out_dir / f"{i:06d}_img2.png"
+        cv.imwrite(str(img1_path), img1)
+        cv.imwrite(str(img2_path), img2)
+        if container_writer is not None:
+            flow_path = (container_writer.path, container_writer.write(flow))
+        else:
+            flow_path = out_dir / f"{i:06d}_flow.{extension}"
+            flow_utils.flow_write(flow_path, flow, write_format)
+        img_paths.append([img1_path, img2_path])
+        flow_paths.append([flow_path])
+    if container_writer is not None:
+        container_writer.close()
+
+    logger.info("Created {} synthetic samples on {}.", num_samples, str(out_dir))
+    return img_paths, flow_paths
+
+
+def _generate_smooth_noise(
+    rng: np.random.Generator, img_size: Tuple[int, int], channels: int, scale: int
+) -> np.ndarray:
+    low_res = rng.random(
+        (max(1, img_size[0] // scale), max(1, img_size[1] // scale), channels)
+    ).astype(np.float32)
+    noise = cv.resize(low_res, img_size[::-1], interpolation=cv.INTER_CUBIC)
+    return noise.reshape(img_size[0], img_size[1], channels)
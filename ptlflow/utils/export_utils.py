@@ -0,0 +1,259 @@
+"""Export models to ONNX and check them with ONNX Runtime.
+
+The models in PTLFlow receive and return dicts, and many of them contain Python logic (input padding, iteration loops)
+that is traced into a static graph during the export. FlowExportWrapper adapts any model to a tensor-in/tensor-out
+interface, so that it can be exported by torch.onnx.export. The iteration loops are unrolled during the export, so the
+number of iterations is fixed in the exported graph.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import inspect
+from pathlib import Path
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from loguru import logger
+import numpy as np
+import torch
+import torch.nn as nn
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+ONNX_INPUT_NAME = "images"
+ONNX_OUTPUT_NAME = "flows"
+
+
+class FlowExportWrapper(nn.Module):
+    """Tensor-in/tensor-out adapter for the optical flow models.
+
+    The input is a 5D tensor BNCHW with the two images (N = 2) with values in [0, 1]. The output is a 4D tensor B2HW with
+    the predicted flow.
+    """
+
+    def __init__(self, model: nn.Module, iters: Optional[int] = None) -> None:
+        """Initialize FlowExportWrapper.
+
+        Parameters
+        ----------
+        model : nn.Module
+            The model to be wrapped. It is set to eval mode.
+        iters : Optional[int], optional
+            If provided, and if the model has an iters attribute, the number of refinement iterations is set to this
+            value. Otherwise, the number of iterations defined in the model arguments is used.
+        """
+        super().__init__()
+        self.model = model
+        # torch.onnx.export restores the training mode of the root module after the export, which would also propagate
+        # to the wrapped model, so the wrapper itself must be in eval mode
+        self.eval()
+        if hasattr(self.model, "warm_start"):
+            self.model.warm_start = False
+        if iters is not None:
+            if hasattr(self.model, "iters"):
+                self.model.iters = iters
+            else:
+                logger.warning(
+                    "{} does not have an iters attribute, using its default number of iterations.",
+                    self.model.__class__.__name__,
+                )
+
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        preds = self.model({"images": images})
+        return preds["flows"][:, 0]
+
+
+def prepare_model_for_export(
+    model: nn.Module, iters: Optional[int] = None
+) -> FlowExportWrapper:
+    """Wrap the model with FlowExportWrapper and apply the inference optimizations available to it.
+
+    If the model has a fuse_for_inference() method, it is called before wrapping.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be exported.
+    iters : Optional[int], optional
+        Number of refinement iterations. See FlowExportWrapper.
+
+    Returns
+    -------
+    FlowExportWrapper
+        The wrapped model, in eval mode.
+    """
+    model = model.eval()
+    fuse_fn = getattr(model, "fuse_for_inference", None)
+    if callable(fuse_fn):
+        fuse_fn()
+    return FlowExportWrapper(model, iters)
+
+
+def export_onnx(
+    model: nn.Module,
+    output_path: Union[str, Path],
+    input_size: Tuple[int, int],
+    batch_size: int = 1,
+    dynamic_axes: bool = False,
+    opset_version: int = 17,
+) -> Path:
+    """Export the model to ONNX.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be exported, usually a FlowExportWrapper. It is exported on the device where it currently is.
+    output_path : Union[str, Path]
+        Path to the output .onnx file.
+    input_size : Tuple[int, int]
+        The (height, width) of the sample input used for tracing.
+    batch_size : int, default 1
+        The batch size of the sample input used for tracing.
+    dynamic_axes : bool, default False
+        If True, the batch, height and width axes of the input and output are marked as dynamic. Note that the models
+        whose traced graph depends on the input size (e.g., through padding computed in Python) may still only work
+        correctly for the size used during the export.
+    opset_version : int, default 17
+        The ONNX opset version.
+
+    Returns
+    -------
+    Path
+        The path to the exported file.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    device = next(model.parameters()).device
+    sample_inputs = torch.rand(batch_size, 2, 3, input_size[0], input_size[1]).to(
+        device
+    )
+
+    axes = None
+    if dynamic_axes:
+        axes = {
+            ONNX_INPUT_NAME: {0: "batch", 3: "height", 4: "width"},
+            ONNX_OUTPUT_NAME: {0: "batch", 2: "height", 3: "width"},
+        }
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch versions export with dynamo by default, but the TorchScript exporter supports dynamic_axes.
+        # torch < 2.5 does not accept this argument.
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample_inputs,),
+            str(output_path),
+            input_names=[ONNX_INPUT_NAME],
+            output_names=[ONNX_OUTPUT_NAME],
+            dynamic_axes=axes,
+            opset_version=opset_version,
+            **export_kwargs,
+        )
+    return output_path
+
+
+def create_onnx_session(onnx_path: Union[str, Path], num_threads: Optional[int] = None):
+    """Create an ONNX Runtime CPU session.
+
+    Parameters
+    ----------
+    onnx_path : Union[str, Path]
+        Path to the .onnx file.
+    num_threads : Optional[int], optional
+        Number of intra-op threads. If None, ONNX Runtime chooses it.
+
+    Returns
+    -------
+    onnxruntime.InferenceSession
+        The session.
+    """
+    if onnxruntime is None:
+        raise ImportError(
+            "onnxruntime is not installed. Install it with: pip install onnxruntime"
+        )
+    options = onnxruntime.SessionOptions()
+    if num_threads is not None:
+        options.intra_op_num_threads = num_threads
+    return onnxruntime.InferenceSession(
+        str(onnx_path), options, providers=["CPUExecutionProvider"]
+    )
+
+
+def check_onnx_parity(
+    model: nn.Module,
+    session,
+    images: torch.Tensor,
+) -> Dict[str, float]:
+    """Compare the predictions of the ONNX model against the PyTorch model.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The PyTorch model, usually a FlowExportWrapper.
+    session : onnxruntime.InferenceSession
+        The session of the exported model.
+    images : torch.Tensor
+        The inputs, as a 5D tensor BNCHW.
+
+    Returns
+    -------
+    Dict[str, float]
+        "max_abs_diff" and "epe" (the average end-point-error) between the two predictions.
+    """
+    device = next(model.parameters()).device
+    with torch.no_grad():
+        flows_ref = model(images.to(device)).float().cpu()
+    flows = session.run(None, {ONNX_INPUT_NAME: images.cpu().numpy()})[0]
+    flows = torch.from_numpy(flows).float()
+    return {
+        "max_abs_diff": (flows - flows_ref).abs().max().item(),
+        "epe": torch.norm(flows - flows_ref, p=2, dim=1).mean().item(),
+    }
+
+
+def benchmark_onnx(
+    session, images: np.ndarray, num_warmup: int = 2, num_samples: int = 10
+) -> float:
+    """Measure the average latency of the ONNX model.
+
+    Parameters
+    ----------
+    session : onnxruntime.InferenceSession
+        The session of the exported model.
+    images : np.ndarray
+        The inputs, as a 5D array BNCHW.
+    num_warmup : int, default 2
+        Number of runs before the timing starts.
+    num_samples : int, default 10
+        Number of timed runs.
+
+    Returns
+    -------
+    float
+        The average latency in milliseconds.
+    """
+    inputs = {ONNX_INPUT_NAME: images}
+    for _ in range(num_warmup):
+        session.run(None, inputs)
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        session.run(None, inputs)
+    return 1000 * (time.perf_counter() - start) / max(1, num_samples)
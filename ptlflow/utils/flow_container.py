@@ -0,0 +1,382 @@
+"""Compact flow container: many optical flow frames in one file, with random access.
+
+The container (.flc) stores each frame as a separately encoded chunk, and an index of the chunks at the end of the file,
+so any frame can be read without decoding the others. The file is read through a memory map: when the frames are not
+compressed (codec "none"), FlowContainer.view() returns a NumPy view of the stored values without any copy.
+
+The values can be stored as:
+
+- float32: lossless.
+- float16: relative error below 2^-11 (about 0.02 px for a 40 px displacement).
+- int16: fixed point with a given quant_step. The absolute error is at most quant_step / 2, and the values must be smaller
+  than 32767 * quant_step (about 512 px with the default quant_step of 1/64).
+
+NaN values, used by the datasets to mark invalid pixels, are kept in all the types.
+
+When the frames are compressed, the bytes of the values are first shuffled (all the first bytes, then all the second
+bytes), and the int16 values are delta-coded along the rows, which makes smooth flow fields compress much better.
+
+File layout (all integers are little-endian)::
+
+    magic (8 bytes) | header size (uint32) | JSON header | padding
+    frame 0 | padding | frame 1 | padding | ...
+    index: num_frames x (offset uint64, nbytes uint64, height uint32, width uint32)
+    index offset (uint64) | num_frames (uint32) | index magic (4 bytes)
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import functools
+import json
+import os
+from pathlib import Path
+import struct
+from typing import Iterable, Optional, Union
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FLOW_CONTAINER_DTYPES = ("float16", "float32", "int16")
+FLOW_CONTAINER_CODECS = ("none", "zlib", "zstd")
+
+_MAGIC = b"PTLFLC\x00\x01"
+_INDEX_MAGIC = b"FLCI"
+_ALIGNMENT = 64
+_INDEX_DTYPE = np.dtype(
+    [("offset", "<u8"), ("nbytes", "<u8"), ("height", "<u4"), ("width", "<u4")]
+)
+_FOOTER_SIZE = 16
+# Reserved int16 value for NaN
+_INT16_NAN = -32768
+
+
+class FlowContainerWriter(object):
+    """Write optical flow frames to a container file.
+
+    Examples
+    --------
+    >>> with FlowContainerWriter("flows.flc", dtype="int16", quant_step=1 / 64) as writer:
+    >>>     for flow in flows:
+    >>>         writer.write(flow)
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        dtype: str = "float16",
+        quant_step: float = 1.0 / 64,
+        codec: str = "zlib",
+        level: int = 1,
+    ) -> None:
+        """Initialize FlowContainerWriter.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            Path of the file to be written. It is overwritten if it exists.
+        dtype : str, default "float16"
+            Type used to store the values. One of FLOW_CONTAINER_DTYPES.
+        quant_step : float, default 1/64
+            The quantization step of the int16 type. Not used with the other types.
+        codec : str, default "zlib"
+            Compression of the frames. One of FLOW_CONTAINER_CODECS. The "zstd" codec requires the zstandard package.
+        level : int, default 1
+            Compression level. Low levels are faster, and the gain of higher levels is usually small for optical flow.
+        """
+        if dtype not in FLOW_CONTAINER_DTYPES:
+            raise ValueError(
+                f"Invalid dtype {dtype}. Must be one of {FLOW_CONTAINER_DTYPES}."
+            )
+        if codec not in FLOW_CONTAINER_CODECS:
+            raise ValueError(
+                f"Invalid codec {codec}. Must be one of {FLOW_CONTAINER_CODECS}."
+            )
+        if codec == "zstd" and zstandard is None:
+            raise ImportError(
+                "zstandard is not installed. Install it with: pip install zstandard"
+            )
+
+        self.path = Path(path)
+        self.dtype = dtype
+        self.quant_step = quant_step if dtype == "int16" else None
+        self.codec = codec
+        self.level = level
+        self.filters = []
+        if codec != "none":
+            if dtype == "int16":
+                self.filters.append("delta")
+            self.filters.append("shuffle")
+        self.index = []
+
+        header = {
+            "version": 1,
+            "dtype": self.dtype,
+            "quant_step": self.quant_step,
+            "codec": self.codec,
+            "filters": self.filters,
+        }
+        header_bytes = json.dumps(header).encode()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "wb")
+        self.file.write(_MAGIC)
+        self.file.write(struct.pack("<I", len(header_bytes)))
+        self.file.write(header_bytes)
+        self._pad()
+
+    def write(self, flow: np.ndarray) -> int:
+        """Append one frame to the container.
+
+        Parameters
+        ----------
+        flow : np.ndarray
+            3D flow in the HWF (Height, Width, Flow) layout, where F=2.
+
+        Returns
+        -------
+        int
+            The index of the frame in the container.
+        """
+        assert len(flow.shape) == 3 and flow.shape[2] == 2
+        values = _encode_values(flow, self.dtype, self.quant_step)
+        if "delta" in self.filters:
+            values = values.copy()
+            values[:, 1:] = np.diff(values, axis=1)
+        data = np.ascontiguousarray(values).view(np.uint8)
+        if "shuffle" in self.filters:
+            data = data.reshape(-1, values.itemsize).T
+        data = np.ascontiguousarray(data).tobytes()
+        if self.codec == "zlib":
+            data = zlib.compress(data, self.level)
+        elif self.codec == "zstd":
+            data = zstandard.ZstdCompressor(level=self.level).compress(data)
+
+        offset = self.file.tell()
+        self.file.write(data)
+        self._pad()
+        self.index.append((offset, len(data), flow.shape[0], flow.shape[1]))
+        return len(self.index) - 1
+
+    def close(self) -> None:
+        """Write the index and close the file."""
+        if self.file is None:
+            return
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=_INDEX_DTYPE).tobytes())
+        self.file.write(struct.pack("<QI", index_offset, len(self.index)))
+        self.file.write(_INDEX_MAGIC)
+        self.file.close()
+        self.file = None
+
+    def _pad(self) -> None:
+        remainder = self.file.tell() % _ALIGNMENT
+        if remainder > 0:
+            self.file.write(b"\x00" * (_ALIGNMENT - remainder))
+
+    def __enter__(self) -> "FlowContainerWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class FlowContainer(object):
+    """Read optical flow frames from a container file.
+
+    The file is memory mapped, so opening a container is cheap, and only the bytes of the frames that are read are loaded.
+
+    Examples
+    --------
+    >>> container = FlowContainer("flows.flc")
+    >>> flow = container[3]
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """Initialize FlowContainer.
+
+        Parameters
+        ----------
+        path : Union[str, Path]
+            Path of the container file.
+        """
+        self.path = Path(path)
+        self.data = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if bytes(self.data[: len(_MAGIC)]) != _MAGIC or (
+            bytes(self.data[-len(_INDEX_MAGIC) :]) != _INDEX_MAGIC
+        ):
+            raise ValueError(f"{path} is not a valid or complete flow container.")
+
+        header_size = struct.unpack("<I", bytes(self.data[8:12]))[0]
+        header = json.loads(bytes(self.data[12 : 12 + header_size]).decode())
+        self.dtype = header["dtype"]
+        self.quant_step = header["quant_step"]
+        self.codec = header["codec"]
+        self.filters = header["filters"]
+        if self.codec == "zstd" and zstandard is None:
+            raise ImportError(
+                "zstandard is not installed. Install it with: pip install zstandard"
+            )
+
+        index_offset, num_frames = struct.unpack(
+            "<QI", bytes(self.data[-_FOOTER_SIZE : -len(_INDEX_MAGIC)])
+        )
+        self.index = np.frombuffer(
+            self.data, dtype=_INDEX_DTYPE, count=num_frames, offset=index_offset
+        )
+
+    @property
+    def max_error(self) -> Optional[float]:
+        """Maximum absolute error of the stored values, or None if the error is relative (float16) or zero (float32)."""
+        return None if self.quant_step is None else self.quant_step / 2
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        """Decode one frame.
+
+        Parameters
+        ----------
+        idx : int
+            Index of the frame.
+
+        Returns
+        -------
+        np.ndarray
+            The float32 flow in the HWF layout. Invalid pixels are NaN.
+        """
+        offset, nbytes, height, width = self.index[idx].tolist()
+        data = self.data[offset : offset + nbytes]
+        if self.codec == "zlib":
+            data = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        elif self.codec == "zstd":
+            data = np.frombuffer(
+                zstandard.ZstdDecompressor().decompress(bytes(data)), dtype=np.uint8
+            )
+
+        storage_dtype = np.dtype(self.dtype)
+        if "shuffle" in self.filters:
+            data = np.ascontiguousarray(data.reshape(storage_dtype.itemsize, -1).T)
+        values = data.view(storage_dtype).reshape(height, width, 2)
+        if "delta" in self.filters:
+            values = np.cumsum(values, axis=1, dtype=storage_dtype)
+        return _decode_values(values, self.quant_step)
+
+    def view(self, idx: int) -> np.ndarray:
+        """Return the stored values of one frame, without copying or decoding them.
+
+        Only available for uncompressed containers (codec "none").
+
+        Parameters
+        ----------
+        idx : int
+            Index of the frame.
+
+        Returns
+        -------
+        np.ndarray
+            A read-only HWF view of the memory map, in the stored dtype. For int16 containers, the values must be
+            multiplied by quant_step, and the NaNs are stored as -32768.
+        """
+        if self.codec != "none":
+            raise ValueError("Views are only available for uncompressed containers.")
+        offset, _, height, width = self.index[idx].tolist()
+        return np.frombuffer(
+            self.data,
+            dtype=self.dtype,
+            count=height * width * 2,
+            offset=offset,
+        ).reshape(height, width, 2)
+
+
+def write_flow_container(
+    path: Union[str, Path], flows: Iterable[np.ndarray], **kwargs
+) -> None:
+    """Write all the flows to a container file.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        Path of the file to be written.
+    flows : Iterable[np.ndarray]
+        The flows, in the HWF layout.
+    kwargs
+        Other arguments for FlowContainerWriter.
+    """
+    with FlowContainerWriter(path, **kwargs) as writer:
+        for flow in flows:
+            writer.write(flow)
+
+
+def read_flow_container(path: Union[str, Path], idx: int = 0) -> np.ndarray:
+    """Read one frame from a container file.
+
+    The opened containers are cached, so reading many frames of the same file does not parse the index again.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        Path of the container file.
+    idx : int, default 0
+        Index of the frame.
+
+    Returns
+    -------
+    np.ndarray
+        The float32 flow in the HWF layout.
+    """
+    stat = os.stat(path)
+    return _open_container(str(path), stat.st_mtime_ns, stat.st_size)[idx]
+
+
+@functools.lru_cache(maxsize=32)
+def _open_container(path: str, mtime_ns: int, size: int) -> FlowContainer:
+    # The modification time and size are part of the key, so files that are rewritten are opened again
+    return FlowContainer(path)
+
+
+def _encode_values(
+    flow: np.ndarray, dtype: str, quant_step: Optional[float]
+) -> np.ndarray:
+    if dtype != "int16":
+        return flow.astype(dtype)
+
+    nan_mask = np.isnan(flow)
+    values = np.round(np.where(nan_mask, 0.0, flow) / quant_step)
+    max_value = np.abs(values).max() if values.size > 0 else 0
+    if max_value > np.iinfo(np.int16).max:
+        raise ValueError(
+            f"The flow values are too large to be stored as int16 with quant_step={quant_step}. The maximum supported "
+            f"absolute value is {np.iinfo(np.int16).max * quant_step}, use a larger quant_step or another dtype."
+        )
+    values = values.astype(np.int16)
+    values[nan_mask] = _INT16_NAN
+    return values
+
+
+def _decode_values(values: np.ndarray, quant_step: Optional[float]) -> np.ndarray:
+    if values.dtype != np.int16:
+        return values.astype(np.float32)
+
+    flow = values.astype(np.float32) * np.float32(quant_step)
+    flow[values == _INT16_NAN] = np.nan
+    return flow
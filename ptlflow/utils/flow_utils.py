@@ -25,7 +25,7 @@ import numpy as np
 import torch
 
 from .external import flowpy, raft, selflow, flow_IO
-from . import flowpy_torch
+from . import flow_container, flowpy_torch
 
 
 def flow_to_rgb(
@@ -86,10 +86,11 @@ def flow_read(
     Parameters
     ----------
     input_data: Sequence[Any], str, Path or IO
-        Path of the file to read or a sequence containing the path and extra information.
+        Path of the file to read or a sequence containing the path and extra information. For "flc" containers, it can be
+        a (path, frame_index) sequence, otherwise the first frame is read.
     format: str, optional
-        Specify in what format the flow is read, accepted formats: "flo", "flo5", "kubric_png", "npz", "pfm", "png".
-        If None, it is guessed from the file extension.
+        Specify in what format the flow is read, accepted formats: "flc", "flo", "flo5", "kubric_png", "npz", "pfm",
+        "png". If None, it is guessed from the file extension.
 
     Returns
     -------
@@ -103,9 +104,16 @@ def flow_read(
     ptlflow.utils.external.flowpy.flow_read
     ptlflow.utils.external.raft.read_pfm
     ptlflow.utils.external.flow_IO.readFlo5Flow
+    ptlflow.utils.flow_container.FlowContainer
     write_pfm
     """
-    if (format is not None and format == "pfm") or str(input_data).endswith("pfm"):
+    if isinstance(input_data, (list, tuple)) and (
+        format == "flc" or str(input_data[0]).endswith("flc")
+    ):
+        return flow_container.read_flow_container(input_data[0], input_data[1])
+    elif (format is not None and format == "flc") or str(input_data).endswith("flc"):
+        return flow_container.read_flow_container(input_data)
+    elif (format is not None and format == "pfm") or str(input_data).endswith("pfm"):
         return raft.read_pfm(input_data)
     elif (format is not None and format == "flo5") or str(input_data).endswith("flo5"):
         return flow_IO.readFlo5Flow(input_data)
@@ -139,14 +147,18 @@ def flow_write(
         flow[..., 0] should be the x-displacement
         flow[..., 1] should be the y-displacement
     format: str, optional
-        Specify in what format the flow is written, accepted formats: "png" or "flo"
-        If None, it is guessed on the file extension
+        Specify in what format the flow is written, accepted formats: "flc", "flo", "flo5", "npy", "pfm", "png",
+        "png128" or "viper_npz". If None, it is guessed on the file extension. The "flc" format writes a container with
+        a single float16 frame, use ptlflow.utils.flow_container.FlowContainerWriter for other settings or to write
+        multiple frames in the same file.
 
     See Also
     --------
     ptlflow.utils.external.flowpy.flow_write
     """
-    if (format is not None and format == "pfm") or str(output_file).endswith("pfm"):
+    if (format is not None and format == "flc") or str(output_file).endswith("flc"):
+        flow_container.write_flow_container(output_file, [flow])
+    elif (format is not None and format == "pfm") or str(output_file).endswith("pfm"):
         selflow.write_pfm(output_file, flow)
     elif (format is not None and format == "flo5") or str(output_file).endswith("flo5"):
         flow_IO.writeFlo5File(flow, output_file)
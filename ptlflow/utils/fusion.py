@@ -0,0 +1,312 @@
+"""Inference-time layer fusion.
+
+The models are trained with layers that are not needed, or that can be simplified, once the weights are frozen:
+
+- BatchNorm layers in eval mode are just an affine transformation, which can be folded into the preceding convolution.
+- Some modules are reparameterized during training (e.g., separable 1D kernels) and can be merged into a single kernel.
+  These modules implement their own fuse_for_inference() method, which is called by this pass.
+- Dropout and DropPath are identities in eval mode, but they still add a module call.
+
+Since the models do not share a common structure, the conv -> BatchNorm pairs are found by recording the functional calls
+made during one forward pass with sample inputs. A pair is only folded if the output of the convolution is used
+exclusively by the BatchNorm, so the pass does not depend on the naming of the submodules.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from typing import Any, Callable, Dict, List, Tuple
+
+from loguru import logger
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.overrides import TorchFunctionMode
+from torch.utils._pytree import tree_flatten
+
+CONV_FUNCTIONS = (F.conv1d, F.conv2d, F.conv3d)
+
+
+class _CallRecorder(TorchFunctionMode):
+    """Record which tensors are produced by convolutions, and how many times each tensor is used."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Keep references to the tensors, so that their ids are not reused during the recording
+        self.tensors = []
+        self.num_uses = {}
+        self.conv_outputs = {}
+        self.conv_calls = []
+        self.bn_calls = []
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = {} if kwargs is None else kwargs
+        out = func(*args, **kwargs)
+
+        flat_out, _ = tree_flatten(out)
+        if not any(isinstance(o, torch.Tensor) for o in flat_out):
+            # Calls that do not produce tensors (e.g., x.shape, x.dim()) do not consume their inputs
+            return out
+
+        flat_args, _ = tree_flatten((args, kwargs))
+        for a in flat_args:
+            if isinstance(a, torch.Tensor):
+                self.tensors.append(a)
+                self.num_uses[id(a)] = self.num_uses.get(id(a), 0) + 1
+
+        if func in CONV_FUNCTIONS and isinstance(out, torch.Tensor):
+            weight = args[1] if len(args) > 1 else kwargs.get("weight")
+            self.tensors.append(out)
+            self.conv_outputs[id(out)] = weight
+            self.conv_calls.append((weight, id(out)))
+        elif func is F.batch_norm:
+            running_mean = args[1] if len(args) > 1 else kwargs.get("running_mean")
+            self.bn_calls.append((running_mean, id(args[0])))
+        return out
+
+
+def find_conv_bn_pairs(
+    model: nn.Module, inputs: Any
+) -> List[Tuple[nn.Module, nn.Module]]:
+    """Find the convolutions whose outputs are only consumed by a BatchNorm layer.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model, in eval mode.
+    inputs : Any
+        Sample inputs for one forward pass of the model.
+
+    Returns
+    -------
+    List[Tuple[nn.Module, nn.Module]]
+        Pairs of (module that owns the convolution weight, BatchNorm module).
+    """
+    param_owners = {}
+    for module in model.modules():
+        for name, param in module.named_parameters(recurse=False):
+            if name == "weight":
+                param_owners[id(param)] = module
+    bn_modules = {
+        id(m.running_mean): m
+        for m in model.modules()
+        if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.running_mean is not None
+    }
+
+    recorder = _CallRecorder()
+    with torch.no_grad(), recorder:
+        model(inputs)
+
+    # Map each convolution weight to the BatchNorm that consumes its outputs. None means that it cannot be folded.
+    weight_to_bn = {}
+    bn_to_weight = {}
+    bn_inputs = {
+        in_id: bn_modules.get(id(running_mean))
+        for running_mean, in_id in recorder.bn_calls
+    }
+    for weight, out_id in recorder.conv_calls:
+        bn = bn_inputs.get(out_id)
+        if (
+            id(weight) not in param_owners
+            or bn is None
+            or recorder.num_uses.get(out_id, 0) != 1
+        ):
+            bn = None
+        if weight_to_bn.get(id(weight), bn) is not bn:
+            bn = None
+        weight_to_bn[id(weight)] = bn
+    for running_mean, in_id in recorder.bn_calls:
+        bn = bn_modules.get(id(running_mean))
+        if bn is None:
+            continue
+        weight = recorder.conv_outputs.get(in_id)
+        weight_id = None if weight is None else id(weight)
+        if bn_to_weight.get(id(bn), weight_id) != weight_id:
+            weight_id = None
+        bn_to_weight[id(bn)] = weight_id
+
+    pairs = []
+    for weight_id, bn in weight_to_bn.items():
+        if bn is not None and bn_to_weight.get(id(bn)) == weight_id:
+            pairs.append((param_owners[weight_id], bn))
+    return pairs
+
+
+def fold_conv_bn(conv: nn.Module, bn: nn.Module) -> bool:
+    """Fold the parameters of a BatchNorm layer into the preceding convolution.
+
+    Parameters
+    ----------
+    conv : nn.Module
+        The module that owns the convolution parameters. It must have a "weight" parameter, whose first dimension is the
+        output channels, and a "bias" attribute, which may be None.
+    bn : nn.Module
+        The BatchNorm module. It is not removed from the model by this function.
+
+    Returns
+    -------
+    bool
+        True if the parameters were folded, False if the modules are not compatible.
+    """
+    if not hasattr(conv, "bias") or conv.weight.shape[0] != bn.num_features:
+        return False
+
+    with torch.no_grad():
+        scale = torch.rsqrt(bn.running_var + bn.eps)
+        if bn.weight is not None:
+            scale = scale * bn.weight
+        shift = -bn.running_mean * scale
+        if bn.bias is not None:
+            shift = shift + bn.bias
+
+        conv.weight.mul_(scale.view(-1, *([1] * (conv.weight.dim() - 1))))
+        if conv.bias is None:
+            conv.bias = nn.Parameter(shift.to(conv.weight.dtype))
+        else:
+            conv.bias.mul_(scale).add_(shift)
+    return True
+
+
+def remove_dropout(model: nn.Module) -> int:
+    """Replace the Dropout and DropPath modules by identities.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be modified in place.
+
+    Returns
+    -------
+    int
+        The number of replaced modules.
+    """
+    return _replace_modules(
+        model,
+        lambda m: isinstance(m, nn.modules.dropout._DropoutNd)
+        or m.__class__.__name__ == "DropPath",
+    )
+
+
+def fuse_for_inference(
+    model: nn.Module,
+    inputs: Any,
+    max_epe: float = 1e-2,
+) -> Dict[str, int]:
+    """Apply all the inference-time fusions to the model.
+
+    The fusions are applied in this order:
+    1. The fuse_for_inference() method of each submodule that defines it.
+    2. Folding of BatchNorm layers into the preceding convolutions.
+    3. Removal of Dropout and DropPath.
+
+    The outputs before and after the fusion are compared. If they differ, all the changes are reverted.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be modified in place. It is set to eval mode.
+    inputs : Any
+        Sample inputs for one forward pass of the model.
+    max_epe : float, default 1e-2
+        Maximum average end-point-error between the flows predicted before and after the fusion.
+
+    Returns
+    -------
+    Dict[str, int]
+        The number of fused submodules, folded BatchNorm layers and removed dropouts.
+    """
+    model.eval()
+    state = _ModelState(model)
+    with torch.no_grad():
+        flows_ref = model(inputs)["flows"].clone()
+
+    counts = {"fused_submodules": 0, "folded_batch_norms": 0, "removed_dropouts": 0}
+    for module in list(model.modules()):
+        if module is not model and callable(
+            getattr(module, "fuse_for_inference", None)
+        ):
+            module.fuse_for_inference()
+            counts["fused_submodules"] += 1
+
+    for conv, bn in find_conv_bn_pairs(model, inputs):
+        if fold_conv_bn(conv, bn):
+            counts["folded_batch_norms"] += _replace_modules(model, lambda m: m is bn)
+
+    counts["removed_dropouts"] = remove_dropout(model)
+
+    with torch.no_grad():
+        flows = model(inputs)["flows"]
+    epe = torch.norm(flows - flows_ref, p=2, dim=-3).mean().item()
+    if not epe <= max_epe:
+        logger.warning(
+            "The fusion changed the outputs of {} (EPE {:.4f}), it will be reverted.",
+            model.__class__.__name__,
+            epe,
+        )
+        state.restore()
+        return {k: 0 for k in counts}
+
+    logger.info(
+        "Fused {}: {} (EPE to the unfused model: {:.6f})",
+        model.__class__.__name__,
+        counts,
+        epe,
+    )
+    return counts
+
+
+def _replace_modules(model: nn.Module, condition: Callable[[nn.Module], bool]) -> int:
+    num_replaced = 0
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if condition(child):
+                setattr(parent, name, nn.Identity())
+                num_replaced += 1
+    return num_replaced
+
+
+class _ModelState(object):
+    """Snapshot of the submodules, parameters and buffers of a model, to revert a failed fusion."""
+
+    def __init__(self, model: nn.Module) -> None:
+        self.entries = []
+        for module in model.modules():
+            self.entries.append(
+                (
+                    module,
+                    dict(module._modules),
+                    {
+                        k: None if v is None else v.detach().clone()
+                        for k, v in module._parameters.items()
+                    },
+                    {
+                        k: None if v is None else v.clone()
+                        for k, v in module._buffers.items()
+                    },
+                    dict(module.__dict__),
+                )
+            )
+
+    def restore(self) -> None:
+        for module, modules, params, buffers, attributes in self.entries:
+            module.__dict__.clear()
+            module.__dict__.update(attributes)
+            module._modules = dict(modules)
+            module._parameters = {
+                k: None if v is None else nn.Parameter(v, requires_grad=v.requires_grad)
+                for k, v in params.items()
+            }
+            module._buffers = dict(buffers)
@@ -23,7 +23,13 @@ import numpy as np
 import torch
 
 from ptlflow.data.flow_transforms import ToTensor
-from ptlflow.utils.utils import InputScaler
+from ptlflow.utils.utils import (
+    InputPadder,
+    InputScaler,
+    ShapeBuckets,
+    get_image_resizer,
+    images_to_float,
+)
 
 
 class IOAdapter(object):
@@ -39,6 +45,8 @@ class IOAdapter(object):
         interpolation_align_corners: bool = False,
         cuda: bool = False,
         fp16: bool = False,
+        shape_buckets: Optional[ShapeBuckets] = None,
+        uint8_images: bool = False,
     ) -> None:
         """Initialize IOAdapter.
 
@@ -61,16 +69,27 @@ class IOAdapter(object):
             Whether the interpolation keep the corners aligned. As defined in torch.nn.functional.interpolate.
         cuda : bool
             If True, the input tensors are transferred to GPU (if a GPU is available).
+        fp16 : bool, default False
+            If True, the images and flows are converted to half precision.
+        shape_buckets : Optional[ShapeBuckets], optional
+            If provided, the inputs are padded (after the optional scaling) to the canvas of the bucket they belong to.
+            The padding is removed by unscale().
+        uint8_images : bool, default False
+            If True, uint8 images are kept as uint8 when they are converted to tensors and moved to the device. They are
+            converted to float on the device, either by the model or, if they need to be resized, by prepare_inputs().
         """
         self.output_stride = output_stride
+        self.input_size = tuple(input_size[-2:])
         self.target_size = target_size
         self.target_scale_factor = target_scale_factor
         self.interpolation_mode = interpolation_mode
         self.interpolation_align_corners = interpolation_align_corners
         self.cuda = cuda
         self.fp16 = fp16
+        self.shape_buckets = shape_buckets
+        self.uint8_images = uint8_images
 
-        self.transform = ToTensor()
+        self.transform = ToTensor(uint8_keys=["images"] if uint8_images else None)
         self.scaler = None
         if (target_size is not None and min(target_size) > 0) or (
             target_scale_factor is not None and target_scale_factor > 0
@@ -135,8 +154,17 @@ class IOAdapter(object):
             if isinstance(v, torch.Tensor):
                 while len(v.shape) < 5:
                     v = v.unsqueeze(0)
+                if v.dtype == torch.uint8 and (
+                    self.scaler is not None or self.shape_buckets is not None
+                ):
+                    # The interpolation only works with float tensors
+                    v = images_to_float(
+                        v, torch.float16 if self.fp16 else torch.float32
+                    )
                 if self.scaler is not None:
                     v = self.scaler.fill(v, is_flow=k.startswith("flow"))
+                if self.shape_buckets is not None:
+                    v = self._get_bucket_padder(v, k).fill(v)
                 inputs[k] = v
 
         return inputs
@@ -173,12 +201,33 @@ class IOAdapter(object):
                 continue
 
             if isinstance(v, torch.Tensor):
+                if self.shape_buckets is not None:
+                    v = self._get_bucket_padder(v, k, is_unfill=True).unfill(v)
                 if self.scaler is not None:
                     v = self.scaler.unfill(v, is_flow=k.startswith("flow"))
                 outputs[k] = v
 
         return outputs
 
+    def _get_bucket_padder(
+        self, x: torch.Tensor, key: str, is_unfill: bool = False
+    ) -> InputPadder:
+        if self.scaler is not None:
+            unpadded_size = (self.scaler.tgt_height, self.scaler.tgt_width)
+        elif is_unfill:
+            unpadded_size = self.input_size
+        else:
+            unpadded_size = x.shape[-2:]
+        bucket_size = self.shape_buckets(unpadded_size, self.output_stride)
+        # Only images are padded by replication, other tensors (flows, valids, etc.) are padded with zeros,
+        # so that the padded area is never considered valid.
+        return get_image_resizer(
+            unpadded_size,
+            size=bucket_size,
+            resize_mode="pad",
+            pad_mode="replicate" if key.startswith("image") else "constant",
+        )
+
     def _to_cuda(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         if self.cuda:
             if torch.cuda.is_available():
@@ -192,6 +241,7 @@ class IOAdapter(object):
                             v.half()
                             if (
                                 isinstance(v, torch.Tensor)
+                                and v.is_floating_point()
                                 and ("flow" in k or "image" in k)
                             )
                             else v
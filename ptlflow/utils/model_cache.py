@@ -0,0 +1,334 @@
+"""Process-level cache of model instances.
+
+Creating a model with ptlflow.get_model() requires parsing the arguments, instantiating the class and loading the
+checkpoint. Long-running processes that switch between a few model/checkpoint pairs can keep the instances in a
+ModelCache to avoid paying this cost every time.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from collections import OrderedDict
+import threading
+from typing import Any, Hashable, Optional, Tuple, Union
+
+from jsonargparse import Namespace
+from loguru import logger
+import torch
+
+import ptlflow
+from ptlflow.models.base_model.base_model import BaseModel
+
+
+class ModelCache(object):
+    """LRU cache of model instances.
+
+    The instances are keyed by (model name, checkpoint, argument overrides, device, dtype). When the cache exceeds one
+    of its budgets, the least recently used models are evicted first. Optionally, idle models can be offloaded to the
+    CPU, instead of being evicted, when the device memory budget is exceeded.
+
+    The cache is protected by a lock, so it can be shared by multiple threads. However, the same model instance is
+    returned for the same key, so callers that run concurrent forwards on one instance must synchronize them.
+
+    Examples
+    --------
+    >>> cache = ModelCache(max_models=4, device_memory_budget_mb=4000)
+    >>> model = cache.get("raft", "things", device="cuda")
+    >>> ...
+    >>> cache.release("raft", "things", device="cuda")
+    """
+
+    def __init__(
+        self,
+        max_models: Optional[int] = None,
+        memory_budget_mb: Optional[float] = None,
+        device_memory_budget_mb: Optional[float] = None,
+        offload_device: Union[str, torch.device] = "cpu",
+    ) -> None:
+        """Initialize ModelCache.
+
+        Parameters
+        ----------
+        max_models : Optional[int], optional
+            Maximum number of models kept in the cache. If None, the number of models is not limited.
+        memory_budget_mb : Optional[float], optional
+            Maximum size, in megabytes, of the parameters and buffers of all the cached models. If None, the size is not
+            limited.
+        device_memory_budget_mb : Optional[float], optional
+            Maximum size, in megabytes, of the models that are kept on non-CPU devices. When exceeded, the least recently
+            used models are moved to offload_device, and they are moved back when requested again. If None, the models
+            are never offloaded.
+        offload_device : Union[str, torch.device], default "cpu"
+            Device where idle models are moved to when device_memory_budget_mb is exceeded.
+        """
+        self.max_models = max_models
+        self.memory_budget_mb = memory_budget_mb
+        self.device_memory_budget_mb = device_memory_budget_mb
+        self.offload_device = torch.device(offload_device)
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(
+        self,
+        model_name: str,
+        ckpt_path: Optional[str] = None,
+        args: Optional[Namespace] = None,
+        device: Union[str, torch.device] = "cpu",
+        dtype: Optional[torch.dtype] = None,
+    ) -> BaseModel:
+        """Return a cached model instance, creating it with ptlflow.get_model() if it is not in the cache.
+
+        The returned model is in eval mode, and it is on the requested device and dtype.
+
+        Parameters
+        ----------
+        model_name : str
+            Name of the model to get an instance of.
+        ckpt_path : Optional[str], optional
+            Name of the pretrained weight to load or a path to a local checkpoint file.
+        args : Optional[Namespace], optional
+            Some arguments that will be provided to the model.
+        device : Union[str, torch.device], default "cpu"
+            Device where the model will be placed.
+        dtype : Optional[torch.dtype], optional
+            If provided, the floating point parameters of the model are converted to this type.
+
+        Returns
+        -------
+        BaseModel
+            The instance of the chosen model.
+        """
+        device = torch.device(device)
+        key = self.make_key(model_name, ckpt_path, args, device, dtype)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                model = self._entries[key]
+            else:
+                self.misses += 1
+                model = ptlflow.get_model(model_name, ckpt_path, args)
+                self._entries[key] = model
+
+            # The model may have been offloaded, or moved by a previous caller, so its placement is always restored
+            model = model.to(device=device, dtype=dtype).eval()
+            self._enforce_budgets()
+            return model
+
+    def release(
+        self,
+        model_name: Optional[str] = None,
+        ckpt_path: Optional[str] = None,
+        args: Optional[Namespace] = None,
+        device: Optional[Union[str, torch.device]] = None,
+        dtype: Optional[torch.dtype] = None,
+    ) -> int:
+        """Remove models from the cache.
+
+        If model_name is None, all the models are removed. Otherwise, only the entries matching all the given values
+        are removed. Arguments left as None match any value.
+
+        Parameters
+        ----------
+        model_name : Optional[str], optional
+            Name of the model to remove.
+        ckpt_path : Optional[str], optional
+            Checkpoint of the model to remove.
+        args : Optional[Namespace], optional
+            Arguments of the model to remove.
+        device : Optional[Union[str, torch.device]], optional
+            Device of the model to remove.
+        dtype : Optional[torch.dtype], optional
+            Type of the model to remove.
+
+        Returns
+        -------
+        int
+            The number of removed models.
+        """
+        with self._lock:
+            if model_name is None:
+                num_removed = len(self._entries)
+                self._entries.clear()
+            else:
+                query = self.make_key(model_name, ckpt_path, args, device, dtype)
+                keys = [
+                    k
+                    for k in self._entries.keys()
+                    if all(q is None or q == v for q, v in zip(query, k))
+                ]
+                for k in keys:
+                    del self._entries[k]
+                num_removed = len(keys)
+            if num_removed > 0 and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            return num_removed
+
+    def clear(self) -> None:
+        """Remove all the models from the cache and reset the hit and miss counters."""
+        with self._lock:
+            self.release()
+            self.hits = 0
+            self.misses = 0
+
+    def offload_idle(self, keep_last: int = 1) -> None:
+        """Move all but the most recently used models to the offload device.
+
+        Parameters
+        ----------
+        keep_last : int, default 1
+            Number of most recently used models that are not offloaded.
+        """
+        with self._lock:
+            keys = list(self._entries.keys())
+            for k in keys[: max(0, len(keys) - keep_last)]:
+                self._offload(k)
+
+    def memory_mb(self, device_only: bool = False) -> float:
+        """Return the size of the cached models.
+
+        Parameters
+        ----------
+        device_only : bool, default False
+            If True, only the models that are not on the CPU are counted.
+
+        Returns
+        -------
+        float
+            The size, in megabytes, of the parameters and buffers of the cached models.
+        """
+        with self._lock:
+            return sum(
+                _get_model_size_mb(m)
+                for m in self._entries.values()
+                if not device_only or _get_model_device(m).type != "cpu"
+            )
+
+    @staticmethod
+    def make_key(
+        model_name: Optional[str],
+        ckpt_path: Optional[str],
+        args: Optional[Namespace],
+        device: Optional[Union[str, torch.device]],
+        dtype: Optional[torch.dtype],
+    ) -> Tuple[Any, ...]:
+        """Build the key that identifies one cached model.
+
+        Parameters
+        ----------
+        model_name : Optional[str]
+            Name of the model.
+        ckpt_path : Optional[str]
+            Name of the pretrained weight or a path to a local checkpoint file.
+        args : Optional[Namespace]
+            Arguments provided to the model. They are converted to a sorted string representation.
+        device : Optional[Union[str, torch.device]]
+            Device of the model.
+        dtype : Optional[torch.dtype]
+            Type of the model.
+
+        Returns
+        -------
+        Tuple[Any, ...]
+            The key.
+        """
+        args_key = None
+        if args is not None:
+            args_dict = args.as_dict() if isinstance(args, Namespace) else vars(args)
+            args_key = repr(sorted(_flatten_dict(args_dict).items()))
+        if device is not None:
+            device = str(torch.device(device))
+        return (model_name, ckpt_path, args_key, device, dtype)
+
+    def _enforce_budgets(self) -> None:
+        while self.max_models is not None and len(self._entries) > self.max_models:
+            self._evict_oldest()
+        while (
+            self.memory_budget_mb is not None
+            and len(self._entries) > 1
+            and self.memory_mb() > self.memory_budget_mb
+        ):
+            self._evict_oldest()
+        if self.device_memory_budget_mb is not None:
+            # The most recently used model is never offloaded, since it was just requested
+            for k in list(self._entries.keys())[:-1]:
+                if self.memory_mb(device_only=True) <= self.device_memory_budget_mb:
+                    break
+                self._offload(k)
+
+    def _evict_oldest(self) -> None:
+        key, _ = self._entries.popitem(last=False)
+        logger.debug("Evicted model from the cache: {}", key)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _offload(self, key: Tuple[Any, ...]) -> None:
+        model = self._entries[key]
+        if _get_model_device(model) != self.offload_device:
+            self._entries[key] = model.to(self.offload_device)
+            logger.debug("Offloaded model to {}: {}", self.offload_device, key)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+
+def _flatten_dict(d, prefix: str = ""):
+    flat = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            flat.update(_flatten_dict(v, f"{prefix}{k}."))
+        else:
+            flat[f"{prefix}{k}"] = repr(v)
+    return flat
+
+
+def _get_model_device(model: torch.nn.Module) -> torch.device:
+    for p in model.parameters():
+        return p.device
+    return torch.device("cpu")
+
+
+def _get_model_size_mb(model: torch.nn.Module) -> float:
+    num_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    num_bytes += sum(b.numel() * b.element_size() for b in model.buffers())
+    return num_bytes / 2**20
+
+
+_default_model_cache = None
+
+
+def get_default_model_cache() -> ModelCache:
+    """Return the process-level cache used by ptlflow.get_model(use_cache=True).
+
+    The default cache has no budgets. They can be configured by setting the attributes of the returned cache.
+
+    Returns
+    -------
+    ModelCache
+        The default cache.
+    """
+    global _default_model_cache
+    if _default_model_cache is None:
+        _default_model_cache = ModelCache()
+    return _default_model_cache
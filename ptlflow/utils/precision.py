@@ -0,0 +1,284 @@
+"""Mixed-precision inference based on torch.autocast.
+
+Converting a model with model.half() runs every operation in fp16, including the ones that are numerically sensitive,
+such as correlations, softmax matching and convex upsampling. Instead, autocast keeps the weights in fp32 and only runs
+the operations that are safe in lower precision (mostly convolutions and matmuls) in fp16 or bf16.
+
+On top of that, each model can declare in its fp32_submodules class attribute the names of the submodules or methods that
+must always run in fp32. apply_fp32_policy() wraps them, so that they run with autocast disabled and fp32 inputs.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from contextlib import nullcontext
+import functools
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from loguru import logger
+import torch
+import torch.nn as nn
+
+PRECISION_DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+def _autocast_accepts_device_type() -> bool:
+    # torch < 2.4 does not accept a device type in is_autocast_enabled()
+    try:
+        torch.is_autocast_enabled("cpu")
+    except TypeError:
+        return False
+    return True
+
+
+_AUTOCAST_ACCEPTS_DEVICE_TYPE = _autocast_accepts_device_type()
+
+
+def _is_autocast_enabled() -> bool:
+    if _AUTOCAST_ACCEPTS_DEVICE_TYPE:
+        return torch.is_autocast_enabled("cuda") or torch.is_autocast_enabled("cpu")
+    return torch.is_autocast_enabled() or torch.is_autocast_cpu_enabled()
+
+
+def autocast(device: Union[str, torch.device], precision: Optional[str] = None) -> Any:
+    """Return a context manager that runs the enclosed operations with the chosen precision.
+
+    Parameters
+    ----------
+    device : Union[str, torch.device]
+        The device where the operations will run.
+    precision : Optional[str], optional
+        One of {"fp32", "fp16", "bf16"}. If None or "fp32", the operations run in full precision.
+
+    Returns
+    -------
+    Any
+        A torch.autocast context manager, or a null context for full precision.
+
+    Raises
+    ------
+    ValueError
+        If precision is not a valid choice.
+    """
+    if precision is None or precision == "fp32":
+        return nullcontext()
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(
+            f"Invalid precision {precision}. Choose from {{{', '.join(PRECISION_DTYPES.keys())}}}."
+        )
+    device_type = torch.device(device).type
+    return torch.autocast(device_type=device_type, dtype=PRECISION_DTYPES[precision])
+
+
+def to_fp32(x: Any) -> Any:
+    """Convert all the floating point tensors inside x to fp32.
+
+    Parameters
+    ----------
+    x : Any
+        A tensor, or a (possibly nested) list, tuple or dict of tensors. Other values are returned unchanged.
+
+    Returns
+    -------
+    Any
+        The same structure, with the floating point tensors converted to fp32.
+    """
+    if isinstance(x, torch.Tensor):
+        return x.float() if x.is_floating_point() else x
+    elif isinstance(x, (list, tuple)):
+        return type(x)(to_fp32(v) for v in x)
+    elif isinstance(x, dict):
+        return {k: to_fp32(v) for k, v in x.items()}
+    return x
+
+
+def fp32_forward(fn: Callable) -> Callable:
+    """Wrap a function so that it runs in fp32 with autocast disabled.
+
+    Parameters
+    ----------
+    fn : Callable
+        The function to be wrapped, usually the forward method of a module.
+
+    Returns
+    -------
+    Callable
+        The wrapped function.
+    """
+    if getattr(fn, "_ptlflow_fp32", False):
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _is_autocast_enabled():
+            return fn(*args, **kwargs)
+        with torch.autocast("cuda", enabled=False), torch.autocast(
+            "cpu", enabled=False
+        ):
+            return fn(*to_fp32(args), **to_fp32(kwargs))
+
+    wrapper._ptlflow_fp32 = True
+    return wrapper
+
+
+def apply_fp32_policy(
+    model: nn.Module, names: Optional[Sequence[str]] = None
+) -> List[str]:
+    """Force some submodules or methods of the model to always run in fp32.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be modified in place.
+    names : Optional[Sequence[str]], optional
+        Dotted paths, relative to the model, of the submodules or methods that should run in fp32. If None, the
+        fp32_submodules attribute of the model is used.
+
+    Returns
+    -------
+    List[str]
+        The names that were found and wrapped.
+    """
+    if names is None:
+        names = getattr(model, "fp32_submodules", ())
+
+    wrapped_names = []
+    for name in names:
+        parent = model
+        *parent_names, attr_name = name.split(".")
+        try:
+            for pname in parent_names:
+                parent = getattr(parent, pname)
+            target = getattr(parent, attr_name)
+        except AttributeError:
+            logger.warning(
+                "{} does not have the fp32 submodule {}",
+                model.__class__.__name__,
+                name,
+            )
+            continue
+
+        if isinstance(target, nn.Module):
+            target.forward = fp32_forward(target.forward)
+        elif callable(target):
+            setattr(parent, attr_name, fp32_forward(target))
+        else:
+            logger.warning(
+                "{}.{} is not a module or a method, it cannot be forced to fp32",
+                model.__class__.__name__,
+                name,
+            )
+            continue
+        wrapped_names.append(name)
+    return wrapped_names
+
+
+def compute_precision_drift(
+    model: nn.Module,
+    inputs: Dict[str, torch.Tensor],
+    precision: str,
+    reference_preds: Optional[Dict[str, torch.Tensor]] = None,
+) -> Dict[str, float]:
+    """Compare the flow predicted with reduced precision against the fp32 prediction.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model, with fp32 weights and already in eval mode.
+    inputs : Dict[str, torch.Tensor]
+        The inputs of the model. If they contain a "flows" groundtruth, the EPE of each prediction is also computed.
+    precision : str
+        One of {"fp16", "bf16"}.
+    reference_preds : Optional[Dict[str, torch.Tensor]], optional
+        The fp32 predictions for these inputs. If None, they are computed.
+
+    Returns
+    -------
+    Dict[str, float]
+        "epe_to_fp32" and "max_abs_diff" between the two predicted flows. If the groundtruth is available, also
+        "epe_fp32", "epe_<precision>", and "epe_delta" (reduced precision minus fp32).
+    """
+    with torch.no_grad():
+        if reference_preds is None:
+            reference_preds = model(dict(inputs))
+        with autocast(inputs["images"].device, precision):
+            preds = model(dict(inputs))
+
+    flow_ref = reference_preds["flows"].float()
+    flow = preds["flows"].float()
+    results = {
+        "epe_to_fp32": torch.norm(flow - flow_ref, p=2, dim=-3).mean().item(),
+        "max_abs_diff": (flow - flow_ref).abs().max().item(),
+    }
+    if inputs.get("flows") is not None:
+        flow_gt = inputs["flows"].float()
+        valid = torch.isfinite(flow_gt).all(dim=-3)
+        if inputs.get("valids") is not None:
+            valid = valid & (inputs["valids"][:, :, 0] > 0.5)
+        results["epe_fp32"] = (
+            torch.norm(flow_ref - flow_gt, p=2, dim=-3)[valid].mean().item()
+        )
+        results[f"epe_{precision}"] = (
+            torch.norm(flow - flow_gt, p=2, dim=-3)[valid].mean().item()
+        )
+        results["epe_delta"] = results[f"epe_{precision}"] - results["epe_fp32"]
+    return results
+
+
+def enable_autocast(model: nn.Module, precision: Optional[str]) -> nn.Module:
+    """Make all the forward calls of the model run with autocast.
+
+    The fp32 policy of the model (see apply_fp32_policy()) is applied, and the outputs of the forward are converted back to
+    fp32, so that the code that consumes them (metrics, flow visualization, etc.) does not need to handle other types.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be modified in place. The weights are kept in fp32.
+    precision : Optional[str]
+        One of {"fp32", "fp16", "bf16"}. If None or "fp32", the model runs in full precision.
+
+    Returns
+    -------
+    nn.Module
+        The same model.
+    """
+    # Undo a previous call, so that the model can be reused with another precision
+    forward = getattr(model, "_forward_without_autocast", None)
+    if forward is not None:
+        model.forward = forward
+        del model._forward_without_autocast
+
+    if precision is None or precision == "fp32":
+        return model
+
+    apply_fp32_policy(model)
+    forward = model.forward
+
+    @functools.wraps(forward)
+    def autocast_forward(*args, **kwargs):
+        device = next(model.parameters()).device
+        with autocast(device, precision):
+            outputs = forward(*args, **kwargs)
+        return to_fp32(outputs)
+
+    model._forward_without_autocast = forward
+    model.forward = autocast_forward
+    return model
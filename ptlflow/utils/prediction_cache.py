@@ -0,0 +1,259 @@
+"""Store of model predictions, to recompute the validation metrics without running the model again.
+
+Each run (a model, a checkpoint and the settings used for inference) is stored in its own directory, whose name contains
+a hash of these values. Inside it, the predictions of each sample are saved in a compressed npz file, identified by the
+paths of the input images of the sample. After the validation of each dataset, the average metrics are also saved, so
+that the metrics table of all the runs in a cache can be rebuilt with load_metrics_table().
+
+The layout of the cache is::
+
+    root_dir/
+        <model>_<checkpoint>_<hash>/
+            run.json
+            <dataset_name>/
+                metrics.json
+                <sample_hash>.npz
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import torch
+
+# Keys of the predictions that are stored
+PREDICTION_KEYS = ("flows", "flows_b", "occs", "occs_b", "mbs", "mbs_b", "confs")
+
+
+class PredictionCache(object):
+    """Read and write the predictions of one run.
+
+    Examples
+    --------
+    >>> cache = PredictionCache("outputs/prediction_cache", "raft", "things", {"fp16": False})
+    >>> preds = cache.get_batch("sintel-clean", inputs["meta"]["image_paths"])
+    >>> if preds is None:
+    >>>     preds = model(inputs)
+    >>>     cache.put_batch("sintel-clean", inputs["meta"]["image_paths"], preds)
+    """
+
+    def __init__(
+        self,
+        root_dir: Union[str, Path],
+        model_name: str,
+        ckpt_path: Optional[str],
+        settings: Dict[str, Any],
+        dtype: str = "float16",
+    ) -> None:
+        """Initialize PredictionCache.
+
+        Parameters
+        ----------
+        root_dir : Union[str, Path]
+            Directory where the runs are stored.
+        model_name : str
+            Name of the model.
+        ckpt_path : Optional[str]
+            Name or path of the checkpoint of the model.
+        settings : Dict[str, Any]
+            Any other value that affects the predictions, such as the model hyperparameters and the input scale. The
+            values must be serializable to JSON, otherwise their str() is used.
+        dtype : str, default "float16"
+            Type used to store the predictions, one of {"float16", "float32"}. float16 halves the size of the cache, but
+            the metrics recomputed from it may differ slightly from the ones of the original run.
+        """
+        assert dtype in ("float16", "float32")
+        self.model_name = model_name
+        self.ckpt_path = ckpt_path
+        self.settings = settings
+        self.dtype = dtype
+
+        run_info = {
+            "model": model_name,
+            "checkpoint": ckpt_path,
+            "settings": settings,
+            "dtype": dtype,
+        }
+        run_str = json.dumps(run_info, sort_keys=True, default=str)
+        self.run_hash = hashlib.sha1(run_str.encode()).hexdigest()[:12]
+        ckpt_name = "none" if ckpt_path is None else Path(ckpt_path).stem
+        self.run_dir = Path(root_dir) / f"{model_name}_{ckpt_name}_{self.run_hash}"
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        run_info_path = self.run_dir / "run.json"
+        if not run_info_path.exists():
+            with open(run_info_path, "w") as f:
+                f.write(run_str)
+
+    def get(
+        self, dataset_name: str, image_paths: Sequence[str]
+    ) -> Optional[Dict[str, torch.Tensor]]:
+        """Load the predictions of one sample.
+
+        Parameters
+        ----------
+        dataset_name : str
+            Name of the dataset of the sample.
+        image_paths : Sequence[str]
+            Paths of the input images of the sample.
+
+        Returns
+        -------
+        Optional[Dict[str, torch.Tensor]]
+            The predictions, in float32 and without the batch dimension, or None if this sample is not in the cache.
+        """
+        path = self._get_sample_path(dataset_name, image_paths)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return {k: torch.from_numpy(data[k].astype(np.float32)) for k in data.files}
+
+    def put(
+        self,
+        dataset_name: str,
+        image_paths: Sequence[str],
+        preds: Dict[str, torch.Tensor],
+    ) -> None:
+        """Save the predictions of one sample.
+
+        Parameters
+        ----------
+        dataset_name : str
+            Name of the dataset of the sample.
+        image_paths : Sequence[str]
+            Paths of the input images of the sample.
+        preds : Dict[str, torch.Tensor]
+            The predictions, without the batch dimension. Only the keys in PREDICTION_KEYS are saved.
+        """
+        arrays = {
+            k: preds[k].detach().cpu().numpy().astype(self.dtype)
+            for k in PREDICTION_KEYS
+            if isinstance(preds.get(k), torch.Tensor)
+        }
+        path = self._get_sample_path(dataset_name, image_paths)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so that an interrupted run never leaves a corrupted sample behind
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp_path, **arrays)
+        tmp_path.replace(path)
+
+    def get_batch(
+        self, dataset_name: str, batch_image_paths: Sequence[Sequence[str]]
+    ) -> Optional[Dict[str, torch.Tensor]]:
+        """Load the predictions of all the samples of one batch.
+
+        Parameters
+        ----------
+        dataset_name : str
+            Name of the dataset of the samples.
+        batch_image_paths : Sequence[Sequence[str]]
+            The image paths, as collated by the dataloader in inputs["meta"]["image_paths"], i.e., one list of paths per
+            frame, each with one path per sample of the batch.
+
+        Returns
+        -------
+        Optional[Dict[str, torch.Tensor]]
+            The predictions of the batch, or None if at least one sample is not in the cache.
+        """
+        samples = []
+        for image_paths in _split_batch_paths(batch_image_paths):
+            preds = self.get(dataset_name, image_paths)
+            if preds is None:
+                return None
+            samples.append(preds)
+        return {k: torch.stack([s[k] for s in samples]) for k in samples[0].keys()}
+
+    def put_batch(
+        self,
+        dataset_name: str,
+        batch_image_paths: Sequence[Sequence[str]],
+        preds: Dict[str, torch.Tensor],
+    ) -> None:
+        """Save the predictions of all the samples of one batch.
+
+        Parameters
+        ----------
+        dataset_name : str
+            Name of the dataset of the samples.
+        batch_image_paths : Sequence[Sequence[str]]
+            The image paths, as collated by the dataloader in inputs["meta"]["image_paths"].
+        preds : Dict[str, torch.Tensor]
+            The predictions of the batch.
+        """
+        for b, image_paths in enumerate(_split_batch_paths(batch_image_paths)):
+            sample_preds = {
+                k: v[b] for k, v in preds.items() if isinstance(v, torch.Tensor)
+            }
+            self.put(dataset_name, image_paths, sample_preds)
+
+    def write_metrics(self, dataset_name: str, metrics: Dict[str, float]) -> None:
+        """Save the average metrics of one dataset.
+
+        Parameters
+        ----------
+        dataset_name : str
+            Name of the dataset.
+        metrics : Dict[str, float]
+            The average value of each metric.
+        """
+        metrics_dir = self.run_dir / dataset_name
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        with open(metrics_dir / "metrics.json", "w") as f:
+            json.dump(metrics, f, indent=2)
+
+    def _get_sample_path(self, dataset_name: str, image_paths: Sequence[str]) -> Path:
+        paths_str = "\n".join([str(p) for p in image_paths])
+        sample_hash = hashlib.sha1(paths_str.encode()).hexdigest()[:20]
+        return self.run_dir / dataset_name / f"{sample_hash}.npz"
+
+
+def load_metrics_table(root_dir: Union[str, Path]) -> pd.DataFrame:
+    """Build a table with the metrics of all the runs in a cache.
+
+    The table has the same format as the metrics.csv files created by validate.py: one row per run, with the columns
+    model, checkpoint, and then one column per dataset and metric, named as <dataset_name>-<metric_name>.
+
+    Parameters
+    ----------
+    root_dir : Union[str, Path]
+        Directory where the runs are stored.
+
+    Returns
+    -------
+    pd.DataFrame
+        The metrics table.
+    """
+    rows = []
+    for run_info_path in sorted(Path(root_dir).glob("*/run.json")):
+        with open(run_info_path, "r") as f:
+            run_info = json.load(f)
+        row = {"model": run_info["model"], "checkpoint": run_info["checkpoint"]}
+        for metrics_path in sorted(run_info_path.parent.glob("*/metrics.json")):
+            with open(metrics_path, "r") as f:
+                metrics = json.load(f)
+            dataset_name = metrics_path.parent.name
+            row.update({f"{dataset_name}-{k}": v for k, v in metrics.items()})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _split_batch_paths(batch_image_paths: Sequence[Sequence[str]]) -> List[List[str]]:
+    return [list(paths) for paths in zip(*batch_image_paths)]
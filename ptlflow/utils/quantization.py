@@ -0,0 +1,241 @@
+"""Post-training static INT8 quantization for CPU inference.
+
+The submodules listed in the quantize_submodules class attribute of a model (usually the encoders and the update blocks)
+are quantized with FX graph mode quantization. The correlation, warping and the other parts of the forward that are not
+inside these submodules are kept in float.
+
+Some submodules cannot be quantized as a whole, because their forward contains Python control flow that cannot be
+traced, or because it reads tensors that are stored as attributes and that change with the input size (e.g., positional
+embeddings created in init_bhwd()). In these cases, the children of the submodule are quantized individually instead.
+Submodules without parameters, such as correlation layers, are never quantized.
+
+The quantized kernels only run on CPU.
+
+This module uses the FX graph mode API of torch.ao.quantization, which PyTorch deprecated in favor of torchao and
+announced for removal in version 2.10. Newer PyTorch versions may still ship it with a deprecation warning, but if it
+is missing, quantize_model() cannot be used and an older PyTorch version has to be installed.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import itertools
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from loguru import logger
+import torch
+import torch.fx
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torch.utils.data import DataLoader
+
+from ptlflow.utils.fusion import fuse_for_inference
+from ptlflow.utils.utils import images_to_float
+
+
+def quantize_model(
+    model: nn.Module,
+    calibration_inputs: Iterable[Dict[str, torch.Tensor]],
+    names: Optional[Sequence[str]] = None,
+    backend: str = "x86",
+) -> List[str]:
+    """Quantize some submodules of the model to INT8 with post-training static quantization.
+
+    The model is first simplified with ptlflow.utils.fusion.fuse_for_inference. Then, the observers are inserted in the
+    chosen submodules, all the calibration inputs are forwarded through the model to collect the activation ranges, and
+    the submodules are converted to their quantized versions.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be modified in place. It must be on the CPU and in fp32.
+    calibration_inputs : Iterable[Dict[str, torch.Tensor]]
+        The inputs used for calibration, in the same format accepted by the forward of the model. A few hundred frames
+        are usually enough. See get_calibration_inputs.
+    names : Optional[Sequence[str]], optional
+        Dotted paths, relative to the model, of the submodules to be quantized. If None, the quantize_submodules attribute
+        of the model is used.
+    backend : str, default "x86"
+        The quantized engine. Use "qnnpack" for ARM CPUs.
+
+    Returns
+    -------
+    List[str]
+        The names of the submodules that were quantized.
+    """
+    if names is None:
+        names = getattr(model, "quantize_submodules", ())
+    if len(names) == 0:
+        logger.warning(
+            "{} does not declare any submodules to quantize, it will run in float.",
+            model.__class__.__name__,
+        )
+        return []
+
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+
+    calibration_iter = iter(calibration_inputs)
+    first_inputs = next(calibration_iter)
+    model.eval()
+    fuse_for_inference(model, first_inputs)
+
+    candidates = []
+    for name in names:
+        try:
+            candidates.append((name, model.get_submodule(name)))
+        except AttributeError:
+            # Some submodules only exist in some configurations of the model
+            logger.info(
+                "{} does not have the submodule {} to quantize, skipping it.",
+                model.__class__.__name__,
+                name,
+            )
+    example_inputs = _capture_example_inputs(model, first_inputs, candidates)
+
+    prepared = []
+    for name, module in candidates:
+        prepared.extend(
+            _prepare_submodule(name, module, example_inputs, qconfig_mapping)
+        )
+    float_modules = {}
+    for name, prepared_module in prepared:
+        float_modules[name] = model.get_submodule(name)
+        model.set_submodule(name, prepared_module)
+
+    with torch.no_grad():
+        for inputs in itertools.chain([first_inputs], calibration_iter):
+            model(inputs)
+
+    quantized_names = []
+    for name, prepared_module in prepared:
+        try:
+            model.set_submodule(name, convert_fx(prepared_module))
+            quantized_names.append(name)
+        except Exception as e:  # noqa: B902
+            logger.warning(
+                "Quantization of {} failed, it will run in float. Exception: {}",
+                name,
+                e,
+            )
+            model.set_submodule(name, float_modules[name])
+    if hasattr(model, "prev_preds"):
+        model.prev_preds = None
+    logger.info(
+        "Quantized {} submodules of {}: {}",
+        len(quantized_names),
+        model.__class__.__name__,
+        quantized_names,
+    )
+    return quantized_names
+
+
+def get_calibration_inputs(
+    dataloader: DataLoader, num_samples: int = 200
+) -> Iterator[Dict[str, torch.Tensor]]:
+    """Yield the images of the first samples of a dataloader, to be used as calibration inputs.
+
+    Parameters
+    ----------
+    dataloader : DataLoader
+        A dataloader from FlowDataModule, or any other that produces dicts with an "images" key.
+    num_samples : int, default 200
+        Maximum number of samples (not batches) to be yielded.
+
+    Yields
+    ------
+    Dict[str, torch.Tensor]
+        The inputs for the model, with only the "images" key, on the CPU. uint8 images are converted to float with values
+        in [0, 1], as done before the forward in validate.py.
+    """
+    count = 0
+    for batch in dataloader:
+        if count >= num_samples:
+            break
+        images = images_to_float(batch["images"][: num_samples - count]).float().cpu()
+        count += images.shape[0]
+        yield {"images": images}
+
+
+def _capture_example_inputs(
+    model: nn.Module,
+    inputs: Dict[str, torch.Tensor],
+    candidates: List[Tuple[str, nn.Module]],
+) -> Dict[nn.Module, Tuple[Any, ...]]:
+    example_inputs = {}
+
+    def _hook(module, args, kwargs):
+        if module not in example_inputs and len(kwargs) == 0:
+            example_inputs[module] = args
+
+    handles = []
+    for _, candidate in candidates:
+        for module in candidate.modules():
+            handles.append(module.register_forward_pre_hook(_hook, with_kwargs=True))
+    try:
+        with torch.no_grad():
+            model(inputs)
+    finally:
+        for h in handles:
+            h.remove()
+    return example_inputs
+
+
+def _prepare_submodule(
+    name: str,
+    module: nn.Module,
+    example_inputs: Dict[nn.Module, Tuple[Any, ...]],
+    qconfig_mapping,
+) -> List[Tuple[str, nn.Module]]:
+    if next(module.parameters(), None) is None:
+        return []
+
+    prepared = None
+    if module in example_inputs:
+        try:
+            if _is_quantizable_as_a_whole(module):
+                prepared = prepare_fx(module, qconfig_mapping, example_inputs[module])
+                # Some graphs can be prepared, but fail at runtime (e.g., observers of tuple outputs)
+                with torch.no_grad():
+                    prepared(*example_inputs[module])
+        except Exception as e:  # noqa: B902
+            logger.debug("Cannot quantize {} as a whole: {}", name, e)
+            prepared = None
+
+    if prepared is not None:
+        return [(name, prepared)]
+
+    children = []
+    for child_name, child in module.named_children():
+        children.extend(
+            _prepare_submodule(
+                f"{name}.{child_name}", child, example_inputs, qconfig_mapping
+            )
+        )
+    return children
+
+
+def _is_quantizable_as_a_whole(module: nn.Module) -> bool:
+    # Tensors that are not parameters or buffers are frozen into the graph, but they may change later
+    # (e.g., the positional embeddings created in init_bhwd())
+    traced = torch.fx.symbolic_trace(module)
+    state_names = {k for k, _ in module.named_parameters()}
+    state_names.update(k for k, _ in module.named_buffers())
+    for node in traced.graph.nodes:
+        if node.op == "get_attr" and node.target not in state_names:
+            return False
+    return True
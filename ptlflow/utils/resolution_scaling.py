@@ -0,0 +1,371 @@
+"""Model how the latency and the peak memory of a model grow with the input resolution.
+
+The results of a resolution sweep of model_benchmark.py (see --sweep_resolutions) are fitted with a quadratic
+polynomial of the number of pixels of one forward (height * width * batch size):
+
+    value = c0 + c1 * P + c2 * P^2
+
+with non-negative coefficients. Models with all-pairs correlation volumes grow quadratically with the number of pixels,
+while models with local correlations grow approximately linearly, and this form covers both. The fitted memory model is
+then used to predict the largest input that fits into a given memory budget, which validate.py and infer.py use to
+choose how much to downscale the inputs (see --scaling_fits_path), instead of failing with an out-of-memory error.
+
+The fits are saved in a JSON file with the format::
+
+    {
+        "<model_name>": [
+            {
+                "Datatype": "fp32", "Device": "cuda", "Threads": 8, "BatchSize": 1,
+                "num_pixels": [...], "times": [...], "memories": [...],
+                "time": {"coeffs": [c0, c1, c2], "exponent": 1.9},
+                "memory": {"coeffs": [c0, c1, c2], "exponent": 1.1}
+            },
+            ...
+        ]
+    }
+
+where the times are in milliseconds per forward and the memories in GB.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import optimize
+
+# The number of pixels is expressed in megapixels during the fit, to keep the least squares problem well conditioned
+PIXELS_UNIT = 1e6
+
+
+def get_sweep_sizes(
+    base_size: Sequence[int],
+    num_sizes: int,
+    min_scale: float = 0.25,
+    max_scale: float = 1.0,
+    multiple: int = 8,
+) -> List[Tuple[int, int]]:
+    """Create a geometric series of input sizes with the aspect ratio of base_size.
+
+    Parameters
+    ----------
+    base_size : Sequence[int]
+        The reference (height, width).
+    num_sizes : int
+        Number of sizes in the series.
+    min_scale : float, default 0.25
+        Scale of the smallest size, relative to base_size.
+    max_scale : float, default 1.0
+        Scale of the largest size, relative to base_size.
+    multiple : int, default 8
+        Each side is rounded to a multiple of this value.
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        The sizes, from the smallest to the largest, without repetitions.
+    """
+    assert num_sizes > 0
+    assert 0 < min_scale <= max_scale
+    sizes = []
+    for scale in np.geomspace(min_scale, max_scale, num_sizes):
+        size = tuple(
+            max(multiple, int(round(scale * s / multiple)) * multiple)
+            for s in base_size[:2]
+        )
+        if size not in sizes:
+            sizes.append(size)
+    return sizes
+
+
+def fit_scaling(num_pixels: Sequence[float], values: Sequence[float]) -> Dict[str, Any]:
+    """Fit a non-negative quadratic polynomial of the number of pixels to the measured values.
+
+    Parameters
+    ----------
+    num_pixels : Sequence[float]
+        Number of pixels of each measurement.
+    values : Sequence[float]
+        The measured values (e.g., time or memory).
+
+    Returns
+    -------
+    Dict[str, Any]
+        A dict with the keys "coeffs", the polynomial coefficients [c0, c1, c2] for the number of pixels, and
+        "exponent", the slope of the log-log curve, which indicates how the values grow (about 1 for linear, 2 for
+        quadratic). The exponent is None if it cannot be estimated.
+    """
+    pixels = np.array(num_pixels, dtype=np.float64) / PIXELS_UNIT
+    values = np.array(values, dtype=np.float64)
+    assert len(pixels) == len(values) and len(pixels) > 0
+
+    # With few distinct sizes, the higher order terms cannot be estimated
+    degree = min(2, len(np.unique(pixels)) - 1)
+    design = np.stack([pixels**d for d in range(degree + 1)], axis=1)
+    coeffs, _ = optimize.nnls(design, values)
+    coeffs = [float(c) / PIXELS_UNIT**d for d, c in enumerate(coeffs)]
+    coeffs += [0.0] * (3 - len(coeffs))
+
+    exponent = None
+    is_valid = (pixels > 0) & (values > 0)
+    if len(np.unique(pixels[is_valid])) > 1:
+        exponent = float(
+            np.polyfit(np.log(pixels[is_valid]), np.log(values[is_valid]), 1)[0]
+        )
+    return {"coeffs": coeffs, "exponent": exponent}
+
+
+def predict(fit: Dict[str, Any], num_pixels: float) -> float:
+    """Predict the value for a given number of pixels.
+
+    Parameters
+    ----------
+    fit : Dict[str, Any]
+        A fit returned by fit_scaling().
+    num_pixels : float
+        Number of pixels of one forward.
+
+    Returns
+    -------
+    float
+        The predicted value.
+    """
+    c0, c1, c2 = fit["coeffs"]
+    return c0 + c1 * num_pixels + c2 * num_pixels**2
+
+
+def get_max_pixels(fit: Dict[str, Any], budget: float) -> float:
+    """Find the largest number of pixels whose predicted value is within the budget.
+
+    Parameters
+    ----------
+    fit : Dict[str, Any]
+        A fit returned by fit_scaling().
+    budget : float
+        The maximum value, in the same unit as the fitted values.
+
+    Returns
+    -------
+    float
+        The number of pixels. It is 0 if not even an empty input fits, and inf if the values do not grow with the
+        number of pixels.
+    """
+    c0, c1, c2 = fit["coeffs"]
+    if c0 >= budget:
+        return 0.0
+    if c1 <= 0 and c2 <= 0:
+        return math.inf
+    # Positive root of c2 * P^2 + c1 * P - (budget - c0), in a form that is stable when c2 is close to zero
+    return 2 * (budget - c0) / (c1 + math.sqrt(c1**2 + 4 * c2 * (budget - c0)))
+
+
+def get_scale_factor(
+    max_pixels: Optional[float], input_size: Sequence[int], batch_size: int = 1
+) -> Optional[float]:
+    """Compute the scale factor to downscale an input so that one forward has at most max_pixels.
+
+    Parameters
+    ----------
+    max_pixels : Optional[float]
+        Maximum number of pixels of one forward, including all the samples of the batch.
+    input_size : Sequence[int]
+        The (height, width) of the input.
+    batch_size : int, default 1
+        Number of samples in one forward.
+
+    Returns
+    -------
+    Optional[float]
+        The scale factor, or None if the input does not need to be downscaled.
+    """
+    if max_pixels is None:
+        return None
+    num_pixels = input_size[0] * input_size[1] * batch_size
+    if num_pixels <= max_pixels:
+        return None
+    return math.sqrt(max_pixels / num_pixels)
+
+
+def fit_benchmark_results(
+    rows: Sequence[Dict[str, Any]],
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Fit the time and memory models of each configuration of a resolution sweep.
+
+    Parameters
+    ----------
+    rows : Sequence[Dict[str, Any]]
+        One element per benchmarked input size, with the keys "Model", "Datatype", "Device", "Threads", "BatchSize",
+        "num_pixels" (of one forward), "time" (milliseconds per forward) and "memory" (GB).
+
+    Returns
+    -------
+    Dict[str, List[Dict[str, Any]]]
+        The fits of each model, in the format described in the module documentation.
+    """
+    config_keys = ("Datatype", "Device", "Threads", "BatchSize")
+    groups = {}
+    for row in rows:
+        key = (row["Model"],) + tuple(row[k] for k in config_keys)
+        groups.setdefault(key, []).append(row)
+
+    fits = {}
+    for key, group in groups.items():
+        group = sorted(group, key=lambda r: r["num_pixels"])
+        num_pixels = [r["num_pixels"] for r in group]
+        times = [r["time"] for r in group]
+        memories = [r["memory"] for r in group]
+        fits.setdefault(key[0], []).append(
+            {
+                **dict(zip(config_keys, key[1:])),
+                "num_pixels": num_pixels,
+                "times": times,
+                "memories": memories,
+                "time": fit_scaling(num_pixels, times),
+                "memory": fit_scaling(num_pixels, memories),
+            }
+        )
+    return fits
+
+
+def save_fits(path: Union[str, Path], fits: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Save the fits to a JSON file, keeping the fits of other models that are already in the file.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        Path to the JSON file.
+    fits : Dict[str, List[Dict[str, Any]]]
+        The fits returned by fit_benchmark_results().
+    """
+    path = Path(path)
+    all_fits = {}
+    if path.exists():
+        with open(path, "r") as f:
+            all_fits = json.load(f)
+    all_fits.update(fits)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(all_fits, f, indent=2)
+
+
+def load_fit(
+    path: Union[str, Path],
+    model_name: str,
+    device: Optional[str] = None,
+    datatype: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Load the fit of one model from a JSON file.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        Path to the JSON file created by save_fits().
+    model_name : str
+        Name of the model.
+    device : Optional[str], optional
+        If provided, only the fits measured on this device type (e.g., "cuda" or "cpu") are considered.
+    datatype : Optional[str], optional
+        If provided, only the fits measured with this datatype (e.g., "fp32") are considered.
+
+    Returns
+    -------
+    Optional[Dict[str, Any]]
+        The fit, or None if no fit matches. When several fits match, the one measured with the smallest batch size is
+        returned.
+    """
+    with open(path, "r") as f:
+        all_fits = json.load(f)
+    candidates = [
+        fit
+        for fit in all_fits.get(model_name, [])
+        if (device is None or fit["Device"] == device)
+        and (datatype is None or fit["Datatype"] == datatype)
+    ]
+    if len(candidates) == 0:
+        return None
+    return min(candidates, key=lambda fit: fit["BatchSize"])
+
+
+def get_benchmark_datatype(
+    fp16: bool = False,
+    autocast: Optional[str] = None,
+    quantize: bool = False,
+    cuda: bool = False,
+) -> str:
+    """Convert the precision options of validate.py and infer.py to the datatype names of model_benchmark.py.
+
+    Parameters
+    ----------
+    fp16 : bool, default False
+        Whether the model is converted to half precision.
+    autocast : Optional[str], optional
+        The autocast precision, one of {"fp16", "bf16"}.
+    quantize : bool, default False
+        Whether the model is quantized to int8.
+    cuda : bool, default False
+        Whether the model runs on CUDA. fp16 is ignored on the CPU.
+
+    Returns
+    -------
+    str
+        One of {"bf16", "fp16", "fp16_autocast", "fp32", "int8"}.
+    """
+    if quantize:
+        return "int8"
+    if autocast == "bf16":
+        return "bf16"
+    if autocast == "fp16":
+        return "fp16_autocast"
+    if fp16 and cuda:
+        return "fp16"
+    return "fp32"
+
+
+def get_max_forward_pixels(
+    path: Union[str, Path],
+    model_name: str,
+    memory_budget: float,
+    device: Optional[str] = None,
+    datatype: Optional[str] = None,
+) -> Optional[float]:
+    """Predict the largest number of pixels of one forward of a model that fits into a memory budget.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        Path to the JSON file created by save_fits().
+    model_name : str
+        Name of the model.
+    memory_budget : float
+        The memory budget, in GB.
+    device : Optional[str], optional
+        The device type where the model runs.
+    datatype : Optional[str], optional
+        The datatype used to run the model.
+
+    Returns
+    -------
+    Optional[float]
+        The number of pixels, or None if there is no fit for this model.
+    """
+    fit = load_fit(path, model_name, device, datatype)
+    if fit is None:
+        return None
+    return get_max_pixels(fit["memory"], memory_budget)
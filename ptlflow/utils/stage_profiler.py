@@ -0,0 +1,418 @@
+"""Measure the cost of each stage of a model, such as the encoders, the correlation and the update block.
+
+The stages are submodules of the model (by default, its direct children), which are measured with forward hooks. The
+correlation is usually not a submodule, but an object created inside forward (e.g., RAFT's CorrBlock) or a function. So,
+the classes and functions whose names contain "corr" in the package of the model (e.g., ptlflow.models.raft) are also
+wrapped during the profiling: the construction of the classes is reported as <name>.build and their calls as
+<name>.lookup.
+
+For each stage, the profiler records the number of calls per forward (e.g., the number of refinement iterations of the
+update block), the time, the peak memory, the size of the produced tensors (activations), and the FLOPs. The time, the
+memory and the FLOPs are measured in separate forwards, so that the memory and FLOP counters do not affect the time.
+
+On CUDA, the memory is read from the allocator statistics of torch. On CPU, torch does not expose its allocator
+statistics, and its allocations are not seen by tracemalloc. Instead, the tensors created by each operation are tracked
+until they are released, which gives the memory used by the tensors, without the overhead of the allocator.
+"""
+
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import functools
+import inspect
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import weakref
+
+import torch
+import torch.nn as nn
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_leaves
+from torch.utils.flop_counter import FlopCounterMode
+
+# Name of the stage that measures the whole forward
+TOTAL_STAGE = "total"
+
+
+class StageProfiler(object):
+    """Attach timing and memory hooks to the stages of a model.
+
+    Examples
+    --------
+    >>> with StageProfiler(model) as profiler:
+    >>>     profiler.measure_time(lambda: model(inputs), num_samples=10)
+    >>>     profiler.measure_memory(lambda: model(inputs))
+    >>>     profiler.measure_flops(lambda: model(inputs))
+    >>> results = profiler.get_results()
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        stages: Optional[Sequence[str]] = None,
+        corr_keyword: Optional[str] = "corr",
+    ) -> None:
+        """Initialize StageProfiler.
+
+        Parameters
+        ----------
+        model : nn.Module
+            The model to be profiled.
+        stages : Optional[Sequence[str]], optional
+            Names of the submodules to be profiled, as in model.named_modules(). If not provided, the direct children of
+            the model are used.
+        corr_keyword : Optional[str], default "corr"
+            The classes and functions of the package of the model whose names contain this keyword (case insensitive)
+            are also profiled. If None, they are not profiled.
+        """
+        self.model = model
+        if stages is None:
+            stages = [name for name, _ in model.named_children()]
+        modules = dict(model.named_modules())
+        for name in stages:
+            if name not in modules:
+                raise ValueError(f"The model does not have a submodule named {name}.")
+        self.stage_modules = {name: modules[name] for name in stages}
+        self.corr_keyword = corr_keyword
+
+        try:
+            self.is_cuda = next(model.parameters()).device.type == "cuda"
+        except StopIteration:
+            self.is_cuda = False
+
+        self.mode = None
+        self.counter = None
+        self.handles = []
+        self.patches = []
+        self.stack = []
+        self.stats = {}
+        self.num_forwards = {"time": 0, "memory": 0, "flops": 0}
+
+    def __enter__(self) -> "StageProfiler":
+        self.attach()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.detach()
+
+    def attach(self) -> None:
+        """Attach the hooks to the model and wrap the correlation classes and functions."""
+        self._register_module_hooks(TOTAL_STAGE, self.model)
+        for name, module in self.stage_modules.items():
+            self._register_module_hooks(name, module)
+        if self.corr_keyword is not None:
+            self._patch_corr_objects()
+
+    def detach(self) -> None:
+        """Remove all the hooks and wrappers."""
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        for owner, attr_name, original in reversed(self.patches):
+            if original is None:
+                delattr(owner, attr_name)
+            else:
+                setattr(owner, attr_name, original)
+        self.patches = []
+        self.stack = []
+
+    @torch.no_grad()
+    def measure_time(self, forward_fn: Callable[[], Any], num_samples: int = 1) -> None:
+        """Measure the time, the number of calls and the activations of each stage.
+
+        Parameters
+        ----------
+        forward_fn : Callable[[], Any]
+            A function that runs one forward of the model.
+        num_samples : int, default 1
+            Number of forwards.
+        """
+        self._run("time", forward_fn, num_samples)
+
+    @torch.no_grad()
+    def measure_memory(self, forward_fn: Callable[[], Any]) -> None:
+        """Measure the peak memory of each stage in one forward.
+
+        Parameters
+        ----------
+        forward_fn : Callable[[], Any]
+            A function that runs one forward of the model.
+        """
+        if self.is_cuda:
+            self._run("memory", forward_fn)
+        else:
+            self.counter = _TensorMemoryTracker()
+            with self.counter:
+                self._run("memory", forward_fn)
+            self.counter = None
+
+    @torch.no_grad()
+    def measure_flops(self, forward_fn: Callable[[], Any]) -> None:
+        """Count the FLOPs of each stage in one forward.
+
+        Parameters
+        ----------
+        forward_fn : Callable[[], Any]
+            A function that runs one forward of the model.
+        """
+        self.counter = FlopCounterMode(display=False)
+        with self.counter:
+            self._run("flops", forward_fn)
+        self.counter = None
+
+    def get_results(self) -> List[Dict[str, Any]]:
+        """Return the statistics of each stage, averaged per forward.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            One dict per stage, in the order in which the stages were first called, with the keys:
+            - stage: the name of the stage,
+            - calls: the number of calls per forward,
+            - time: the time per forward, in milliseconds,
+            - time_fraction: the fraction of the total forward time,
+            - peak_memory: the largest increase of the memory during one call, in bytes,
+            - activations: the size of the tensors produced by the stage per forward, in bytes,
+            - flops: the FLOPs per forward.
+        """
+        num_forwards = {k: max(v, 1) for k, v in self.num_forwards.items()}
+        total_time = self.stats.get(TOTAL_STAGE, {}).get("time", 0.0)
+        results = []
+        for name, stats in self.stats.items():
+            results.append(
+                {
+                    "stage": name,
+                    "calls": stats["calls"] / num_forwards["time"],
+                    "time": 1000 * stats["time"] / num_forwards["time"],
+                    "time_fraction": stats["time"] / max(total_time, 1e-9),
+                    "peak_memory": stats["peak_memory"],
+                    "activations": stats["activations"] / num_forwards["time"],
+                    "flops": stats["flops"] / num_forwards["flops"],
+                }
+            )
+        return results
+
+    def _run(
+        self, mode: str, forward_fn: Callable[[], Any], num_samples: int = 1
+    ) -> None:
+        self.mode = mode
+        try:
+            for _ in range(num_samples):
+                forward_fn()
+                self.num_forwards[mode] += 1
+        finally:
+            self.mode = None
+            self.stack = []
+
+    def _register_module_hooks(self, name: str, module: nn.Module) -> None:
+        def pre_hook(mod: nn.Module, args: Any) -> None:
+            self._start()
+
+        def hook(mod: nn.Module, args: Any, outputs: Any) -> None:
+            self._stop(name, outputs)
+
+        self.handles.append(module.register_forward_pre_hook(pre_hook))
+        self.handles.append(module.register_forward_hook(hook))
+
+    def _patch_corr_objects(self) -> None:
+        # The correlation is often defined in another module of the package of the model (e.g., raft/corr.py)
+        model_module_name = type(self.model).__module__
+        package_name = model_module_name.rsplit(".", 1)[0]
+        modules = [
+            m
+            for name, m in list(sys.modules.items())
+            if m is not None
+            and (name == model_module_name or name.startswith(f"{package_name}."))
+        ]
+        keyword = self.corr_keyword.lower()
+        patched_classes = set()
+        for module in modules:
+            for attr_name, obj in list(vars(module).items()):
+                if keyword not in attr_name.lower() or not getattr(
+                    obj, "__module__", ""
+                ).startswith("ptlflow"):
+                    continue
+                if inspect.isclass(obj) and not issubclass(obj, nn.Module):
+                    if obj in patched_classes:
+                        continue
+                    patched_classes.add(obj)
+                    self._patch(obj, "__init__", f"{obj.__name__}.build", is_init=True)
+                    if "__call__" in dir(obj):
+                        self._patch(obj, "__call__", f"{obj.__name__}.lookup")
+                elif inspect.isfunction(obj):
+                    self._patch(module, attr_name, attr_name)
+
+    def _patch(
+        self, owner: Any, attr_name: str, stage_name: str, is_init: bool = False
+    ) -> None:
+        original = getattr(owner, attr_name)
+        if original is object.__init__:
+            return
+        # Methods inherited from a parent class are removed from the class when the profiling ends
+        restore = original if inspect.ismodule(owner) else owner.__dict__.get(attr_name)
+
+        @functools.wraps(original)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            self._start()
+            outputs = original(*args, **kwargs)
+            # The tensors created by the constructor are stored in the instance
+            self._stop(stage_name, vars(args[0]) if is_init else outputs)
+            return outputs
+
+        setattr(owner, attr_name, wrapper)
+        self.patches.append((owner, attr_name, restore))
+
+    def _start(self) -> None:
+        if self.mode == "time":
+            self._synchronize()
+            self.stack.append({"start": time.perf_counter()})
+        elif self.mode == "memory":
+            # The peak is reset at the start of each stage, so the peaks of the outer stages are updated before
+            peak = self._get_peak_memory()
+            for frame in self.stack:
+                frame["peak"] = max(frame["peak"], peak)
+            self._reset_peak_memory()
+            current = self._get_memory()
+            self.stack.append({"memory": current, "peak": current})
+        elif self.mode == "flops":
+            self.stack.append({"flops": self.counter.get_total_flops()})
+
+    def _stop(self, name: str, outputs: Any) -> None:
+        if self.mode is None or len(self.stack) == 0:
+            return
+        frame = self.stack.pop()
+        stats = self.stats.setdefault(
+            name,
+            {"calls": 0, "time": 0.0, "peak_memory": 0, "activations": 0, "flops": 0},
+        )
+        if self.mode == "time":
+            self._synchronize()
+            stats["time"] += time.perf_counter() - frame["start"]
+            stats["calls"] += 1
+            stats["activations"] += _get_tensors_bytes(outputs)
+        elif self.mode == "memory":
+            peak = self._get_peak_memory()
+            for parent_frame in self.stack:
+                parent_frame["peak"] = max(parent_frame["peak"], peak)
+            stats["peak_memory"] = max(
+                stats["peak_memory"], max(frame["peak"], peak) - frame["memory"]
+            )
+        elif self.mode == "flops":
+            stats["flops"] += self.counter.get_total_flops() - frame["flops"]
+
+    def _synchronize(self) -> None:
+        if self.is_cuda:
+            torch.cuda.synchronize()
+
+    def _get_memory(self) -> int:
+        if self.is_cuda:
+            return torch.cuda.memory_allocated()
+        return self.counter.current
+
+    def _get_peak_memory(self) -> int:
+        if self.is_cuda:
+            return torch.cuda.max_memory_allocated()
+        return self.counter.peak
+
+    def _reset_peak_memory(self) -> None:
+        if self.is_cuda:
+            torch.cuda.reset_peak_memory_stats()
+        else:
+            self.counter.peak = self.counter.current
+
+
+class _TensorMemoryTracker(TorchDispatchMode):
+    """Count the bytes of the tensor storages created by the operations that are still alive."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.storages = {}
+        self.current = 0
+        self.peak = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        outputs = func(*args, **(kwargs or {}))
+        for t in tree_leaves(outputs):
+            if isinstance(t, torch.Tensor):
+                self._track(t)
+        return outputs
+
+    def _track(self, tensor: torch.Tensor) -> None:
+        storage = tensor.untyped_storage()
+        key = storage.data_ptr()
+        if key == 0:
+            return
+        entry = self.storages.get(key)
+        if entry is None:
+            # Views and in-place outputs share the storage of a tensor that is already counted
+            entry = self.storages[key] = [storage.nbytes(), 0]
+            self.current += entry[0]
+            self.peak = max(self.peak, self.current)
+        entry[1] += 1
+        weakref.finalize(tensor, self._release, key)
+
+    def _release(self, key: int) -> None:
+        entry = self.storages.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self.current -= entry[0]
+                del self.storages[key]
+
+
+def profile_stages(
+    model: nn.Module,
+    forward_fn: Callable[[], Any],
+    num_samples: int = 10,
+    stages: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Profile the stages of a model.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The model to be profiled.
+    forward_fn : Callable[[], Any]
+        A function that runs one forward of the model.
+    num_samples : int, default 10
+        Number of timed forwards. Before them, one forward is run as a warm-up. Then, the memory and the FLOPs are
+        measured in one forward each.
+    stages : Optional[Sequence[str]], optional
+        Names of the submodules to be profiled. See StageProfiler.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        The statistics of each stage. See StageProfiler.get_results().
+    """
+    with torch.no_grad():
+        forward_fn()
+    with StageProfiler(model, stages) as profiler:
+        profiler.measure_time(forward_fn, num_samples)
+        profiler.measure_memory(forward_fn)
+        profiler.measure_flops(forward_fn)
+    return profiler.get_results()
+
+
+def _get_tensors_bytes(obj: Any) -> int:
+    if isinstance(obj, torch.Tensor):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, (list, tuple)):
+        return sum([_get_tensors_bytes(v) for v in obj])
+    if isinstance(obj, dict):
+        return sum([_get_tensors_bytes(v) for v in obj.values()])
+    return 0
@@ -16,6 +16,7 @@
 # limitations under the License.
 # =============================================================================
 
+import functools
 import logging
 import math
 from argparse import ArgumentParser
@@ -213,6 +214,169 @@ class InputScaler(object):
         return x
 
 
+class ShapeBuckets(object):
+    """Map arbitrary input sizes to a small set of padded canvas sizes.
+
+    Padding every input to the next multiple of the model output stride creates one new shape for almost every distinct
+    input resolution. Each new shape may trigger a new cuDNN autotuning and fragments the allocator cache, and inputs
+    with different sizes cannot be stacked in the same batch. ShapeBuckets groups the input sizes into a few canvases,
+    so that many inputs share the same padded shape.
+    """
+
+    def __init__(
+        self,
+        multiple: Optional[int] = None,
+        sizes: Optional[Sequence[Tuple[int, int]]] = None,
+    ) -> None:
+        """Initialize ShapeBuckets.
+
+        Parameters
+        ----------
+        multiple : Optional[int], optional
+            If provided, the height and width of inputs that do not fit in any of the given sizes are rounded up to the
+            closest larger multiple of this value (e.g., 64 or 128).
+        sizes : Optional[Sequence[Tuple[int, int]]], optional
+            A list of fixed canvases defined as (height, width). An input is assigned to the smallest canvas (in area)
+            that is large enough to contain it.
+        """
+        assert (
+            multiple is not None or sizes is not None
+        ), "At least one of multiple or sizes must be provided."
+        assert multiple is None or multiple > 0
+        self.multiple = multiple
+        self.sizes = None
+        if sizes is not None:
+            self.sizes = sorted(
+                [(int(s[0]), int(s[1])) for s in sizes], key=lambda s: s[0] * s[1]
+            )
+
+    def __call__(self, size: Sequence[int], stride: int = 1) -> Tuple[int, int]:
+        """Return the canvas size of the bucket that the given input size belongs to.
+
+        Parameters
+        ----------
+        size : Sequence[int]
+            The input size. It is assumed that the last two elements are (height, width).
+        stride : int, default 1
+            The bucket size is additionally rounded up to be divisible by this value.
+
+        Returns
+        -------
+        Tuple[int, int]
+            The bucket canvas size as (height, width).
+        """
+        height, width = int(size[-2]), int(size[-1])
+        bucket = None
+        if self.sizes is not None:
+            for bh, bw in self.sizes:
+                if height <= bh and width <= bw:
+                    bucket = (bh, bw)
+                    break
+        if bucket is None:
+            multiple = stride if self.multiple is None else self.multiple
+            bucket = (
+                int(math.ceil(float(height) / multiple)) * multiple,
+                int(math.ceil(float(width) / multiple)) * multiple,
+            )
+        bucket = (
+            int(math.ceil(float(bucket[0]) / stride)) * stride,
+            int(math.ceil(float(bucket[1]) / stride)) * stride,
+        )
+        return bucket
+
+
+@functools.lru_cache(maxsize=256)
+def _get_cached_resizer(
+    resize_mode: str,
+    input_size: Tuple[int, int],
+    stride: Optional[int],
+    target_size: Optional[Tuple[int, int]],
+    pad_mode: str,
+    pad_value: float,
+    pad_two_side: bool,
+    interpolation_mode: str,
+    interpolation_align_corners: bool,
+) -> Union[InputPadder, InputScaler]:
+    if resize_mode == "pad":
+        return InputPadder(
+            input_size,
+            stride=stride,
+            size=target_size,
+            pad_mode=pad_mode,
+            two_side_pad=pad_two_side,
+            pad_value=pad_value,
+        )
+    elif resize_mode == "interpolation":
+        return InputScaler(
+            input_size,
+            stride=stride,
+            size=target_size,
+            interpolation_mode=interpolation_mode,
+            interpolation_align_corners=interpolation_align_corners,
+        )
+    raise ValueError(
+        f"resize_mode must be one of (pad, interpolation). Found: {resize_mode}."
+    )
+
+
+def get_image_resizer(
+    dims: Sequence[int],
+    stride: Optional[int] = None,
+    size: Optional[Sequence[int]] = None,
+    resize_mode: str = "pad",
+    pad_mode: str = "replicate",
+    pad_value: float = 0.0,
+    pad_two_side: bool = True,
+    interpolation_mode: str = "bilinear",
+    interpolation_align_corners: bool = True,
+) -> Union[InputPadder, InputScaler]:
+    """Return an InputPadder or InputScaler, reusing a previous instance when one with the same parameters exists.
+
+    The resizers do not keep any state after initialization, so the same instance can be safely shared by all inputs
+    with the same size.
+
+    Parameters
+    ----------
+    dims : Sequence[int]
+        The shape of the original input. It is assumed that the last two dimensions are (height, width).
+    stride : Optional[int], optional
+        The input is resized to the closest larger multiple of stride. Ignored if size is provided.
+    size : Optional[Sequence[int]], optional
+        The target size defined as (height, width).
+    resize_mode : str, default "pad"
+        Either "pad" (returns an InputPadder) or "interpolation" (returns an InputScaler).
+    pad_mode : str, default "replicate"
+        See InputPadder.
+    pad_value : float, default 0.0
+        See InputPadder.
+    pad_two_side : bool, default True
+        See InputPadder.
+    interpolation_mode : str, default "bilinear"
+        See InputScaler.
+    interpolation_align_corners : bool, default True
+        See InputScaler.
+
+    Returns
+    -------
+    Union[InputPadder, InputScaler]
+        The resizer for the given parameters.
+    """
+    if size is not None:
+        size = (int(size[0]), int(size[1]))
+        stride = None
+    return _get_cached_resizer(
+        resize_mode,
+        (int(dims[-2]), int(dims[-1])),
+        stride,
+        size,
+        pad_mode,
+        float(pad_value),
+        pad_two_side,
+        interpolation_mode,
+        interpolation_align_corners,
+    )
+
+
 def add_datasets_to_parser(
     parser: ArgumentParser, dataset_config_path: str
 ) -> ArgumentParser:
@@ -451,6 +615,31 @@ def bgr_val_as_tensor(
     return bgr_val
 
 
+def images_to_float(
+    images: torch.Tensor, dtype: torch.dtype = torch.float32
+) -> torch.Tensor:
+    """Convert uint8 images with values in [0, 255] to floating point images with values in [0, 1].
+
+    This is the same conversion done by ptlflow.data.flow_transforms.ToTensor, but it can be applied after the images are
+    moved to the device.
+
+    Parameters
+    ----------
+    images : torch.Tensor
+        The images. If they are not uint8, they are returned unchanged.
+    dtype : torch.dtype, default torch.float32
+        The floating point type of the converted images.
+
+    Returns
+    -------
+    torch.Tensor
+        The converted images.
+    """
+    if images.dtype != torch.uint8:
+        return images
+    return images.to(dtype).div_(255.0)
+
+
 def forward_interpolate_batch(prev_flow: torch.Tensor) -> torch.Tensor:
     """Apply RAFT's forward_interpolate in a batch of torch.Tensors.
 
@@ -29,6 +29,8 @@ from pathlib import Path
 import pandas as pd
 import plotly.express as px
 
+from ptlflow.utils.prediction_cache import load_metrics_table
+
 
 def _init_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
@@ -38,6 +40,15 @@ def _init_parser() -> argparse.ArgumentParser:
         default=str(Path("docs/source/results/metrics_all.csv")),
         help=("Path to the csv file containing the validation metrics."),
     )
+    parser.add_argument(
+        "--prediction_cache_dir",
+        type=str,
+        default=None,
+        help=(
+            "If set, the metrics are loaded from this prediction cache created by validate.py --prediction_cache_dir, "
+            "instead of from --metrics_path."
+        ),
+    )
     parser.add_argument(
         "--chosen_metrics",
         type=str,
@@ -102,7 +113,10 @@ def load_summarized_table(args: argparse.Namespace) -> pd.DataFrame:
     pd.DataFrame
         The summarized DataFrame.
     """
-    df = pd.read_csv(args.metrics_path)
+    if args.prediction_cache_dir is not None:
+        df = load_metrics_table(args.prediction_cache_dir)
+    else:
+        df = pd.read_csv(args.metrics_path)
     keep_cols = list(df.columns)[:2]
     for col in df.columns[2:]:
         for cmet in args.chosen_metrics:
@@ -33,6 +33,7 @@ from ptlflow.data.datasets import (
     MonkaaDataset,
     SintelDataset,
     SpringDataset,
+    SyntheticFlowDataset,
     TartanAirDataset,
     ViperDataset,
 )
@@ -380,6 +381,36 @@ def test_spring(tmp_path: Path) -> None:
     shutil.rmtree(tmp_path)
 
 
+def test_synthetic(tmp_path: Path) -> None:
+    root_dirs = [None, tmp_path]
+    for root_dir in root_dirs:
+        for flow_format in ["flc", "flo", "npz", "png"]:
+            dataset = SyntheticFlowDataset(
+                num_samples=2,
+                img_size=(32, 48),
+                flow_format=flow_format,
+                sparse_density=0.5,
+                root_dir=root_dir,
+                transform=ToTensor(),
+                get_valid_mask=True,
+                get_meta=True,
+            )
+
+            inputs = dataset[0]
+
+            assert inputs.get("meta") is not None
+
+            keys = ["images", "flows", "valids"]
+            for k in keys:
+                assert inputs.get(k) is not None
+                assert isinstance(inputs[k], torch.Tensor)
+                assert len(inputs[k].shape) == 4
+                assert inputs[k].shape[-2:] == (32, 48)
+            assert 0 < inputs["valids"].float().mean() < 1
+
+    shutil.rmtree(tmp_path)
+
+
 def test_tartanair(tmp_path: Path) -> None:
     dummy_datasets.write_tartanair(tmp_path)
 
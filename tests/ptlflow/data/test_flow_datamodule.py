@@ -0,0 +1,42 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from ptlflow.data.flow_datamodule import SequenceLaneBatchSampler
+
+
+def test_sequence_lane_batch_sampler() -> None:
+    seq_lengths = [2, 5, 1, 3, 4]
+    is_seq_start = []
+    for length in seq_lengths:
+        is_seq_start.extend([True] + [False] * (length - 1))
+
+    sampler = SequenceLaneBatchSampler(is_seq_start, batch_size=2)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 8
+    assert sorted([i for b in batches for i in b]) == list(range(len(is_seq_start)))
+    # The active lanes are always the first ones of the batch
+    assert [len(b) for b in batches] == [2, 2, 2, 2, 2, 2, 2, 1]
+
+    # Each lane receives the frames of its sequences in order
+    for lane_idx in range(2):
+        lane = [b[lane_idx] for b in batches if len(b) > lane_idx]
+        assert lane == sampler.lanes[lane_idx]
+        for prev_idx, idx in zip(lane[:-1], lane[1:]):
+            assert is_seq_start[idx] or idx == prev_idx + 1
+
+    sampler = SequenceLaneBatchSampler(is_seq_start, batch_size=10)
+    assert len(sampler.lanes) == len(seq_lengths)
+    assert len(sampler) == max(seq_lengths)
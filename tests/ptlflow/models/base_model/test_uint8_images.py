@@ -0,0 +1,39 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import pytest
+import torch
+
+import ptlflow
+
+# rapidflow supports uint8 images in preprocess_images, while fastflownet relies on the conversion done by BaseModel
+MODEL_NAMES = ["rapidflow", "fastflownet"]
+
+
+@pytest.mark.parametrize("model_name", MODEL_NAMES)
+def test_uint8_images(model_name: str) -> None:
+    torch.manual_seed(0)
+    model = ptlflow.get_model(model_name)
+    model.eval()
+
+    uint8_images = torch.randint(0, 256, (1, 2, 3, 64, 96), dtype=torch.uint8)
+    float_images = uint8_images.float() / 255.0
+    with torch.no_grad():
+        float_preds = model({"images": float_images})
+        uint8_preds = model({"images": uint8_images.clone()})
+
+    assert uint8_preds["flows"].dtype == float_preds["flows"].dtype
+    assert torch.allclose(uint8_preds["flows"], float_preds["flows"], atol=1e-3)
@@ -0,0 +1,74 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+from torch.utils.data import DataLoader
+
+import ptlflow
+from ptlflow.data.flow_datamodule import SequenceLaneBatchSampler
+
+
+def test_warm_start_lanes() -> None:
+    torch.manual_seed(0)
+    model = ptlflow.get_model("rpknet")
+    model.warm_start = True
+    model.iters = 4
+    model.eval()
+
+    samples = []
+    for seq_idx, length in enumerate([3, 1, 2, 4]):
+        for i in range(length):
+            samples.append(
+                {
+                    "images": torch.rand(2, 3, 64, 64),
+                    "flows": torch.zeros(1, 2, 64, 64),
+                    "valids": torch.ones(1, 1, 64, 64),
+                    "meta": {
+                        "dataset_name": "test",
+                        "image_paths": [
+                            f"seq{seq_idx}/{i}.png",
+                            f"seq{seq_idx}/{i+1}.png",
+                        ],
+                        "is_seq_start": i == 0,
+                    },
+                }
+            )
+
+    # Sequential evaluation, as with batch size 1
+    ref_flows = []
+    model.prev_preds = None
+    with torch.no_grad():
+        for i, inputs in enumerate(DataLoader(samples, batch_size=1)):
+            ref_flows.append(model.validation_step(inputs, i)["preds"]["flows"][0])
+
+    # Make sure that the warm start changes the predictions
+    model.warm_start = False
+    with torch.no_grad():
+        cold_flows = model({"images": samples[1]["images"][None]})["flows"][0]
+    assert not torch.allclose(cold_flows, ref_flows[1], atol=1e-4)
+    model.warm_start = True
+
+    sampler = SequenceLaneBatchSampler(
+        [s["meta"]["is_seq_start"] for s in samples], batch_size=3
+    )
+    model.prev_preds = None
+    with torch.no_grad():
+        for i, (batch_indices, inputs) in enumerate(
+            zip(sampler, DataLoader(samples, batch_sampler=sampler))
+        ):
+            flows = model.validation_step(inputs, i)["preds"]["flows"]
+            for b, idx in enumerate(batch_indices):
+                assert torch.allclose(flows[b], ref_flows[idx], atol=1e-4)
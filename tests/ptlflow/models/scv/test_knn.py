@@ -0,0 +1,45 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+
+from ptlflow.models.scv.knn import faiss, knn, knn_torch_topk
+
+
+def test_knn_torch_topk() -> None:
+    torch.manual_seed(0)
+    fmap1 = torch.randn(3, 32, 150)
+    fmap2 = torch.randn(3, 32, 170)
+    k = 8
+
+    scores = torch.einsum("bcn,bcm->bnm", fmap1, fmap2)
+    ref_dist, ref_indx = torch.topk(scores, k, dim=2)
+    ref_dist = ref_dist.transpose(1, 2)
+    ref_indx = ref_indx.transpose(1, 2)
+
+    for chunk_size in [None, 1, 7, 1000]:
+        dist, indx = knn_torch_topk(fmap1, fmap2, k, chunk_size=chunk_size)
+        assert dist.shape == (3, k, 150)
+        assert torch.equal(indx, ref_indx)
+        assert torch.allclose(dist, ref_dist, atol=1e-5)
+
+    dist, indx = knn(fmap1, fmap2, k, backend="torch")
+    assert torch.equal(indx, ref_indx)
+
+    if faiss is not None and torch.cuda.is_available():
+        faiss_dist, faiss_indx = knn(fmap1.cuda(), fmap2.cuda(), k, backend="faiss")
+        assert torch.equal(faiss_indx.cpu(), ref_indx)
+        assert torch.allclose(faiss_dist.cpu(), ref_dist, atol=1e-4)
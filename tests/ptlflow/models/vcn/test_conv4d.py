@@ -0,0 +1,53 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+import torch.nn.functional as F
+
+from ptlflow.models.vcn.conv4d import Conv4d, conv4d
+
+
+def _conv4d_per_slice(data, filters, bias):
+    # Reference implementation: one conv3d per output slice and kernel tap
+    filters = filters.permute(2, 0, 1, 3, 4, 5)
+    padding = filters.shape[0] // 2
+    data = F.pad(data, (0, 0, 0, 0, 0, 0, padding, padding))
+    outputs = []
+    for i in range(data.shape[2] - 2 * padding):
+        out = 0
+        for p in range(filters.shape[0]):
+            out = out + F.conv3d(data[:, :, i + p], filters[p], padding=padding)
+        outputs.append(out + bias.view(1, -1, 1, 1, 1))
+    return torch.stack(outputs, dim=2)
+
+
+def test_conv4d() -> None:
+    torch.manual_seed(0)
+    data = torch.randn(2, 3, 5, 6, 7, 4)
+    for ksize in [1, 3, 5]:
+        filters = torch.randn(4, 3, ksize, ksize, ksize, ksize)
+        bias = torch.randn(4)
+        ref = _conv4d_per_slice(data, filters, bias)
+        out = conv4d(data, filters, bias=bias, permute_filters=True)
+        assert out.shape == (2, 4, 5, 6, 7, 4)
+        assert torch.allclose(out, ref, atol=1e-4)
+
+    conv = Conv4d(3, 4, 3, bias=True, pre_permuted_filters=True)
+    out = conv(data)
+    ref = _conv4d_per_slice(
+        data, conv.weight.detach().permute(1, 2, 0, 3, 4, 5), conv.bias.detach()
+    )
+    assert torch.allclose(out, ref, atol=1e-4)
@@ -0,0 +1,71 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import lightning.pytorch as pl
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from ptlflow.data.datasets import SyntheticFlowDataset
+from ptlflow.data.flow_transforms import ToTensor
+from ptlflow.utils.callbacks.stall_monitor import StallMonitorCallback
+from ptlflow.utils.lightning.ptlflow_trainer import PTLFlowTrainer
+
+
+class _ToyModel(pl.LightningModule):
+    def __init__(self) -> None:
+        super().__init__()
+        self.conv = nn.Conv2d(6, 2, 3, padding=1)
+
+    def training_step(self, batch, batch_idx):
+        assert "timings" not in batch
+        images = batch["images"].flatten(1, 2)
+        flows = self.conv(images)
+        return (flows - batch["flows"][:, 0]).abs().mean()
+
+    def configure_optimizers(self):
+        return torch.optim.SGD(self.parameters(), lr=1e-3)
+
+    def train_dataloader(self):
+        dataset = SyntheticFlowDataset(
+            num_samples=8, img_size=(32, 48), transform=ToTensor()
+        )
+        return DataLoader(dataset, batch_size=2, num_workers=2)
+
+
+def test_stall_monitor(tmp_path) -> None:
+    callback = StallMonitorCallback()
+    trainer = PTLFlowTrainer(
+        max_epochs=1,
+        callbacks=[callback],
+        logger=False,
+        enable_checkpointing=False,
+        enable_progress_bar=False,
+        enable_model_summary=False,
+        accelerator="cpu",
+        default_root_dir=tmp_path,
+    )
+    trainer.fit(_ToyModel())
+
+    assert len(callback.step_times) == 4
+    for key in ["data_wait", "transfer", "forward", "backward", "optimizer_step"]:
+        assert key in callback.step_times[-1]
+    assert "read" in callback.step_times[-1]
+    assert sorted(callback.worker_times.keys()) == [0, 1]
+    assert sum([v[0] for v in callback.worker_times.values()]) == 8
+    assert "stall/epoch_data_wait_fraction" in trainer.callback_metrics
+    # The original profiler is restored after the training
+    assert callback.profiler is None
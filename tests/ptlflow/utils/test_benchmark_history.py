@@ -0,0 +1,82 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+from pathlib import Path
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from ptlflow.utils.benchmark_history import (
+    BenchmarkHistory,
+    compare_runs,
+    diff_environments,
+    get_environment_fingerprint,
+)
+
+
+def _make_samples(time_scale: float, seed: int):
+    rng = np.random.default_rng(seed)
+    samples = []
+    for model_name in ["model_a", "model_b"]:
+        samples.append(
+            {
+                "Model": model_name,
+                "Datatype": "fp32",
+                "Device": "cpu",
+                "Threads": 4,
+                "BatchSize": 1,
+                "InputH": 64,
+                "InputW": 96,
+                "times": (
+                    (time_scale if model_name == "model_a" else 1.0)
+                    * (10.0 + rng.normal(0, 0.2, 30))
+                ).tolist(),
+                "memories": [1e8] * 30,
+            }
+        )
+    return samples
+
+
+def test_history_and_compare(tmp_path: Path) -> None:
+    history = BenchmarkHistory(tmp_path)
+    results_df = pd.DataFrame({"Model": ["model_a", "model_b"]})
+    base_env = get_environment_fingerprint({"num_samples": 30})
+    base_id = history.add_run(results_df, _make_samples(1.0, 0), base_env)
+    cand_env = get_environment_fingerprint({"num_samples": 30})
+    cand_env["torch"] = "0.0.0"
+    cand_id = history.add_run(results_df, _make_samples(1.5, 1), cand_env)
+
+    assert history.list_runs() == [base_id, cand_id]
+    assert history.resolve_run_id(-1) == history.list_runs()[-1]
+    assert len(history.get_runs_table()) == 2
+
+    baseline = history.load_run(base_id)
+    candidate = history.load_run(cand_id)
+    comparison_df = compare_runs(baseline, candidate)
+    assert len(comparison_df) == 4
+
+    status = comparison_df.set_index(["Model", "Metric"])["Status"]
+    assert status[("model_a", "time")] == "regression"
+    assert status[("model_b", "time")] == "unchanged"
+    assert status[("model_a", "memory")] == "unchanged"
+
+    diffs = diff_environments(baseline["environment"], candidate["environment"])
+    assert "torch" in diffs
+    assert "settings.num_samples" not in diffs
+
+    shutil.rmtree(tmp_path)
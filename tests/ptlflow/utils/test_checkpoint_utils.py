@@ -0,0 +1,50 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+
+import ptlflow
+from ptlflow.utils.checkpoint_utils import strip_checkpoint, strip_hub_checkpoints
+
+TEST_MODEL = "raft_small"
+
+
+def test_strip_and_restore(tmp_path) -> None:
+    model = ptlflow.get_model(TEST_MODEL)
+    ckpt_path = tmp_path / "model.ckpt"
+    torch.save(
+        {
+            "state_dict": model.state_dict(),
+            "hyper_parameters": {"train_size": (368, 496)},
+            "optimizer_states": [{"state": {0: torch.zeros(100000)}}],
+            "lr_schedulers": [{"last_epoch": 10}],
+        },
+        ckpt_path,
+    )
+
+    stripped_path = tmp_path / "stripped.ckpt"
+    assert strip_checkpoint(ckpt_path, stripped_path)
+    ckpt = torch.load(stripped_path, weights_only=True)
+    assert set(ckpt.keys()) == {"state_dict", "hyper_parameters"}
+    assert stripped_path.stat().st_size < ckpt_path.stat().st_size
+
+    assert strip_hub_checkpoints(tmp_path) == [ckpt_path]
+    assert not strip_checkpoint(ckpt_path)
+
+    restored_model = ptlflow.get_model(TEST_MODEL, ckpt_path=str(ckpt_path))
+    assert restored_model.train_size == (368, 496)
+    for k, v in model.state_dict().items():
+        assert torch.equal(v, restored_model.state_dict()[k])
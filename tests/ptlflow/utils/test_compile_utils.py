@@ -0,0 +1,71 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from pathlib import Path
+
+import torch
+
+import ptlflow
+from ptlflow.utils.compile_utils import compile_model
+
+TEST_MODEL = "raft_small"
+
+
+def _failing_backend(gm, example_inputs):
+    raise RuntimeError("Unsupported model")
+
+
+def test_compile_model(tmp_path: Path) -> None:
+    model = ptlflow.get_model(TEST_MODEL).eval()
+    inputs = {"images": torch.rand(1, 2, 3, 128, 128)}
+    with torch.no_grad():
+        flows_ref = model(dict(inputs))["flows"]
+
+    names = compile_model(model, backend="eager", cache_dir=tmp_path)
+    assert names == list(model.compile_submodules)
+    assert compile_model(model, backend="eager", cache_dir=tmp_path) == names
+    with torch.no_grad():
+        flows = model(dict(inputs))["flows"]
+    assert torch.allclose(flows, flows_ref, atol=1e-4)
+
+
+def test_compile_model_fallback(tmp_path: Path) -> None:
+    model = ptlflow.get_model(TEST_MODEL).eval()
+    inputs = {"images": torch.rand(1, 2, 3, 128, 128)}
+    with torch.no_grad():
+        flows_ref = model(dict(inputs))["flows"]
+
+    compile_model(model, backend=_failing_backend, cache_dir=tmp_path)
+    with torch.no_grad():
+        flows = model(dict(inputs))["flows"]
+    assert torch.allclose(flows, flows_ref, atol=1e-4)
+
+
+def test_use_compile_hook(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setenv("TORCHINDUCTOR_CACHE_DIR", str(tmp_path))
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+    model = model_ref(use_compile=True).eval()
+    assert model.hparams.use_compile
+
+    # Replace the default backend to keep the test fast
+    monkeypatch.setattr(
+        "ptlflow.models.base_model.base_model.compile_model",
+        lambda m: compile_model(m, backend="eager"),
+    )
+    with torch.no_grad():
+        model({"images": torch.rand(1, 2, 3, 128, 128)})
+    assert model._compile_hook_handle is None
+    assert getattr(model.fnet.forward, "_ptlflow_compiled", False)
@@ -14,11 +14,12 @@
 # limitations under the License.
 # =============================================================================
 
+import torch
+
+from ptlflow.utils.correlation import iter_spatial_correlation_sample
+
 try:
     from spatial_correlation_sampler import spatial_correlation_sample
-    import torch
-
-    from ptlflow.utils.correlation import iter_spatial_correlation_sample
 
     def test_correlation() -> None:
         i1 = torch.arange(200000).view(2, 10, 100, 100).float() / 10000
@@ -132,3 +133,22 @@ try:
 
 except ModuleNotFoundError:
     pass
+
+
+def test_shift_correlation_matches_grid_sample() -> None:
+    i1 = torch.randn(2, 16, 37, 53)
+    i2 = torch.randn(2, 16, 37, 53)
+
+    test_params = [
+        {"patch_size": (9, 9)},
+        {"patch_size": (4, 4), "stride": (3, 3)},
+        {"patch_size": (3, 5), "stride": (2, 2), "padding": (1, 1)},
+        {"patch_size": (9, 9), "stride": (3, 3), "padding": (5, 5)},
+        {"patch_size": (5, 5), "padding": (2, 2), "dilation_patch": (2, 3)},
+    ]
+    for p in test_params:
+        cref = iter_spatial_correlation_sample(i1, i2, mode="grid_sample", **p)
+        for chunk_size in [None, 1, 7]:
+            ctest = iter_spatial_correlation_sample(i1, i2, chunk_size=chunk_size, **p)
+            assert cref.shape == ctest.shape
+            assert torch.allclose(cref, ctest, atol=1e-4)
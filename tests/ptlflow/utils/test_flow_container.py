@@ -0,0 +1,90 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ptlflow.utils import flow_utils
+from ptlflow.utils.flow_container import (
+    FlowContainer,
+    FlowContainerWriter,
+    write_flow_container,
+)
+
+
+def _make_flows() -> list:
+    rng = np.random.default_rng(0)
+    flows = [
+        (rng.random((24, 32, 2)) * 200 - 100).astype(np.float32),
+        (rng.random((16, 20, 2)) * 10 - 5).astype(np.float32),
+    ]
+    flows[1][rng.random((16, 20)) < 0.5] = np.nan
+    return flows
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32", "int16"])
+@pytest.mark.parametrize("codec", ["none", "zlib"])
+def test_flow_container(tmp_path: Path, dtype: str, codec: str) -> None:
+    flows = _make_flows()
+    path = tmp_path / "flows.flc"
+    write_flow_container(path, flows, dtype=dtype, codec=codec)
+
+    container = FlowContainer(path)
+    assert len(container) == len(flows)
+    for i in reversed(range(len(flows))):
+        flow = container[i]
+        assert flow.dtype == np.float32
+        assert flow.shape == flows[i].shape
+        assert np.array_equal(np.isnan(flow), np.isnan(flows[i]))
+        error = np.nanmax(np.abs(flow - flows[i]))
+        if dtype == "float32":
+            assert error == 0
+        elif dtype == "float16":
+            assert error <= np.nanmax(np.abs(flows[i])) * 2**-11
+        else:
+            assert error <= container.max_error
+
+        read_flow = flow_utils.flow_read((path, i))
+        assert np.array_equal(read_flow, flow, equal_nan=True)
+
+    if codec == "none":
+        view = container.view(0)
+        assert view.dtype == np.dtype(dtype)
+        assert not view.flags.writeable
+        if dtype != "int16":
+            assert np.array_equal(view.astype(np.float32), container[0])
+    else:
+        with pytest.raises(ValueError):
+            container.view(0)
+
+
+def test_flow_container_limits(tmp_path: Path) -> None:
+    flow = np.full((4, 4, 2), 600.0, dtype=np.float32)
+    with FlowContainerWriter(tmp_path / "flows.flc", dtype="int16") as writer:
+        with pytest.raises(ValueError):
+            writer.write(flow)
+        writer.write(flow / 2)
+
+    path = tmp_path / "incomplete.flc"
+    writer = FlowContainerWriter(path)
+    writer.write(flow)
+    writer.file.flush()
+    with pytest.raises(ValueError):
+        FlowContainer(path)
+    writer.close()
+    assert len(FlowContainer(path)) == 1
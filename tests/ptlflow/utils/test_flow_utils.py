@@ -38,3 +38,18 @@ def test_read_write_pfm(tmp_path: Path) -> None:
     assert np.array_equal(flow, loaded_flow)
 
     shutil.rmtree(tmp_path)
+
+
+def test_read_write_flc(tmp_path: Path) -> None:
+    flow = np.stack(
+        np.meshgrid(np.arange(IMG_SIDE) - IMG_MIDDLE, np.arange(IMG_SIDE) - IMG_MIDDLE),
+        axis=2,
+    ).astype(np.float32)
+    file_path = tmp_path / "flow.flc"
+    flow_utils.flow_write(file_path, flow)
+    assert file_path.exists()
+
+    loaded_flow = flow_utils.flow_read(file_path)
+    assert np.array_equal(flow, loaded_flow)
+
+    shutil.rmtree(tmp_path)
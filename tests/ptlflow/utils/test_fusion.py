@@ -0,0 +1,101 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+import torch.nn as nn
+
+import ptlflow
+from ptlflow.utils.fusion import find_conv_bn_pairs, fuse_for_inference
+
+
+class _ConvBNModel(nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        self.conv1 = nn.Conv2d(3, 8, 3, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(8)
+        self.conv2 = nn.Conv2d(8, 8, 3, padding=1)
+        self.bn2 = nn.BatchNorm2d(8)
+        self.dropout = nn.Dropout(0.5)
+        self.head = nn.Conv2d(16, 2, 1)
+
+    def forward(self, inputs):
+        x = inputs["images"][:, 0]
+        x = torch.relu(self.bn1(self.conv1(x)))
+        y = self.conv2(x)
+        # The output of conv2 is also used outside bn2, so they cannot be folded
+        x = torch.cat([self.bn2(y), y], 1)
+        return {"flows": self.head(self.dropout(x))[:, None]}
+
+
+def _init_model() -> _ConvBNModel:
+    model = _ConvBNModel()
+    for bn in (model.bn1, model.bn2):
+        bn.running_mean.uniform_(-1, 1)
+        bn.running_var.uniform_(0.5, 2)
+        bn.weight.data.uniform_(0.5, 2)
+        bn.bias.data.uniform_(-1, 1)
+    return model.eval()
+
+
+def test_fuse_conv_bn() -> None:
+    model = _init_model()
+    inputs = {"images": torch.rand(2, 2, 3, 16, 16)}
+    with torch.no_grad():
+        flows_ref = model(inputs)["flows"]
+
+    assert find_conv_bn_pairs(model, inputs) == [(model.conv1, model.bn1)]
+    counts = fuse_for_inference(model, inputs)
+    assert counts == {
+        "fused_submodules": 0,
+        "folded_batch_norms": 1,
+        "removed_dropouts": 1,
+    }
+    assert isinstance(model.bn1, nn.Identity)
+    assert isinstance(model.bn2, nn.BatchNorm2d)
+    assert model.conv1.bias is not None
+    with torch.no_grad():
+        flows = model(inputs)["flows"]
+    assert torch.allclose(flows, flows_ref, atol=1e-5)
+
+
+def test_fuse_revert() -> None:
+    model = _init_model()
+    inputs = {"images": torch.rand(2, 2, 3, 16, 16)}
+    state_ref = {k: v.clone() for k, v in model.state_dict().items()}
+
+    counts = fuse_for_inference(model, inputs, max_epe=-1.0)
+    assert sum(counts.values()) == 0
+    assert isinstance(model.bn1, nn.BatchNorm2d)
+    assert isinstance(model.dropout, nn.Dropout)
+    assert model.conv1.bias is None
+    state = model.state_dict()
+    assert state.keys() == state_ref.keys()
+    for k, v in state_ref.items():
+        assert torch.equal(state[k], v)
+
+
+def test_model_fuse_for_inference() -> None:
+    model = ptlflow.get_model("rapidflow").eval()
+    inputs = {"images": torch.rand(1, 2, 3, 128, 128)}
+    with torch.no_grad():
+        flows_ref = model(dict(inputs))["flows"]
+
+    counts = model.fuse_for_inference(dict(inputs))
+    assert counts["fused_submodules"] > 0
+    assert not any(k.endswith("weight_h") for k in model.state_dict())
+    with torch.no_grad():
+        flows = model(dict(inputs))["flows"]
+    assert torch.allclose(flows, flows_ref, atol=1e-3)
@@ -0,0 +1,60 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+
+import ptlflow
+from ptlflow.utils.model_cache import ModelCache, get_default_model_cache
+
+
+def test_model_cache() -> None:
+    cache = ModelCache(max_models=2)
+    model1 = cache.get("raft_small")
+    assert cache.get("raft_small") is model1
+    assert cache.hits == 1 and cache.misses == 1
+
+    model2 = cache.get("raft_small", dtype=torch.float64)
+    assert model2.fnet.conv1.weight.dtype == torch.float64
+    assert len(cache) == 2
+
+    cache.get("rapidflow")
+    assert len(cache) == 2
+    assert cache.make_key("raft_small", None, None, "cpu", None) not in cache
+
+    assert cache.release("raft_small") == 1
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == 0 and cache.misses == 0
+
+
+def test_model_cache_memory_budget() -> None:
+    cache = ModelCache()
+    cache.get("raft_small")
+    model_mb = cache.memory_mb()
+    assert model_mb > 0
+
+    cache.memory_budget_mb = 1.5 * model_mb
+    cache.get("raft_small", dtype=torch.float64)
+    assert len(cache) == 1
+
+
+def test_get_model_use_cache() -> None:
+    get_default_model_cache().clear()
+    model = ptlflow.get_model("raft_small", use_cache=True)
+    assert ptlflow.get_model("raft_small", use_cache=True) is model
+    assert ptlflow.get_model("raft_small") is not model
+    get_default_model_cache().clear()
@@ -0,0 +1,74 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import pytest
+import torch
+
+import ptlflow
+from ptlflow.utils import precision
+from ptlflow.utils.precision import (
+    apply_fp32_policy,
+    compute_precision_drift,
+    enable_autocast,
+)
+
+
+def test_apply_fp32_policy() -> None:
+    model = ptlflow.get_model("raft_small").eval()
+    assert apply_fp32_policy(model) == ["upsample_flow"]
+    assert getattr(model.upsample_flow, "_ptlflow_fp32", False)
+    assert apply_fp32_policy(model, ["missing_module"]) == []
+
+
+def test_enable_autocast() -> None:
+    model = ptlflow.get_model("raft_small").eval()
+    inputs = {"images": torch.rand(1, 2, 3, 128, 128)}
+    model = enable_autocast(model, "bf16")
+    with torch.no_grad():
+        preds = model(dict(inputs))
+    assert preds["flows"].dtype == torch.float32
+    assert model.fnet.conv1.weight.dtype == torch.float32
+
+    model = enable_autocast(model, None)
+    assert not hasattr(model, "_forward_without_autocast")
+
+
+def test_fp32_policy_without_device_type(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Use the autocast queries of torch < 2.4, which do not accept a device type
+    monkeypatch.setattr(precision, "_AUTOCAST_ACCEPTS_DEVICE_TYPE", False)
+
+    model = ptlflow.get_model("raft_small").eval()
+    model = enable_autocast(model, "bf16")
+    with torch.no_grad():
+        preds = model({"images": torch.rand(1, 2, 3, 128, 128)})
+    assert preds["flows"].dtype == torch.float32
+
+
+def test_compute_precision_drift() -> None:
+    model = ptlflow.get_model("raft_small").eval()
+    inputs = {
+        "images": torch.rand(1, 2, 3, 128, 128),
+        "flows": torch.rand(1, 1, 2, 128, 128),
+    }
+    drift = compute_precision_drift(model, inputs, "bf16")
+    assert set(drift.keys()) == {
+        "epe_to_fp32",
+        "max_abs_diff",
+        "epe_fp32",
+        "epe_bf16",
+        "epe_delta",
+    }
+    assert drift["epe_to_fp32"] >= 0.0
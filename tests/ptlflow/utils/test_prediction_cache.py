@@ -0,0 +1,51 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from pathlib import Path
+
+import torch
+
+from ptlflow.utils.prediction_cache import PredictionCache, load_metrics_table
+
+
+def test_prediction_cache(tmp_path: Path) -> None:
+    cache = PredictionCache(tmp_path, "raft", "things", {"iters": 12}, "float32")
+    batch_paths = [["a/1.png", "b/1.png"], ["a/2.png", "b/2.png"]]
+    preds = {
+        "flows": torch.randn(2, 1, 2, 8, 12),
+        "occs": torch.rand(2, 1, 1, 8, 12),
+        "flow_small": torch.randn(2, 1, 2, 1, 1),
+    }
+    assert cache.get_batch("sintel", batch_paths) is None
+    cache.put_batch("sintel", batch_paths, preds)
+
+    cached_preds = cache.get_batch("sintel", batch_paths)
+    assert set(cached_preds.keys()) == {"flows", "occs"}
+    assert torch.equal(cached_preds["flows"], preds["flows"])
+    assert torch.equal(
+        cache.get("sintel", ["b/1.png", "b/2.png"])["occs"], preds["occs"][1]
+    )
+    assert cache.get("kitti", ["a/1.png", "a/2.png"]) is None
+
+    # Different settings are stored in different runs
+    other_cache = PredictionCache(tmp_path, "raft", "things", {"iters": 32})
+    assert other_cache.run_dir != cache.run_dir
+    assert other_cache.get_batch("sintel", batch_paths) is None
+
+    cache.write_metrics("sintel", {"val/epe": 1.5})
+    df = load_metrics_table(tmp_path)
+    assert len(df) == 2
+    assert df["sintel-val/epe"].dropna().tolist() == [1.5]
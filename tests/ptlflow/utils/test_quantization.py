@@ -0,0 +1,68 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import torch
+import torch.fx
+
+import ptlflow
+from ptlflow.utils.quantization import get_calibration_inputs, quantize_model
+
+
+def _get_calibration_inputs(num_samples: int = 3):
+    return [{"images": torch.rand(1, 2, 3, 128, 128)} for _ in range(num_samples)]
+
+
+def test_quantize_model() -> None:
+    model = ptlflow.get_model("fastflownet").eval()
+    names = quantize_model(model, _get_calibration_inputs())
+    assert names == list(model.quantize_submodules)
+    assert isinstance(model.pconv1_1, torch.fx.GraphModule)
+
+    with torch.no_grad():
+        flows = model({"images": torch.rand(1, 2, 3, 128, 160)})["flows"]
+    assert flows.shape == (1, 1, 2, 128, 160)
+    assert torch.isfinite(flows).all()
+
+
+def test_quantize_stateful_submodules() -> None:
+    # The backbone stores positional embeddings that depend on the input size, so only its children can be quantized
+    model = ptlflow.get_model("neuflow2").eval()
+    names = quantize_model(model, _get_calibration_inputs())
+    assert "backbone" not in names
+    assert any(n.startswith("backbone.") for n in names)
+    assert hasattr(model.backbone, "init_bhwd")
+
+    with torch.no_grad():
+        flows = model({"images": torch.rand(1, 2, 3, 192, 192)})["flows"]
+    assert flows.shape == (1, 1, 2, 192, 192)
+    assert torch.isfinite(flows).all()
+
+
+def test_calibration_inputs_uint8() -> None:
+    images = torch.randint(0, 256, (4, 2, 3, 32, 32), dtype=torch.uint8)
+    float_batches = [
+        {"images": images[:2].float() / 255.0},
+        {"images": images[2:].float() / 255.0},
+    ]
+    uint8_batches = [{"images": images[:2]}, {"images": images[2:]}]
+
+    float_inputs = list(get_calibration_inputs(float_batches, num_samples=3))
+    uint8_inputs = list(get_calibration_inputs(uint8_batches, num_samples=3))
+    assert [x["images"].shape[0] for x in uint8_inputs] == [2, 1]
+    for float_x, uint8_x in zip(float_inputs, uint8_inputs):
+        assert uint8_x["images"].dtype == torch.float32
+        assert uint8_x["images"].min() >= 0 and uint8_x["images"].max() <= 1
+        assert torch.allclose(uint8_x["images"], float_x["images"])
@@ -0,0 +1,86 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import math
+from pathlib import Path
+import shutil
+
+import pytest
+
+from ptlflow.utils.resolution_scaling import (
+    fit_benchmark_results,
+    get_max_forward_pixels,
+    get_max_pixels,
+    get_scale_factor,
+    get_sweep_sizes,
+    load_fit,
+    predict,
+    save_fits,
+)
+
+
+def test_sweep_sizes() -> None:
+    sizes = get_sweep_sizes([440, 1024], 4, 0.25, 1.0)
+    assert sizes[-1] == (440, 1024)
+    assert all(s[0] % 8 == 0 and s[1] % 8 == 0 for s in sizes)
+    assert sizes == sorted(sizes)
+
+
+def test_fit_and_budget(tmp_path: Path) -> None:
+    num_pixels = [s[0] * s[1] for s in get_sweep_sizes([512, 1024], 5, 0.25, 1.0)]
+    rows = []
+    for p in num_pixels:
+        mp = p / 1e6
+        rows.append(
+            {
+                "Model": "quadratic",
+                "Datatype": "fp32",
+                "Device": "cuda",
+                "Threads": 1,
+                "BatchSize": 1,
+                "num_pixels": p,
+                "time": 2.0 + 30.0 * mp,
+                "memory": 0.2 + 0.5 * mp + 4.0 * mp**2,
+            }
+        )
+        rows.append({**rows[-1], "Model": "linear", "memory": 0.2 + 1.5 * mp})
+    fits = fit_benchmark_results(rows)
+    quad_fit = fits["quadratic"][0]
+    lin_fit = fits["linear"][0]
+
+    assert quad_fit["memory"]["exponent"] > lin_fit["memory"]["exponent"]
+    assert predict(quad_fit["memory"], 1e6) == pytest.approx(4.7, rel=1e-3)
+    assert predict(lin_fit["time"], 2e6) == pytest.approx(62.0, rel=1e-3)
+
+    max_pixels = get_max_pixels(quad_fit["memory"], 4.7)
+    assert max_pixels == pytest.approx(1e6, rel=1e-3)
+    assert get_max_pixels(quad_fit["memory"], 0.1) == 0.0
+
+    scale_factor = get_scale_factor(max_pixels, (1000, 2000), batch_size=2)
+    assert scale_factor == pytest.approx(math.sqrt(1 / 4), rel=1e-3)
+    assert get_scale_factor(max_pixels, (500, 500)) is None
+
+    fits_path = tmp_path / "fits.json"
+    save_fits(fits_path, {"quadratic": fits["quadratic"]})
+    save_fits(fits_path, {"linear": fits["linear"]})
+    assert load_fit(fits_path, "quadratic", device="cuda", datatype="fp32") is not None
+    assert load_fit(fits_path, "quadratic", device="cpu") is None
+    assert get_max_forward_pixels(fits_path, "linear", 1.7) == pytest.approx(
+        1e6, rel=1e-3
+    )
+
+    shutil.rmtree(tmp_path)
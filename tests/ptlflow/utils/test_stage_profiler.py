@@ -0,0 +1,67 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import sys
+
+import torch
+
+import ptlflow
+from ptlflow.utils.stage_profiler import TOTAL_STAGE, StageProfiler, profile_stages
+
+
+def test_profile_stages() -> None:
+    model = ptlflow.get_model("raft_small")
+    model.eval()
+    model.iters = 3
+    inputs = {"images": torch.rand(1, 2, 3, 64, 64)}
+    corr_module = sys.modules["ptlflow.models.raft.corr"]
+    corr_call = corr_module.CorrBlock.__call__
+    get_corr_block = corr_module.get_corr_block
+
+    results = profile_stages(model, lambda: model(inputs), num_samples=2)
+    results = {r["stage"]: r for r in results}
+
+    assert set(["fnet", "cnet", "update_block", TOTAL_STAGE]).issubset(results.keys())
+    # One update and one correlation lookup per refinement iteration
+    assert results["update_block"]["calls"] == 3
+    assert results["CorrBlock.lookup"]["calls"] == 3
+    assert results["CorrBlock.build"]["calls"] == 1
+    assert results[TOTAL_STAGE]["time_fraction"] == 1.0
+    for name in ["fnet", "cnet", "update_block"]:
+        assert 0 < results[name]["time"] < results[TOTAL_STAGE]["time"]
+        assert 0 < results[name]["flops"] < results[TOTAL_STAGE]["flops"]
+        assert results[name]["activations"] > 0
+    # The feature encoder processes the two images, so its output is larger than the context encoder's
+    assert results["fnet"]["peak_memory"] > results["cnet"]["peak_memory"] > 0
+    assert results[TOTAL_STAGE]["peak_memory"] >= results["fnet"]["peak_memory"]
+
+    # The wrappers and hooks are removed after the profiling
+    assert corr_module.CorrBlock.__call__ is corr_call
+    assert corr_module.get_corr_block is get_corr_block
+    assert len(model._forward_hooks) == 0
+
+
+def test_stage_profiler_selected_modules() -> None:
+    model = ptlflow.get_model("raft_small")
+    model.eval()
+    model.iters = 2
+    inputs = {"images": torch.rand(1, 2, 3, 64, 64)}
+
+    with StageProfiler(model, ["update_block.encoder"], corr_keyword=None) as profiler:
+        profiler.measure_time(lambda: model(inputs))
+    results = {r["stage"]: r for r in profiler.get_results()}
+    assert set(results.keys()) == set(["update_block.encoder", TOTAL_STAGE])
+    assert results["update_block.encoder"]["calls"] == 2
@@ -0,0 +1,56 @@
+# =============================================================================
+# Copyright 2021 Henrique Morimitsu
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import numpy as np
+import torch
+
+from ptlflow.data.flow_transforms import ToTensor
+from ptlflow.utils.utils import ShapeBuckets, get_image_resizer, images_to_float
+
+
+def test_shape_buckets() -> None:
+    buckets = ShapeBuckets(multiple=64, sizes=[(448, 1024), (384, 1280)])
+    assert buckets((436, 1024), stride=8) == (448, 1024)
+    assert buckets((375, 1242), stride=8) == (384, 1280)
+    assert buckets((540, 960), stride=8) == (576, 960)
+
+    buckets = ShapeBuckets(multiple=100)
+    assert buckets((375, 1242), stride=8) == (400, 1304)
+
+
+def test_get_image_resizer() -> None:
+    resizer1 = get_image_resizer((2, 3, 375, 1242), size=(384, 1280))
+    resizer2 = get_image_resizer((1, 2, 375, 1242), size=[384, 1280])
+    assert resizer1 is resizer2
+
+    x = torch.rand(1, 2, 3, 375, 1242)
+    y = resizer1.fill(x)
+    assert y.shape[-2:] == (384, 1280)
+    assert torch.equal(resizer1.unfill(y), x)
+
+
+def test_images_to_float() -> None:
+    images = np.random.randint(0, 256, (2, 32, 48, 3), dtype=np.uint8)
+    inputs = {"images": images, "flows": np.random.rand(1, 32, 48, 2)}
+    float_inputs = ToTensor()(dict(inputs))
+    uint8_inputs = ToTensor(uint8_keys=["images"])(dict(inputs))
+    assert uint8_inputs["images"].dtype == torch.uint8
+    assert uint8_inputs["images"].shape == float_inputs["images"].shape
+    assert uint8_inputs["flows"].dtype == float_inputs["flows"].dtype
+
+    converted = images_to_float(uint8_inputs["images"])
+    assert torch.allclose(converted, float_inputs["images"])
+    assert images_to_float(converted) is converted
@@ -23,6 +23,7 @@ import numpy as np
 
 import infer
 import ptlflow
+from ptlflow.utils.flow_utils import flow_read
 
 TEST_MODEL = "raft_small"
 
@@ -55,7 +56,112 @@ def test_infer(tmp_path: Path) -> None:
     shutil.rmtree(tmp_path)
 
 
+def test_frame_reader(tmp_path: Path) -> None:
+    for seq_name in ["seq_b", "seq_a"]:
+        (tmp_path / seq_name).mkdir()
+        for i in range(3):
+            img = np.full((8, 12, 3), i, np.uint8)
+            cv.imwrite(str(tmp_path / seq_name / f"{i:02d}.png"), img)
+
+    img_paths = infer._list_files(tmp_path)
+    assert img_paths == sorted([p for p in tmp_path.glob("**/*") if not p.is_dir()])
+
+    for prefetch in [0, 2]:
+        reader = infer.FrameReader(
+            None, img_paths, len(img_paths), prefetch, show_size=(6, 4)
+        )
+        frames = list(reader)
+        reader.close()
+        assert len(frames) == len(img_paths) - 1
+        for i, (img, img_dir_name, img_name, is_img_valid, show_img) in enumerate(
+            frames
+        ):
+            assert is_img_valid
+            assert img_dir_name == img_paths[i + 1].parent.name
+            assert img_name == img_paths[i].stem
+            assert img[0, 0, 0] == int(img_paths[i + 1].stem)
+            assert show_img.shape == (4, 6, 3)
+
+    # Stop before the end, as when ESC is pressed
+    reader = infer.FrameReader(None, img_paths, len(img_paths), prefetch=1)
+    next(iter(reader))
+    reader.close()
+    assert not reader.thread.is_alive()
+
+    shutil.rmtree(tmp_path)
+
+
+def test_infer_batch_size(tmp_path: Path) -> None:
+    input_dir = tmp_path / "inputs"
+    for seq_name in ["seq_a", "seq_b"]:
+        (input_dir / seq_name).mkdir(parents=True)
+        for i in range(5):
+            img = np.random.randint(0, 255, (64, 96, 3), np.uint8)
+            cv.imwrite(str(input_dir / seq_name / f"{i:02d}.png"), img)
+
+    model_ref = ptlflow.get_model_reference("fastflownet")
+    parser = ArgumentParser(parents=[infer._init_parser()])
+    parser.add_class_arguments(model_ref, "model")
+
+    model = None
+    outputs = {}
+    for batch_size in [1, 3]:
+        args = parser.parse_args(
+            [
+                "--input_path",
+                str(input_dir),
+                "--output_path",
+                str(tmp_path / f"bs{batch_size}"),
+                "--batch_size",
+                str(batch_size),
+            ]
+        )
+        if model is None:
+            model = ptlflow.get_model("fastflownet", None, args)
+        infer.infer(args, model)
+        flow_paths = sorted((tmp_path / f"bs{batch_size}" / "flows").glob("*/*.flo"))
+        outputs[batch_size] = {
+            p.relative_to(tmp_path / f"bs{batch_size}"): flow_read(p)
+            for p in flow_paths
+        }
+
+    # No pair is formed across the two sequences
+    assert len(outputs[1]) == 8
+    assert outputs[1].keys() == outputs[3].keys()
+    for k in outputs[1].keys():
+        assert np.allclose(outputs[1][k], outputs[3][k], atol=1e-3)
+
+    shutil.rmtree(tmp_path)
+
+
 def _create_images(tmp_path: Path) -> None:
     for i in range(2):
         img = np.random.randint(0, 255, (400, 400, 3), np.uint8)
         cv.imwrite(str(tmp_path / f"img{i+1}.png"), img)
+
+
+def test_infer_max_forward_pixels(tmp_path: Path) -> None:
+    _create_images(tmp_path)
+    input_paths = [str(tmp_path / "img1.png"), str(tmp_path / "img2.png")]
+
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    parser = ArgumentParser(parents=[infer._init_parser()])
+    parser.add_class_arguments(model_ref, "model")
+    args = parser.parse_args(["--input_path", *input_paths])
+
+    args.write_outputs = True
+    args.output_path = tmp_path
+    args.flow_format = "flo"
+    img_shape = cv.imread(input_paths[0]).shape
+    args.max_forward_pixels = img_shape[0] * img_shape[1] // 4
+
+    model = ptlflow.get_model(TEST_MODEL, None, args)
+    infer.infer(args, model)
+    # The input is downscaled for the forward, but the output has the original resolution
+    flow_paths = list(tmp_path.glob("flows/*/img1.flo"))
+    assert len(flow_paths) == 1
+    flow = flow_read(flow_paths[0])
+    assert flow.shape[:2] == img_shape[:2]
+
+    shutil.rmtree(tmp_path)
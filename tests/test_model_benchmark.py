@@ -17,9 +17,15 @@
 from pathlib import Path
 import shutil
 
+import cv2 as cv
 from jsonargparse import ArgumentParser
+import numpy as np
+import pandas as pd
 import ptlflow
+from ptlflow.utils.flow_utils import flow_read
+import compare_benchmarks
 import model_benchmark
+from ptlflow.utils.resolution_scaling import load_fit
 
 TEST_MODEL = "raft_small"
 
@@ -39,3 +45,175 @@ def test_benchmark(tmp_path: Path) -> None:
     model_benchmark.benchmark(args, None)
 
     shutil.rmtree(tmp_path)
+
+
+def test_benchmark_end_to_end(tmp_path: Path) -> None:
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    model_parser = ArgumentParser(parents=[model_benchmark._init_parser()])
+    model_parser.add_argument_group("model")
+    model_parser.add_class_arguments(model_ref, "model.init_args")
+    args = model_parser.parse_args([])
+    args.model.class_path = f"{model_ref.__module__}.{model_ref.__qualname__}"
+
+    frames_dir = tmp_path / "frames"
+    frames_dir.mkdir(parents=True)
+    for i in range(3):
+        cv.imwrite(
+            str(frames_dir / f"{i:04d}.png"),
+            np.random.randint(0, 255, (64, 96, 3), dtype=np.uint8),
+        )
+
+    args.num_samples = 1
+    args.input_size = [64, 96]
+    args.output_path = tmp_path / "outputs"
+    args.e2e_input_path = str(frames_dir)
+    args.e2e_write_outputs = True
+
+    model_benchmark.benchmark(args, None)
+
+    e2e_df = pd.read_csv(args.output_path / f"model_benchmark_e2e-{TEST_MODEL}.csv")
+    assert e2e_df["NumPairs"][0] == 2
+    assert len(list((args.output_path / "e2e_outputs").glob("*.flo"))) == 2
+
+    shutil.rmtree(tmp_path)
+
+
+def test_benchmark_end_to_end_mixed_sizes(tmp_path: Path) -> None:
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    model_parser = ArgumentParser(parents=[model_benchmark._init_parser()])
+    model_parser.add_argument_group("model")
+    model_parser.add_class_arguments(model_ref, "model.init_args")
+    args = model_parser.parse_args([])
+    args.model.class_path = f"{model_ref.__module__}.{model_ref.__qualname__}"
+
+    # Two scenes with the same frame names and different resolutions
+    frames_dir = tmp_path / "frames"
+    for scene_name, size in [("scene_a", (64, 96)), ("scene_b", (72, 80))]:
+        (frames_dir / scene_name).mkdir(parents=True)
+        for i in range(2):
+            cv.imwrite(
+                str(frames_dir / scene_name / f"{i:04d}.png"),
+                np.random.randint(0, 255, (*size, 3), dtype=np.uint8),
+            )
+
+    args.num_samples = 1
+    args.input_size = [64, 96]
+    args.batch_size = 2
+    args.output_path = tmp_path / "outputs"
+    args.e2e_input_path = str(frames_dir)
+    args.e2e_write_outputs = True
+
+    model_benchmark.benchmark(args, None)
+
+    e2e_dir = args.output_path / "e2e_outputs"
+    assert flow_read(e2e_dir / "scene_a" / "0000.flo").shape[:2] == (64, 96)
+    assert flow_read(e2e_dir / "scene_b" / "0000.flo").shape[:2] == (72, 80)
+
+    shutil.rmtree(tmp_path)
+
+
+def test_benchmark_breakdown(tmp_path: Path) -> None:
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    model_parser = ArgumentParser(parents=[model_benchmark._init_parser()])
+    model_parser.add_argument_group("model")
+    model_parser.add_class_arguments(model_ref, "model.init_args")
+    args = model_parser.parse_args([])
+    args.model.class_path = f"{model_ref.__module__}.{model_ref.__qualname__}"
+
+    args.num_samples = 1
+    args.input_size = [64, 96]
+    args.output_path = tmp_path
+    args.breakdown = True
+
+    model_benchmark.benchmark(args, None)
+
+    breakdown_df = pd.read_csv(tmp_path / f"model_benchmark_breakdown-{TEST_MODEL}.csv")
+    stages = breakdown_df["Stage"].tolist()
+    assert "update_block" in stages
+    assert "total" in stages
+    assert (tmp_path / f"benchmark_breakdown-{TEST_MODEL}.html").exists()
+
+    shutil.rmtree(tmp_path)
+
+
+def test_benchmark_history(tmp_path: Path) -> None:
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    model_parser = ArgumentParser(parents=[model_benchmark._init_parser()])
+    model_parser.add_argument_group("model")
+    model_parser.add_class_arguments(model_ref, "model.init_args")
+    args = model_parser.parse_args([])
+    args.model.class_path = f"{model_ref.__module__}.{model_ref.__qualname__}"
+
+    args.num_samples = 2
+    args.input_size = [64, 96]
+    args.output_path = tmp_path / "outputs"
+    args.history_dir = tmp_path / "history"
+
+    model_benchmark.benchmark(args, None)
+    model_benchmark.benchmark(args, None)
+
+    compare_parser = compare_benchmarks._init_parser()
+    compare_args = compare_parser.parse_args(
+        ["--history_dir", str(args.history_dir), "--output_dir", str(tmp_path)]
+    )
+    comparison_df = compare_benchmarks.compare(compare_args)
+    assert set(comparison_df["Metric"]) == {"time", "memory"}
+    assert (comparison_df["Model"] == TEST_MODEL).all()
+    assert len(list(tmp_path.glob("benchmark_comparison-*.csv"))) == 1
+
+    shutil.rmtree(tmp_path)
+
+
+def test_benchmark_resolution_sweep(tmp_path: Path) -> None:
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    model_parser = ArgumentParser(parents=[model_benchmark._init_parser()])
+    model_parser.add_argument_group("model")
+    model_parser.add_class_arguments(model_ref, "model.init_args")
+    args = model_parser.parse_args([])
+    args.model.class_path = f"{model_ref.__module__}.{model_ref.__qualname__}"
+
+    args.num_samples = 1
+    args.input_size = [128, 192]
+    args.output_path = tmp_path
+    args.sweep_resolutions = 3
+    args.sweep_min_scale = 0.5
+    args.memory_budget = 8.0
+
+    df = model_benchmark.benchmark(args, None)
+    assert len(df) == 3
+
+    fit = load_fit(tmp_path / f"model_benchmark_scaling-{TEST_MODEL}.json", TEST_MODEL)
+    assert fit is not None
+    assert len(fit["num_pixels"]) == 3
+    scaling_df = pd.read_csv(tmp_path / f"model_benchmark_scaling-{TEST_MODEL}.csv")
+    assert "MaxPixels" in scaling_df.columns
+
+    shutil.rmtree(tmp_path)
+
+
+def test_benchmark_cpu_rejects_fp16(tmp_path: Path) -> None:
+    model_ref = ptlflow.get_model_reference(TEST_MODEL)
+
+    model_parser = ArgumentParser(parents=[model_benchmark._init_parser()])
+    model_parser.add_argument_group("model")
+    model_parser.add_class_arguments(model_ref, "model.init_args")
+    args = model_parser.parse_args([])
+    args.model.class_path = f"{model_ref.__module__}.{model_ref.__qualname__}"
+
+    args.num_samples = 1
+    args.input_size = [64, 96]
+    args.output_path = tmp_path
+    args.device = "cpu"
+    args.datatypes = ["fp32", "fp16"]
+
+    df = model_benchmark.benchmark(args, None)
+    # fp16 is skipped on the CPU, instead of reporting fp32 results as fp16
+    assert not df["Time(ms)-fp32"].isna().any()
+    assert df["Time(ms)-fp16"].isna().all()
+
+    shutil.rmtree(tmp_path)
@@ -17,11 +17,19 @@
 from pathlib import Path
 import shutil
 
+import cv2 as cv
 from jsonargparse import ArgumentParser
+import pandas as pd
+import pytest
+import torch
+import torch.fx
 
 import ptlflow
 from ptlflow.data.flow_datamodule import FlowDataModule
 from ptlflow.utils.dummy_datasets import write_kitti, write_sintel
+from ptlflow.utils.flow_utils import flow_read
+from ptlflow.utils.model_cache import get_default_model_cache
+import summary_metrics
 import validate
 
 TEST_MODEL = "raft_small"
@@ -73,3 +81,239 @@ def test_validate(tmp_path: Path) -> None:
         assert (tmp_path / dname / "flows" / (dpath + ".png")).exists()
 
     shutil.rmtree(tmp_path)
+
+
+def test_validate_quantized(tmp_path: Path) -> None:
+    model = ptlflow.get_model("fastflownet")
+
+    data_parser = ArgumentParser()
+    data_parser.add_class_arguments(FlowDataModule, "data")
+    data_args = data_parser.parse_args([])
+    data_args.data.val_dataset = "sintel-clean"
+    data_args.data.mpi_sintel_root_dir = str(tmp_path / "MPI-Sintel")
+    data_args.data.kitti_2015_root_dir = str(tmp_path / "KITTI/2015")
+
+    data_parser = ArgumentParser(exit_on_error=False)
+    data_parser.add_argument("--data", type=FlowDataModule)
+    data_cfg = data_parser.parse_object({"data": data_args.data})
+    datamodule = data_parser.instantiate_classes(data_cfg).data
+
+    parser = ArgumentParser(parents=[validate._init_parser()])
+    args = parser.parse_args([])
+    args.output_path = str(tmp_path)
+    args.max_samples = 1
+    args.model_name = "fastflownet"
+    args.quantize = True
+    args.quantize_calib_dataset = "kitti-2015"
+    args.quantize_calib_samples = 2
+    args.fp16 = True
+
+    write_kitti(tmp_path)
+    write_sintel(tmp_path)
+
+    metrics_df = validate.validate(args, model, datamodule)
+    assert min(metrics_df.shape) > 0
+    # The original model and the arguments of the caller are not modified
+    assert not isinstance(model.pconv1_1, torch.fx.GraphModule)
+    assert args.fp16
+
+    # Calibrating on the evaluation data must be requested explicitly
+    args.quantize_calib_dataset = None
+    with pytest.raises(ValueError):
+        validate.validate(args, model, datamodule)
+
+    shutil.rmtree(tmp_path)
+
+
+def test_validate_sharded(tmp_path: Path) -> None:
+    model = ptlflow.get_model("fastflownet")
+
+    data_parser = ArgumentParser()
+    data_parser.add_class_arguments(FlowDataModule, "data")
+    data_args = data_parser.parse_args([])
+    data_args.data.val_dataset = "sintel-clean+kitti-2015"
+    data_args.data.mpi_sintel_root_dir = str(tmp_path / "MPI-Sintel")
+    data_args.data.kitti_2015_root_dir = str(tmp_path / "KITTI/2015")
+
+    data_parser = ArgumentParser(exit_on_error=False)
+    data_parser.add_argument("--data", type=FlowDataModule)
+    data_cfg = data_parser.parse_object({"data": data_args.data})
+    datamodule = data_parser.instantiate_classes(data_cfg).data
+
+    write_kitti(tmp_path)
+    write_sintel(tmp_path)
+    # Add more frames, so that there are more samples than shards
+    for seq_dir in (tmp_path / "MPI-Sintel" / "training").glob("*/sequence_1"):
+        # The image dirs have one more file than the flow and occlusion dirs
+        first_path = sorted(seq_dir.glob("frame_0001.*"))[0]
+        offset = 0 if (seq_dir / "frame_0002.png").exists() else 1
+        for i in range(3, 6):
+            shutil.copy(
+                first_path, seq_dir / f"frame_{(i - offset):04d}{first_path.suffix}"
+            )
+
+    parser = ArgumentParser(parents=[validate._init_parser()])
+    args = parser.parse_args([])
+    args.model_name = "fastflownet"
+    args.write_individual_metrics = True
+
+    args.output_path = str(tmp_path / "single")
+    single_df = validate.validate(args, model, datamodule)
+
+    args.output_path = str(tmp_path / "sharded")
+    args.num_shards = 2
+    sharded_df = validate.validate(args, model, datamodule)
+
+    assert single_df.equals(sharded_df)
+    for name in ["sintel-clean_epe_flall.csv", "kitti-2015_epe_flall.csv"]:
+        single_csv = (tmp_path / "single" / name).read_text()
+        assert single_csv == (tmp_path / "sharded" / name).read_text()
+    assert len(single_csv.splitlines()) > 1
+
+    shutil.rmtree(tmp_path)
+
+
+def test_validate_prediction_cache(tmp_path: Path) -> None:
+    model = ptlflow.get_model("fastflownet")
+
+    data_parser = ArgumentParser()
+    data_parser.add_class_arguments(FlowDataModule, "data")
+    data_args = data_parser.parse_args([])
+    data_args.data.val_dataset = "sintel-clean+kitti-2015"
+    data_args.data.mpi_sintel_root_dir = str(tmp_path / "MPI-Sintel")
+    data_args.data.kitti_2015_root_dir = str(tmp_path / "KITTI/2015")
+
+    data_parser = ArgumentParser(exit_on_error=False)
+    data_parser.add_argument("--data", type=FlowDataModule)
+    data_cfg = data_parser.parse_object({"data": data_args.data})
+    datamodule = data_parser.instantiate_classes(data_cfg).data
+
+    write_kitti(tmp_path)
+    write_sintel(tmp_path)
+
+    parser = ArgumentParser(parents=[validate._init_parser()])
+    args = parser.parse_args([])
+    args.model_name = "fastflownet"
+    args.output_path = str(tmp_path / "outputs")
+    args.prediction_cache_dir = str(tmp_path / "cache")
+    args.prediction_cache_dtype = "float32"
+    metrics_df = validate.validate(args, model, datamodule)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The model should not be called.")
+
+    # The second run only uses the stored predictions
+    model.validation_step = _fail
+    cached_metrics_df = validate.validate(args, model, datamodule)
+    assert metrics_df.equals(cached_metrics_df)
+
+    summary_parser = summary_metrics._init_parser()
+    summary_args = summary_parser.parse_args([])
+    summary_args.prediction_cache_dir = args.prediction_cache_dir
+    summary_args.output_dir = tmp_path / "summary"
+    summary_metrics.summarize(summary_args)
+    assert len(list((tmp_path / "summary").glob("*.csv"))) > 0
+
+    shutil.rmtree(tmp_path)
+
+
+def test_validate_bucketed_batches(tmp_path: Path) -> None:
+    model = ptlflow.get_model("fastflownet")
+
+    data_parser = ArgumentParser()
+    data_parser.add_class_arguments(FlowDataModule, "data")
+    data_args = data_parser.parse_args([])
+    data_args.data.val_dataset = "sintel-clean"
+    data_args.data.mpi_sintel_root_dir = str(tmp_path / "MPI-Sintel")
+    data_args.data.val_batch_size = 2
+    data_args.data.val_bucket_multiple = 96
+
+    data_parser = ArgumentParser(exit_on_error=False)
+    data_parser.add_argument("--data", type=FlowDataModule)
+    data_cfg = data_parser.parse_object({"data": data_args.data})
+    datamodule = data_parser.instantiate_classes(data_cfg).data
+
+    write_sintel(tmp_path)
+    seq_dir = tmp_path / "MPI-Sintel" / "training" / "clean" / "sequence_1"
+    for i in range(3, 5):
+        shutil.copy(seq_dir / "frame_0001.png", seq_dir / f"frame_{i:04d}.png")
+    for dir_name in ["flow", "occlusions"]:
+        for path in (tmp_path / "MPI-Sintel" / "training" / dir_name).glob(
+            "*/frame_0001.*"
+        ):
+            for i in range(2, 4):
+                shutil.copy(path, path.parent / f"frame_{i:04d}{path.suffix}")
+    orig_size = cv.imread(str(seq_dir / "frame_0001.png")).shape[:2]
+
+    parser = ArgumentParser(parents=[validate._init_parser()])
+    args = parser.parse_args([])
+    args.model_name = "fastflownet"
+    args.output_path = str(tmp_path / "outputs")
+    args.write_outputs = True
+    args.write_individual_metrics = True
+    args.flow_format = "flo"
+    args.prediction_cache_dir = str(tmp_path / "cache")
+    args.prediction_cache_dtype = "float32"
+    metrics_df = validate.validate(args, model, datamodule)
+
+    # Every sample of each batch is written, cropped back to its size before the bucket padding
+    flow_paths = sorted(
+        (tmp_path / "outputs" / "sintel-clean" / "flows").glob("**/*.flo")
+    )
+    assert len(flow_paths) == 3
+    for path in flow_paths:
+        assert flow_read(path).shape[:2] == orig_size
+    ind_df = pd.read_csv(tmp_path / "outputs" / "sintel-clean_epe_flall.csv")
+    assert len(ind_df) == 3
+    assert len(list((tmp_path / "cache").glob("*/sintel-clean/*.npz"))) == 3
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The model should not be called.")
+
+    model.validation_step = _fail
+    cached_metrics_df = validate.validate(args, model, datamodule)
+    assert metrics_df.equals(cached_metrics_df)
+
+
+def test_validate_model_cache(tmp_path: Path) -> None:
+    ckpt_path = tmp_path / "fastflownet.ckpt"
+    torch.save({"state_dict": ptlflow.get_model("fastflownet").state_dict()}, ckpt_path)
+
+    data_parser = ArgumentParser()
+    data_parser.add_class_arguments(FlowDataModule, "data")
+    data_args = data_parser.parse_args([])
+    data_args.data.val_dataset = "sintel-clean"
+    data_args.data.mpi_sintel_root_dir = str(tmp_path / "MPI-Sintel")
+
+    data_parser = ArgumentParser(exit_on_error=False)
+    data_parser.add_argument("--data", type=FlowDataModule)
+    data_cfg = data_parser.parse_object({"data": data_args.data})
+    datamodule = data_parser.instantiate_classes(data_cfg).data
+
+    write_sintel(tmp_path)
+
+    parser = ArgumentParser(parents=[validate._init_parser()])
+    args = parser.parse_args([])
+    args.select = ["fastflownet"]
+    args.ckpt_path = str(ckpt_path)
+    args.output_path = str(tmp_path / "outputs")
+    args.use_model_cache = True
+    args.model_cache_max_models = 1
+    args.fuse = True
+
+    model_cache = get_default_model_cache()
+    model_cache.clear()
+    validate.validate_list_of_models(args, datamodule)
+    assert len(list(tmp_path.glob("**/metrics_select.csv"))) == 1
+
+    # The cached instance is not prepared in place by the validation
+    cached_model = model_cache.get("fastflownet", str(ckpt_path), device="cpu")
+    assert model_cache.hits == 1
+    assert model_cache.max_models == 1
+    ref_state_dict = torch.load(ckpt_path)["state_dict"]
+    cached_state_dict = cached_model.state_dict()
+    assert cached_state_dict.keys() == ref_state_dict.keys()
+    for k, v in ref_state_dict.items():
+        assert cached_state_dict[k].dtype == v.dtype
+        assert torch.equal(cached_state_dict[k], v)
+    model_cache.clear()
@@ -45,6 +45,11 @@ def _init_parser():
         choices=["tensorboard", "wandb"],
     )
     parser.add_argument("--log_dir", type=str, default="ptlflow_logs")
+    parser.add_argument(
+        "--monitor_stalls",
+        action="store_true",
+        help="If set, log the time spent waiting for the data and on each part of the training step.",
+    )
     return parser
 
 
@@ -155,6 +160,13 @@ def cli_main():
         }
     )
 
+    if cfg.monitor_stalls:
+        callbacks.append(
+            {
+                "class_path": "ptlflow.utils.callbacks.stall_monitor.StallMonitorCallback",
+            }
+        )
+
     cfg.trainer.logger = trainer_logger
     cfg.trainer.callbacks = callbacks
     cfg.model.init_args.lr = cfg.lr
@@ -17,9 +17,12 @@
 # =============================================================================
 
 from copy import deepcopy
+import math
+import os
 from pathlib import Path
 import sys
-from typing import Any, Dict, List, Optional
+import traceback
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import cv2 as cv
 from jsonargparse import ArgumentParser, Namespace
@@ -27,7 +30,8 @@ from loguru import logger
 import numpy as np
 import pandas as pd
 import torch
-from torch.utils.data import DataLoader
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 import yaml
 
@@ -36,10 +40,21 @@ from ptlflow import get_model
 from ptlflow.data.flow_datamodule import FlowDataModule
 from ptlflow.models.base_model.base_model import BaseModel
 from ptlflow.utils import flow_utils
+from ptlflow.utils.compile_utils import compile_model
 from ptlflow.utils.io_adapter import IOAdapter
 from ptlflow.utils.lightning.ptlflow_cli import PTLFlowCLI
+from ptlflow.utils.flow_metrics import FlowMetrics
+from ptlflow.utils.model_cache import get_default_model_cache
+from ptlflow.utils.prediction_cache import PredictionCache
+from ptlflow.utils.precision import enable_autocast
+from ptlflow.utils.quantization import get_calibration_inputs, quantize_model
 from ptlflow.utils.registry import RegisteredModel
-from ptlflow.utils.utils import tensor_dict_to_numpy
+from ptlflow.utils.resolution_scaling import (
+    get_benchmark_datatype,
+    get_max_forward_pixels,
+    get_scale_factor,
+)
+from ptlflow.utils.utils import get_image_resizer, tensor_dict_to_numpy
 
 
 def _init_parser() -> ArgumentParser:
@@ -91,7 +106,7 @@ def _init_parser() -> ArgumentParser:
         "--flow_format",
         type=str,
         default="original",
-        choices=["flo", "png", "original"],
+        choices=["flc", "flo", "png", "original"],
         help=(
             "The format to use when saving the estimated optical flow. If 'original', then the format will be the same "
             + "one the dataset uses for the groundtruth."
@@ -112,6 +127,32 @@ def _init_parser() -> ArgumentParser:
         default=None,
         help=("Multiply the input image by this scale factor before forwarding."),
     )
+    parser.add_argument(
+        "--max_forward_pixels",
+        type=int,
+        default=None,
+        help=(
+            "If height * width * batch size of the input is larger than this value, then the images are downscaled "
+            "before the forward, keeping their aspect ratio, and the outputs are bilinearly upscaled to the original "
+            "resolution."
+        ),
+    )
+    parser.add_argument(
+        "--scaling_fits_path",
+        type=str,
+        default=None,
+        help=(
+            "Path to the resolution scaling fits created by model_benchmark.py --sweep_resolutions. If set together "
+            "with --memory_budget, --max_forward_pixels is chosen automatically as the largest input that is predicted "
+            "to fit into the budget. See ptlflow.utils.resolution_scaling."
+        ),
+    )
+    parser.add_argument(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="Memory budget in GB, used with --scaling_fits_path.",
+    )
     parser.add_argument(
         "--max_show_side",
         type=int,
@@ -137,6 +178,70 @@ def _init_parser() -> ArgumentParser:
     parser.add_argument(
         "--fp16", action="store_true", help="If set, use half floating point precision."
     )
+    parser.add_argument(
+        "--autocast",
+        type=str,
+        default=None,
+        choices=("fp16", "bf16"),
+        help=(
+            "If set, run the model with torch.autocast in this precision (bf16 also works on CPU). Unlike --fp16, the "
+            "weights are kept in fp32 and the model's fp32_submodules always run in fp32."
+        ),
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help=(
+            "If set, the model's quantize_submodules are quantized to INT8 with post-training static quantization. "
+            "The quantized model runs on the CPU, and --fp16 is ignored. Requires --quantize_calib_dataset. It uses "
+            "torch.ao.quantization, which is deprecated in recent PyTorch versions. See ptlflow.utils.quantization."
+        ),
+    )
+    parser.add_argument(
+        "--quantize_calib_dataset",
+        type=str,
+        default=None,
+        help=(
+            "Dataset used for calibrating the quantization, in the same format as --data.val_dataset "
+            "(e.g., sintel-clean). Required by --quantize. It should not overlap with the validation datasets, "
+            "otherwise the reported metrics are calibrated on the evaluation data."
+        ),
+    )
+    parser.add_argument(
+        "--quantize_calib_samples",
+        type=int,
+        default=200,
+        help="Number of samples used for calibrating the quantization.",
+    )
+    parser.add_argument(
+        "--quantize_backend",
+        type=str,
+        choices=("x86", "fbgemm", "qnnpack", "onednn"),
+        default="x86",
+        help="Quantized engine. Use qnnpack for ARM CPUs.",
+    )
+    parser.add_argument(
+        "--fuse",
+        action="store_true",
+        help=(
+            "If set, BatchNorm layers are folded into the convolutions and other layers that are only needed for "
+            "training are removed before running the model. See ptlflow.utils.fusion."
+        ),
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help=(
+            "If set, the model's compile_submodules are compiled with torch.compile. The first forward with each new input "
+            "size is slow, so it is recommended to combine this with --model.bucket_multiple or --model.bucket_sizes."
+        ),
+    )
+    parser.add_argument(
+        "--compile_cache_dir",
+        type=str,
+        default=None,
+        help="Directory where the compiled artifacts are cached across runs. See ptlflow.utils.compile_utils.",
+    )
     parser.add_argument(
         "--seq_val_mode",
         type=str,
@@ -164,6 +269,67 @@ def _init_parser() -> ArgumentParser:
         nargs="+",
         help=("Names of metrics to not be included in the saved results."),
     )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help=(
+            "If larger than one, each dataset is split into this number of shards, which are validated in parallel by "
+            "separate processes. The merged metrics and the individual metrics are the same as when using one process. "
+            "Cannot be combined with --show or --quantize."
+        ),
+    )
+    parser.add_argument(
+        "--shard_devices",
+        type=str,
+        nargs="+",
+        default=None,
+        help=(
+            "Devices used by the shards (e.g., cuda:0 cuda:1 cpu), assigned cyclically. If not set, the shards are "
+            "distributed over all the visible GPUs, or run on the CPU if no GPU is available. The CPU threads are split "
+            "among the CPU shards."
+        ),
+    )
+    parser.add_argument(
+        "--prediction_cache_dir",
+        type=str,
+        default=None,
+        help=(
+            "If set, the predictions are stored in this directory, keyed by the model, checkpoint, inference settings and "
+            "input image paths. Samples whose predictions are already stored are not forwarded through the model again, "
+            "so the metrics can be recomputed at I/O speed. Not used with warm start models. "
+            "See ptlflow.utils.prediction_cache."
+        ),
+    )
+    parser.add_argument(
+        "--prediction_cache_dtype",
+        type=str,
+        default="float16",
+        choices=("float16", "float32"),
+        help=(
+            "Type used to store the predictions in the prediction cache. The metrics recomputed from float16 predictions "
+            "may differ slightly from the ones of the original run."
+        ),
+    )
+    parser.add_argument(
+        "--use_model_cache",
+        action="store_true",
+        help=(
+            "To be combined with model all or select. If set, the model instances are kept in the process-level model "
+            "cache (see ptlflow.utils.model_cache), so that they can be reused by later validations in the same process. "
+            "The cached instances are kept on the CPU, and each validation runs on a copy, so that the cached instances "
+            "are never fused, converted or compiled."
+        ),
+    )
+    parser.add_argument(
+        "--model_cache_max_models",
+        type=int,
+        default=4,
+        help=(
+            "Maximum number of models kept in the model cache by --use_model_cache. The least recently used models are "
+            "evicted first."
+        ),
+    )
     return parser
 
 
@@ -237,16 +403,54 @@ def validate(
     --------
     ptlflow.models.base_model.base_model.BaseModel : The parent class of the available models.
     """
-    model.eval()
-    if torch.cuda.is_available():
-        model = model.cuda()
-        if args.fp16:
-            model = model.half()
+    # Some arguments are resolved below (e.g., --fp16 with --quantize), without changing the ones of the caller
+    args = deepcopy(args)
+    if args.quantize:
+        if args.quantize_calib_dataset is None:
+            raise ValueError(
+                "--quantize requires --quantize_calib_dataset. Choose a dataset that is not being evaluated, otherwise "
+                "the quantization ranges are calibrated on the evaluation data."
+            )
+        # The quantized kernels only run on the CPU
+        args.fp16 = False
 
+    model.eval()
     if args.scale_factor is not None and args.scale_factor != 1.0:
         model.metric_interpolate_pred_to_target_size = True
+    _set_max_forward_pixels(args)
+    prediction_cache = _get_prediction_cache(args, model, data_module)
+
+    if args.num_shards > 1:
+        if args.show or args.quantize:
+            raise ValueError(
+                "--num_shards cannot be combined with --show or --quantize."
+            )
+        if model.warm_start:
+            # The shards would break the chain of previous predictions of each sequence
+            raise ValueError("--num_shards cannot be used with warm start models.")
+        # Each shard prepares its own copy of the model on its device
+        shard_model = deepcopy(model).cpu()
+    else:
+        shard_model = None
+        if args.quantize:
+            # The quantized kernels only run on the CPU. The model may be shared by the model cache, so it is copied.
+            model = deepcopy(model).cpu()
+        model = _prepare_model(
+            args, model, cuda=torch.cuda.is_available() and not args.quantize
+        )
+
+    if model.warm_start and data_module.val_batch_size > 1:
+        # Each position of the batch must receive the frames of its sequences in order
+        data_module.val_sequence_lanes = True
 
     data_module.setup("validate")
+    if args.quantize:
+        calibration_dataloader = _get_calibration_dataloader(args, data_module)
+        quantize_model(
+            model,
+            get_calibration_inputs(calibration_dataloader, args.quantize_calib_samples),
+            backend=args.quantize_backend,
+        )
     dataloaders = data_module.val_dataloader()
     dataloaders = {
         data_module.val_dataloader_names[i]: dataloaders[i]
@@ -262,7 +466,16 @@ def validate(
 
     output_path = Path(args.output_path)
     for i, (dataset_name, dl) in enumerate(dataloaders.items()):
-        metrics_mean = validate_one_dataloader(args, model, dl, i, dataset_name)
+        if shard_model is not None:
+            metrics_mean = validate_one_dataloader_sharded(
+                args, shard_model, dl, i, dataset_name, prediction_cache
+            )
+        else:
+            metrics_mean = validate_one_dataloader(
+                args, model, dl, i, dataset_name, prediction_cache
+            )
+        if prediction_cache is not None:
+            prediction_cache.write_metrics(dataset_name, metrics_mean)
         metrics_df[[f"{dataset_name}-{k}" for k in metrics_mean.keys()]] = list(
             metrics_mean.values()
         )
@@ -320,7 +533,14 @@ def validate_list_of_models(args: Namespace, data_module: FlowDataModule) -> Non
                 local_args.ckpt_path = cname
                 local_args.output_path = str(output_path)
 
-                model = get_model(mname, cname)
+                if args.use_model_cache:
+                    model_cache = get_default_model_cache()
+                    model_cache.max_models = args.model_cache_max_models
+                    # validate() prepares the model in place (device, dtype, fusion, compilation), so it receives a copy
+                    # and the cached instance stays unmodified on the CPU
+                    model = deepcopy(model_cache.get(mname, cname, device="cpu"))
+                else:
+                    model = get_model(mname, cname)
                 instance_metrics_df = validate(local_args, model, data_module)
                 metrics_df = pd.concat([metrics_df, instance_metrics_df])
                 output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -348,13 +568,13 @@ def validate_list_of_models(args: Namespace, data_module: FlowDataModule) -> Non
                 break
 
 
-@torch.no_grad()
 def validate_one_dataloader(
     args: Namespace,
     model: BaseModel,
     dataloader: DataLoader,
     dataloader_idx: int,
     dataloader_name: str,
+    prediction_cache: Optional[PredictionCache] = None,
 ) -> Dict[str, float]:
     """Perform validation for all examples of one dataloader.
 
@@ -370,49 +590,206 @@ def validate_one_dataloader(
         The index of this dataloader.
     dataloader_name : str
         A string to identify this dataloader.
+    prediction_cache : Optional[PredictionCache], optional
+        If provided, the predictions are read from this cache when available, and the new ones are written to it.
 
     Returns
     -------
     Dict[str, float]
         The average metric values for this dataloader.
     """
-    metrics_sum = {}
+    batch_indices = range(len(dataloader))
+    if args.max_samples is not None:
+        batch_indices = batch_indices[: args.max_samples]
+    results = _validate_batches(
+        args,
+        model,
+        dataloader,
+        batch_indices,
+        dataloader_idx,
+        dataloader_name,
+        cuda=torch.cuda.is_available() and not args.quantize,
+        prediction_cache=prediction_cache,
+    )
+    return _merge_results(args, results, dataloader_name, len(dataloader.dataset))
 
-    metrics_individual = None
-    if args.write_individual_metrics:
-        metrics_individual = {
-            "filename": [],
-            "epe": [],
-            "flall": [],
-            "wauc": [],
-            "px1": [],
-        }
 
-    with tqdm(dataloader) as tdl:
-        for i, inputs in enumerate(tdl):
+def validate_one_dataloader_sharded(
+    args: Namespace,
+    model: BaseModel,
+    dataloader: DataLoader,
+    dataloader_idx: int,
+    dataloader_name: str,
+    prediction_cache: Optional[PredictionCache] = None,
+) -> Dict[str, float]:
+    """Perform validation for all examples of one dataloader, split into args.num_shards parallel processes.
+
+    The batches of the dataloader are distributed among the shards in a round-robin fashion. Each shard returns the
+    metrics of each of its batches, which are then merged in the original order of the batches. Therefore, the results
+    are the same as the ones from validate_one_dataloader().
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments to configure the model and the validation.
+    model : BaseModel
+        The model to be used for validation. It is not modified: each shard moves a copy of it to its device.
+    dataloader : DataLoader
+        The dataloader for the validation. Its batch_sampler is used to split the batches among the shards.
+    dataloader_idx : index
+        The index of this dataloader.
+    dataloader_name : str
+        A string to identify this dataloader.
+    prediction_cache : Optional[PredictionCache], optional
+        If provided, the predictions are read from this cache when available, and the new ones are written to it.
+
+    Returns
+    -------
+    Dict[str, float]
+        The average metric values for this dataloader.
+    """
+    batches = list(dataloader.batch_sampler)
+    if args.max_samples is not None:
+        batches = batches[: args.max_samples]
+    devices = _get_shard_devices(args)
+    num_cpu_shards = len([d for d in devices if not d.startswith("cuda")])
+    num_threads = max(1, (os.cpu_count() or 1) // max(1, num_cpu_shards))
+
+    # CUDA cannot be used in forked processes
+    context = mp.get_context("spawn")
+    queue = context.Queue()
+    processes = []
+    for shard_idx, device in enumerate(devices):
+        shard_batches = [
+            (j, batches[j]) for j in range(shard_idx, len(batches), len(devices))
+        ]
+        process = context.Process(
+            target=_validate_shard,
+            args=(
+                shard_idx,
+                args,
+                model,
+                dataloader.dataset,
+                dataloader.collate_fn,
+                dataloader.num_workers,
+                shard_batches,
+                dataloader_idx,
+                dataloader_name,
+                device,
+                num_threads,
+                queue,
+                prediction_cache,
+            ),
+        )
+        process.start()
+        processes.append(process)
+
+    results = []
+    errors = []
+    for _ in processes:
+        shard_idx, shard_results, error = queue.get()
+        if error is not None:
+            errors.append(f"Shard {shard_idx} ({devices[shard_idx]}): {error}")
+        else:
+            results.extend(shard_results)
+    for process in processes:
+        process.join()
+    if len(errors) > 0:
+        raise RuntimeError("\n".join(errors))
+
+    results.sort(key=lambda r: r["batch_idx"])
+    return _merge_results(args, results, dataloader_name, len(dataloader.dataset))
+
+
+def _prepare_model(args: Namespace, model: BaseModel, cuda: bool) -> BaseModel:
+    if cuda:
+        model = model.cuda()
+    if args.fuse:
+        model.fuse_for_inference()
+    if cuda and args.fp16:
+        model = model.half()
+    model = enable_autocast(model, args.autocast)
+    if args.compile:
+        compile_model(model, cache_dir=args.compile_cache_dir)
+    return model
+
+
+@torch.no_grad()
+def _validate_batches(
+    args: Namespace,
+    model: BaseModel,
+    dataloader: DataLoader,
+    batch_indices: Sequence[int],
+    dataloader_idx: int,
+    dataloader_name: str,
+    cuda: bool,
+    tqdm_position: Optional[int] = None,
+    prediction_cache: Optional[PredictionCache] = None,
+) -> List[Dict[str, Any]]:
+    results = []
+    metrics_sum = {}
+    cache_metrics = None
+    sample_metrics = None
+    tqdm_desc = None if tqdm_position is None else f"Shard {tqdm_position}"
+    with tqdm(
+        zip(batch_indices, dataloader),
+        total=len(batch_indices),
+        desc=tqdm_desc,
+        position=tqdm_position,
+    ) as tdl:
+        for n, (i, inputs) in enumerate(tdl):
             if args.scale_factor is not None:
                 scale_factor = args.scale_factor
+            elif args.max_forward_side is not None:
+                scale_factor = float(args.max_forward_side) / max(
+                    inputs["images"].shape[-2:]
+                )
             else:
-                scale_factor = (
-                    None
-                    if args.max_forward_side is None
-                    else float(args.max_forward_side) / max(inputs["images"].shape[-2:])
+                scale_factor = get_scale_factor(
+                    args.max_forward_pixels,
+                    inputs["images"].shape[-2:],
+                    inputs["images"].shape[0],
                 )
 
             io_adapter = IOAdapter(
                 output_stride=model.output_stride,
                 input_size=inputs["images"].shape[-2:],
                 target_scale_factor=scale_factor,
-                cuda=torch.cuda.is_available(),
+                cuda=cuda,
                 fp16=args.fp16,
             )
             inputs = io_adapter.prepare_inputs(inputs=inputs, image_only=True)
+            batch_size = inputs["images"].shape[0]
+            orig_sizes = _get_orig_sizes(inputs["meta"], batch_size)
 
-            outputs = model.validation_step(inputs, i, dataloader_idx)
+            cached_preds = None
+            if prediction_cache is not None:
+                cached_preds = _get_cached_preds(
+                    prediction_cache, dataloader_name, inputs, orig_sizes
+                )
+            if cached_preds is None:
+                outputs = model.validation_step(inputs, i, dataloader_idx)
+            else:
+                # Compute the metrics in the same way as model.validation_step()
+                if cache_metrics is None:
+                    cache_metrics = FlowMetrics(
+                        prefix="val/",
+                        interpolate_pred_to_target_size=model.metric_interpolate_pred_to_target_size,
+                    ).to(device=inputs["flows"].device)
+                outputs = {
+                    "preds": cached_preds,
+                    "metrics": cache_metrics(cached_preds, inputs),
+                }
 
             inputs = io_adapter.unscale(inputs, image_only=True)
             preds = outputs["preds"]
-            preds = io_adapter.unscale(preds)
+            if cached_preds is None:
+                # The cached predictions are stored after the unscaling
+                preds = io_adapter.unscale(preds)
+                if prediction_cache is not None:
+                    _put_cached_preds(
+                        prediction_cache, dataloader_name, inputs, preds, orig_sizes
+                    )
             for k, v in inputs.items():
                 if isinstance(v, torch.Tensor) and args.fp16:
                     inputs[k] = v.float()
@@ -420,6 +797,20 @@ def validate_one_dataloader(
                 if isinstance(v, torch.Tensor) and args.fp16:
                     preds[k] = v.float()
 
+            metrics = {k: v.item() for k, v in outputs["metrics"].items()}
+            if args.write_individual_metrics and batch_size > 1:
+                if sample_metrics is None:
+                    sample_metrics = FlowMetrics(
+                        prefix="val/",
+                        interpolate_pred_to_target_size=model.metric_interpolate_pred_to_target_size,
+                    ).to(device=inputs["flows"].device)
+                samples_metrics = [
+                    {k: v.item() for k, v in sample_metrics(s_preds, s_inputs).items()}
+                    for s_inputs, s_preds in _split_batch(inputs, preds, orig_sizes)
+                ]
+            else:
+                samples_metrics = [metrics]
+
             if inputs["flows"].shape[1] > 1 and args.seq_val_mode != "all":
                 if args.seq_val_mode == "first":
                     k = 0
@@ -437,51 +828,314 @@ def validate_one_dataloader(
                     elif isinstance(val, torch.Tensor) and len(val.shape) == 5:
                         inputs[key] = val[:, k : k + 1]
 
-            metrics = outputs["metrics"]
-            for k in metrics.keys():
-                if metrics_sum.get(k) is None:
-                    metrics_sum[k] = 0.0
-                metrics_sum[k] += metrics[k].item()
+            for k, v in metrics.items():
+                metrics_sum[k] = metrics_sum.get(k, 0.0) + v
             progress_bar_values = {
-                "epe": metrics_sum["val/epe"] / (i + 1),
-                "flall": metrics_sum["val/flall"] / (i + 1),
-                "wauc": metrics_sum["val/wauc"] / (i + 1),
-                "px1": 100 * (((i + 1) - metrics_sum["val/px1"]) / (i + 1)),
+                "epe": metrics_sum["val/epe"] / (n + 1),
+                "flall": metrics_sum["val/flall"] / (n + 1),
+                "wauc": metrics_sum["val/wauc"] / (n + 1),
+                "px1": 100 * (((n + 1) - metrics_sum["val/px1"]) / (n + 1)),
             }
             tdl.set_postfix(**progress_bar_values)
 
-            filename = ""
-            dataloader_suffix = ""
-            if "sintel" in inputs["meta"]["dataset_name"][0].lower():
-                filename = f'{Path(inputs["meta"]["image_paths"][0][0]).parent.name}/'
-            elif "spring" in inputs["meta"]["dataset_name"][0].lower():
-                filename = (
-                    f'{Path(inputs["meta"]["image_paths"][0][0]).parent.parent.name}/'
+            samples = []
+            for b, (sample_inputs, sample_preds) in enumerate(
+                _split_batch(inputs, preds, orig_sizes)
+            ):
+                filename, dataloader_suffix = _get_sample_filename(
+                    sample_inputs["meta"]
                 )
-            elif "kubric" in inputs["meta"]["dataset_name"][0].lower():
-                filename = f'{Path(inputs["meta"]["image_paths"][0][0]).parent.name}/'
-                dataloader_suffix = (
-                    f'_{Path(inputs["meta"]["image_paths"][0][0]).parent.parent.name}'
+                samples.append({"filename": filename, "metrics": samples_metrics[b]})
+                generate_outputs(
+                    args,
+                    sample_inputs,
+                    sample_preds,
+                    dataloader_name,
+                    i * batch_size + b,
+                    sample_inputs.get("meta"),
                 )
-            filename += Path(inputs["meta"]["image_paths"][0][0]).stem
 
-            if metrics_individual is not None:
-                metrics_individual["filename"].append(filename)
-                metrics_individual["epe"].append(metrics["val/epe"].item())
-                metrics_individual["flall"].append(metrics["val/flall"].item())
-                metrics_individual["wauc"].append(metrics["val/wauc"].item())
-                metrics_individual["px1"].append(metrics["val/px1"].item())
+            results.append(
+                {
+                    "batch_idx": i,
+                    "batch_size": batch_size,
+                    "metrics": metrics,
+                    "samples": samples,
+                    "dataloader_suffix": dataloader_suffix,
+                }
+            )
+    return results
+
+
+def _get_orig_sizes(
+    meta: Dict[str, Any], batch_size: int
+) -> List[Optional[Tuple[int, int]]]:
+    # The samples padded by BucketPadCollate store their size before padding
+    if "orig_size" not in meta:
+        return [None] * batch_size
+    heights, widths = meta["orig_size"]
+    return [(int(heights[b]), int(widths[b])) for b in range(batch_size)]
+
+
+def _crop_to_orig_size(
+    x: torch.Tensor, canvas_size: Sequence[int], orig_size: Optional[Tuple[int, int]]
+) -> torch.Tensor:
+    if orig_size is None or tuple(x.shape[-2:]) != tuple(canvas_size):
+        return x
+    return get_image_resizer(orig_size, size=canvas_size, resize_mode="pad").unfill(x)
+
+
+def _select_meta_sample(value: Any, b: int) -> Any:
+    # Select sample b from the collated metadata, keeping the same structure of a batch with a single sample
+    if isinstance(value, dict):
+        return {k: _select_meta_sample(v, b) for k, v in value.items()}
+    if isinstance(value, torch.Tensor):
+        return value[b : b + 1] if value.dim() > 0 else value
+    if isinstance(value, (list, tuple)):
+        if len(value) > 0 and isinstance(value[0], (list, tuple, torch.Tensor)):
+            return [_select_meta_sample(v, b) for v in value]
+        return [value[b]]
+    return value
+
+
+def _split_batch(
+    inputs: Dict[str, Any],
+    preds: Dict[str, Any],
+    orig_sizes: List[Optional[Tuple[int, int]]],
+) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Split the inputs and predictions into one batch per sample, cropped to the original size of each sample."""
+    canvas_size = inputs["flows"].shape[-2:]
+    samples = []
+    for b, orig_size in enumerate(orig_sizes):
+        sample_inputs, sample_preds = {}, {}
+        for src, dst in [(inputs, sample_inputs), (preds, sample_preds)]:
+            for k, v in src.items():
+                if k == "meta":
+                    dst[k] = _select_meta_sample(v, b)
+                elif isinstance(v, torch.Tensor) and v.dim() > 0:
+                    dst[k] = _crop_to_orig_size(v[b : b + 1], canvas_size, orig_size)
+                else:
+                    dst[k] = v
+        samples.append((sample_inputs, sample_preds))
+    return samples
 
-            generate_outputs(
-                args, inputs, preds, dataloader_name, i, inputs.get("meta")
+
+def _get_cached_preds(
+    prediction_cache: PredictionCache,
+    dataloader_name: str,
+    inputs: Dict[str, Any],
+    orig_sizes: List[Optional[Tuple[int, int]]],
+) -> Optional[Dict[str, torch.Tensor]]:
+    canvas_size = inputs["flows"].shape[-2:]
+    samples = []
+    for b, orig_size in enumerate(orig_sizes):
+        image_paths = [paths[b] for paths in inputs["meta"]["image_paths"]]
+        preds = prediction_cache.get(dataloader_name, image_paths)
+        if preds is None:
+            return None
+        if orig_size is not None:
+            # The predictions are stored without the bucket padding, whose area is never valid
+            padder = get_image_resizer(
+                orig_size, size=canvas_size, resize_mode="pad", pad_mode="constant"
             )
+            preds = {k: padder.fill(v) for k, v in preds.items()}
+        samples.append(preds)
+    return {
+        k: torch.stack([s[k] for s in samples]).to(device=inputs["flows"].device)
+        for k in samples[0].keys()
+    }
+
+
+def _put_cached_preds(
+    prediction_cache: PredictionCache,
+    dataloader_name: str,
+    inputs: Dict[str, Any],
+    preds: Dict[str, Any],
+    orig_sizes: List[Optional[Tuple[int, int]]],
+) -> None:
+    for sample_inputs, sample_preds in _split_batch(inputs, preds, orig_sizes):
+        prediction_cache.put(
+            dataloader_name,
+            [paths[0] for paths in sample_inputs["meta"]["image_paths"]],
+            {
+                k: v[0]
+                for k, v in sample_preds.items()
+                if isinstance(v, torch.Tensor) and k != "meta"
+            },
+        )
 
-            if args.max_samples is not None and i >= (args.max_samples - 1):
-                break
+
+def _get_sample_filename(meta: Dict[str, Any]) -> Tuple[str, str]:
+    image_path = Path(meta["image_paths"][0][0])
+    dataset_name = meta["dataset_name"][0].lower()
+    filename = ""
+    dataloader_suffix = ""
+    if "sintel" in dataset_name:
+        filename = f"{image_path.parent.name}/"
+    elif "spring" in dataset_name:
+        filename = f"{image_path.parent.parent.name}/"
+    elif "kubric" in dataset_name:
+        filename = f"{image_path.parent.name}/"
+        dataloader_suffix = f"_{image_path.parent.parent.name}"
+    filename += image_path.stem
+    return filename, dataloader_suffix
+
+
+def _validate_shard(
+    shard_idx: int,
+    args: Namespace,
+    model: BaseModel,
+    dataset: Dataset,
+    collate_fn: Any,
+    num_workers: int,
+    batches: List[Tuple[int, List[int]]],
+    dataloader_idx: int,
+    dataloader_name: str,
+    device: str,
+    num_threads: int,
+    queue: mp.Queue,
+    prediction_cache: Optional[PredictionCache],
+) -> None:
+    try:
+        cuda = device.startswith("cuda")
+        if cuda:
+            torch.cuda.set_device(device)
+        else:
+            torch.set_num_threads(num_threads)
+        model = _prepare_model(args, model, cuda=cuda)
+        dataloader = DataLoader(
+            dataset,
+            batch_sampler=[b for _, b in batches],
+            collate_fn=collate_fn,
+            num_workers=num_workers,
+        )
+        results = _validate_batches(
+            args,
+            model,
+            dataloader,
+            [i for i, _ in batches],
+            dataloader_idx,
+            dataloader_name,
+            cuda=cuda,
+            tqdm_position=shard_idx,
+            prediction_cache=prediction_cache,
+        )
+        queue.put((shard_idx, results, None))
+    except Exception:  # noqa: B902
+        queue.put((shard_idx, None, traceback.format_exc()))
+
+
+def _get_prediction_cache(
+    args: Namespace, model: BaseModel, data_module: FlowDataModule
+) -> Optional[PredictionCache]:
+    if args.prediction_cache_dir is None:
+        return None
+    if model.warm_start:
+        # The next predictions depend on the previous ones, which are not stored
+        logger.warning("The prediction cache is not used with warm start models.")
+        return None
+
+    settings = {
+        "hparams": dict(model.hparams),
+        "metric_interpolate_pred_to_target_size": model.metric_interpolate_pred_to_target_size,
+        "val_bucket_multiple": data_module.val_bucket_multiple,
+        "val_bucket_sizes": data_module.val_bucket_sizes,
+    }
+    for name in [
+        "max_forward_side",
+        "max_forward_pixels",
+        "scale_factor",
+        "fp16",
+        "autocast",
+        "quantize",
+        "quantize_calib_dataset",
+        "quantize_calib_samples",
+        "quantize_backend",
+        "fuse",
+    ]:
+        settings[name] = getattr(args, name)
+    return PredictionCache(
+        args.prediction_cache_dir,
+        args.model_name,
+        args.ckpt_path,
+        settings,
+        dtype=args.prediction_cache_dtype,
+    )
+
+
+def _set_max_forward_pixels(args: Namespace) -> None:
+    if (
+        args.max_forward_pixels is not None
+        or args.scaling_fits_path is None
+        or args.memory_budget is None
+    ):
+        return
+
+    cuda = torch.cuda.is_available() and not args.quantize
+    datatype = get_benchmark_datatype(args.fp16, args.autocast, args.quantize, cuda)
+    max_pixels = get_max_forward_pixels(
+        args.scaling_fits_path,
+        args.model_name,
+        args.memory_budget,
+        device="cuda" if cuda else "cpu",
+        datatype=datatype,
+    )
+    if max_pixels is None:
+        logger.warning(
+            "{} does not have a fit for the model {} with datatype {}, the inputs will not be downscaled.",
+            args.scaling_fits_path,
+            args.model_name,
+            datatype,
+        )
+    elif max_pixels <= 0:
+        logger.warning(
+            "The model {} is predicted to exceed {} GB with any input size, the inputs will not be downscaled.",
+            args.model_name,
+            args.memory_budget,
+        )
+    elif math.isfinite(max_pixels):
+        args.max_forward_pixels = int(max_pixels)
+        logger.info(
+            "Predicted that inputs up to {} pixels fit into {} GB, larger inputs will be downscaled.",
+            args.max_forward_pixels,
+            args.memory_budget,
+        )
+
+
+def _get_shard_devices(args: Namespace) -> List[str]:
+    devices = args.shard_devices
+    if devices is None:
+        if torch.cuda.is_available():
+            devices = [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+        else:
+            devices = ["cpu"]
+    return [devices[i % len(devices)] for i in range(args.num_shards)]
+
+
+def _merge_results(
+    args: Namespace,
+    results: List[Dict[str, Any]],
+    dataloader_name: str,
+    num_samples: int,
+) -> Dict[str, float]:
+    # The values are summed in the order of the batches, so the result does not depend on how they were sharded.
+    # The batch metrics are weighted by the batch sizes, since the batches may have different sizes (e.g., with
+    # sequence lanes).
+    metrics_sum = {}
+    for r in results:
+        for k, v in r["metrics"].items():
+            metrics_sum[k] = metrics_sum.get(k, 0.0) + v * r["batch_size"]
 
     if args.write_individual_metrics:
+        samples = [s for r in results for s in r["samples"]]
+        metrics_individual = {
+            "filename": [s["filename"] for s in samples],
+        }
+        for k in ["epe", "flall", "wauc", "px1"]:
+            metrics_individual[k] = [s["metrics"][f"val/{k}"] for s in samples]
         ind_df = pd.DataFrame(metrics_individual)
-        args.output_path.mkdir(parents=True, exist_ok=True)
+        Path(args.output_path).mkdir(parents=True, exist_ok=True)
+        dataloader_suffix = results[-1]["dataloader_suffix"] if len(results) > 0 else ""
         csv_path = (
             Path(args.output_path)
             / f"{dataloader_name}{dataloader_suffix}_epe_flall.csv"
@@ -501,10 +1155,44 @@ def validate_one_dataloader(
                     is_exclude = True
                     break
         if not is_exclude:
-            metrics_mean[k] = v / len(dataloader)
+            metrics_mean[k] = v / num_samples
     return metrics_mean
 
 
+def _get_calibration_dataloader(
+    args: Namespace, data_module: FlowDataModule
+) -> DataLoader:
+    overlap = _get_dataset_keys(args.quantize_calib_dataset) & _get_dataset_keys(
+        data_module.val_dataset
+    )
+    if len(overlap) > 0:
+        logger.warning(
+            "The quantization calibration dataset {} may overlap with the validation datasets {}, so the metrics may be "
+            "optimistic.",
+            args.quantize_calib_dataset,
+            data_module.val_dataset,
+        )
+    calibration_module = deepcopy(data_module)
+    calibration_module.val_dataset = args.quantize_calib_dataset
+    calibration_module.setup("validate")
+    return calibration_module.val_dataloader()[0]
+
+
+def _get_dataset_keys(dataset_selection: Optional[str]) -> set:
+    # Only the base name of each dataset is kept, because its passes and splits (e.g., sintel-clean and
+    # sintel-final-trainval) may share the same scenes and flows
+    if dataset_selection is None:
+        return set()
+    keys = set()
+    for name in dataset_selection.split("+"):
+        tokens = name.split("-")
+        if tokens[0] == "kitti" and len(tokens) > 1:
+            keys.add("-".join(tokens[:2]))
+        else:
+            keys.add(tokens[0])
+    return keys
+
+
 def _get_model_names(args: Namespace) -> List[str]:
     available_model_names = ptlflow.get_model_names()
     if args.all:
@@ -645,6 +1333,8 @@ if __name__ == "__main__":
             model_id += f"_{Path(cfg.ckpt_path).stem}"
         if cfg.max_forward_side is not None:
             model_id += f"_maxside{cfg.max_forward_side}"
+        if cfg.max_forward_pixels is not None:
+            model_id += f"_maxpixels{cfg.max_forward_pixels}"
         if cfg.scale_factor is not None:
             model_id += f"_scale{cfg.scale_factor}"
         cfg.output_path = str(Path(cfg.output_path) / model_id)